@@ -7,6 +7,7 @@ import os
 import parser
 from import_data import import_data
 from visualize import visualize
+from full_model_highs import full_model_highs
 
 def second_model(data_dict):
     """
@@ -33,78 +34,84 @@ def second_model(data_dict):
     ##############  Variables  ##############
 
 
-    # Two distance variables; size: n x n matrices; d_x[i][j]= distance between facilities i and j in x-direction, d_y accordingly
-    d_x = model.addVars(n, n, vtype=GRB.CONTINUOUS, name="d_x")
-    d_y = model.addVars(n, n, vtype=GRB.CONTINUOUS, name="d_y")
+    # Pairs i<j in the order of np.triu_indices and all pairs i != j
+    I, J = np.triu_indices(n, k=1)
+    P, Q = np.nonzero(~np.eye(n, dtype=bool))
+
+    # Only the pairs i<j with positive transport cost contribute to the objective, so only for them distance variables are needed (sparse pair index)
+    c_pairs = np.asarray(c, dtype=float)[I, J]
+    I_flow, J_flow, c_flow = I[c_pairs > 0], J[c_pairs > 0], c_pairs[c_pairs > 0]
+
+    # Two distance variables; size: number of pairs with flow; d_x[k]= distance between facilities I_flow[k] and J_flow[k] in x-direction, d_y accordingly
+    d_x = model.addMVar(len(I_flow), vtype=GRB.CONTINUOUS, name="d_x")
+    d_y = model.addMVar(len(I_flow), vtype=GRB.CONTINUOUS, name="d_y")
     
     #Two variables; size: n x 1; x-, y-coordinates of the departments
-    x = model.addVars(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="x")
-    y = model.addVars(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="y")
+    x = model.addMVar(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="x")
+    y = model.addMVar(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="y")
 
     #Alphas and Betas for relative arrangement
-    alpha = model.addVars(n, n, vtype=GRB.BINARY, name="alpha")  #matrix/array of the alphas (relative locations); size: n x n; alpha[i][j]= 1 if department i is on the left of j, 0 else
-    beta = model.addVars(n, n, vtype=GRB.BINARY, name="beta")  #matrix/array of the betas (relative locations); size: n x n; beta[i][j]= 1 if department i is on the below of j. 0 else
+    alpha = model.addMVar((n, n), vtype=GRB.BINARY, name="alpha")  #matrix/array of the alphas (relative locations); size: n x n; alpha[i][j]= 1 if department i is on the left of j, 0 else
+    beta = model.addMVar((n, n), vtype=GRB.BINARY, name="beta")  #matrix/array of the betas (relative locations); size: n x n; beta[i][j]= 1 if department i is on the below of j. 0 else
 
     # Indicator variable for rotation of departments, r = 1: not rotated, r = 0: rotated by 90°
     # r_F: \in {0,1}, 1 if no rotation of facility, 0 if facility is rotated
     # w_F_hat, h_F_hat: number, new width and height of facility
-    r = model.addVars(n, vtype=GRB.BINARY, name="r")
-    r_F = model.addVar(vtype=GRB.BINARY, name="r_F")
-    w_F_hat = model.addVar(vtype=GRB.CONTINUOUS, name ="w_F_hat")
-    h_F_hat = model.addVar(vtype=GRB.CONTINUOUS, name ="h_F_hat")
+    r = model.addMVar(n, vtype=GRB.BINARY, name="r")
+    r_F = model.addMVar(1, vtype=GRB.BINARY, name="r_F")
+    w_F_hat = model.addMVar(1, vtype=GRB.CONTINUOUS, name ="w_F_hat")
+    h_F_hat = model.addMVar(1, vtype=GRB.CONTINUOUS, name ="h_F_hat")
+
+    # Width and height of the departments depending on their rotation
+    w_hat = r*w + (1-r)*h
+    h_hat = (1-r)*w + r*h
     
     ##############  Constraints  ##############
     
 
     #Constraints for the linearization of the objective function
-    constr0 = model.addConstrs(d_x[i,j] >= x[i] - x[j] for i in range(n) for j in range(n) if i < j)
-    constr1 = model.addConstrs(d_x[i,j] >= x[j] - x[i] for i in range(n) for j in range(n) if i < j)
-    constr2 = model.addConstrs(d_y[i,j] >= y[i] - y[j] for i in range(n) for j in range(n) if i < j)
-    constr3 = model.addConstrs(d_y[i,j] >= y[j] - y[i] for i in range(n) for j in range(n) if i < j)
+    constr0 = model.addConstr(d_x >= x[I_flow] - x[J_flow])
+    constr1 = model.addConstr(d_x >= x[J_flow] - x[I_flow])
+    constr2 = model.addConstr(d_y >= y[I_flow] - y[J_flow])
+    constr3 = model.addConstr(d_y >= y[J_flow] - y[I_flow])
 
     #Constraints to make sure the departments are inside the facility
-    constr4 = model.addConstrs(1/2 * (r[i]*float(w[i])+(1-r[i])*float(h[i]) - (w_F_hat)) <= x[i] for i in range(n))
-    constr5 = model.addConstrs(1/2 * ((w_F_hat) - (r[i]*float(w[i])+(1-r[i])*float(h[i]))) >= x[i] for i in range(n))
-    constr6 = model.addConstrs(1/2 * ((1-r[i])*float(w[i])+r[i]*float(h[i]) -  (h_F_hat)) <= y[i] for i in range(n))
-    constr7 = model.addConstrs(1/2 * (h_F_hat - ((1-r[i])*float(w[i])+r[i]*float(h[i]))) >= y[i] for i in range(n))
+    constr4 = model.addConstr(1/2 * (w_hat - w_F_hat) <= x)
+    constr5 = model.addConstr(1/2 * (w_F_hat - w_hat) >= x)
+    constr6 = model.addConstr(1/2 * (h_hat - h_F_hat) <= y)
+    constr7 = model.addConstr(1/2 * (h_F_hat - h_hat) >= y)
 
     #non-overlap constraints
-    constr8 = model.addConstrs(x[i] + 1/2 * (r[i]*float(w[i])+(1-r[i])*float(h[i])) <= x[j] - 1/2 * (r[j]*float(w[j])+(1-r[j])*float(h[j])) + w_F_hat * (1 - alpha[i,j]) for i in range(n) for j in range(n) if i != j)
-    constr9 = model.addConstrs(y[i] + 1/2 * ((1-r[i])*float(w[i])+r[i]*float(h[i])) <= y[j] - 1/2 * ((1-r[j])*float(w[j])+r[j]*float(h[j])) + h_F_hat * (1 - beta[i,j]) for i in range(n) for j in range(n) if i != j)
+    constr8 = model.addConstr(x[P] + 1/2 * w_hat[P] <= x[Q] - 1/2 * w_hat[Q] + w_F_hat * (1 - alpha[P,Q]))
+    constr9 = model.addConstr(y[P] + 1/2 * h_hat[P] <= y[Q] - 1/2 * h_hat[Q] + h_F_hat * (1 - beta[P,Q]))
     
     #rotation constraints
     constr10 = model.addConstr(w_F_hat == r_F*w_F + (1-r_F)*h_F)
     constr11 = model.addConstr(h_F_hat == (1-r_F)*w_F + r_F*h_F)
 
     #Alpha Beta constraints
-    constr12 = model.addConstrs(alpha[i,j] + alpha[j,i] + beta[i,j] + beta[j,i] == 1 for i in range(n) for j in range(n) if i < j)
+    constr12 = model.addConstr(alpha[I,J] + alpha[J,I] + beta[I,J] + beta[J,I] == 1)
     
 
     ##############  Objective function  ##############
     
 
-    model.setObjective(sum(c[i,j] * (d_x[i,j] + d_y[i,j]) for i in range(n) for j in range(i+1, n)), GRB.MINIMIZE)
+    model.setObjective(c_flow @ d_x + c_flow @ d_y, GRB.MINIMIZE)
 
     #Optimizing
     model.optimize()
 
-    ansX = []
-    ansY = []
-    ansr = []
-    ansr_F = r_F.x
-    
-    for i in range(n):
-        ansX.append(x[i].x)
-        ansY.append(y[i].x)
-        ansr.append(r[i].x)
+    # Reading all values of a variable at once
+    ansX = x.X
+    ansY = y.X
+    ansr = r.X
+    ansr_F = r_F.X[0]
 
 
     DepartmentsXYDict = {
         "x": ansX,
         "y": ansY
     }
-    ansr = np.array(ansr)
-    ansr_F = np.array(ansr_F)
 
     DepartmentsXY = pd.DataFrame(data=DepartmentsXYDict)
 
@@ -151,6 +158,10 @@ data_dict = import_data(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileT
 print("Successfully imported the necessary data from the Excel files.")
 
 
-DepartmentsXY, data_dict = second_model(data_dict) 
+# Solve with Gurobi or the open source solver HiGHS, see Solver in settings.ini
+if constants["Solver"] == "highs":
+    DepartmentsXY, data_dict = full_model_highs(data_dict, rotation=True)
+else:
+    DepartmentsXY, data_dict = second_model(data_dict)
 
 visualize(data_dict, DepartmentsXY)
@@ -7,6 +7,7 @@ import os
 import parser
 from import_data import import_data
 from visualize import visualize
+from full_model_highs import full_model_highs
 import time
 
 def first_model(data_dict):
@@ -34,58 +35,63 @@ def first_model(data_dict):
     ##############  Variables  ##############
 
 
-    # Two distance variables; size: n x n matrices; d_x[i][j]= distance between facilities i and j in x-direction, d_y accordingly
-    d_x = model.addVars(n, n, vtype=GRB.CONTINUOUS, name="d_x")
-    d_y = model.addVars(n, n, vtype=GRB.CONTINUOUS, name="d_y")
+    # Pairs i<j in the order of np.triu_indices and all pairs i != j
+    I, J = np.triu_indices(n, k=1)
+    P, Q = np.nonzero(~np.eye(n, dtype=bool))
+
+    # Only the pairs i<j with positive transport cost contribute to the objective, so only for them distance variables are needed (sparse pair index)
+    c_pairs = np.asarray(c, dtype=float)[I, J]
+    I_flow, J_flow, c_flow = I[c_pairs > 0], J[c_pairs > 0], c_pairs[c_pairs > 0]
+
+    # Two distance variables; size: number of pairs with flow; d_x[k]= distance between facilities I_flow[k] and J_flow[k] in x-direction, d_y accordingly
+    d_x = model.addMVar(len(I_flow), vtype=GRB.CONTINUOUS, name="d_x")
+    d_y = model.addMVar(len(I_flow), vtype=GRB.CONTINUOUS, name="d_y")
     
     #Two variables; size: n x 1; x-, y-coordinates of the departments
-    x = model.addVars(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="x")
-    y = model.addVars(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="y")
+    x = model.addMVar(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="x")
+    y = model.addMVar(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="y")
 
     #Alphas and Betas for relative arrangement
-    alpha = model.addVars(n, n, vtype=GRB.BINARY, name="alpha")  #matrix/array of the alphas (relative locations); size: n x n; alpha[i][j]= 1 if department i is on the left of j, 0 else
-    beta = model.addVars(n, n, vtype=GRB.BINARY, name="beta")  #matrix/array of the betas (relative locations); size: n x n; beta[i][j]= 1 if department i is on the below of j. 0 else
+    alpha = model.addMVar((n, n), vtype=GRB.BINARY, name="alpha")  #matrix/array of the alphas (relative locations); size: n x n; alpha[i][j]= 1 if department i is on the left of j, 0 else
+    beta = model.addMVar((n, n), vtype=GRB.BINARY, name="beta")  #matrix/array of the betas (relative locations); size: n x n; beta[i][j]= 1 if department i is on the below of j. 0 else
 
     
     ##############  Constraints  ##############
     
 
     #Constraints for the linearization of the objective function
-    constr0 = model.addConstrs(d_x[i,j] >= x[i] - x[j] for i in range(n) for j in range(n) if i < j)
-    constr1 = model.addConstrs(d_x[i,j] >= x[j] - x[i] for i in range(n) for j in range(n) if i < j)
-    constr2 = model.addConstrs(d_y[i,j] >= y[i] - y[j] for i in range(n) for j in range(n) if i < j)
-    constr3 = model.addConstrs(d_y[i,j] >= y[j] - y[i] for i in range(n) for j in range(n) if i < j)
+    constr0 = model.addConstr(d_x >= x[I_flow] - x[J_flow])
+    constr1 = model.addConstr(d_x >= x[J_flow] - x[I_flow])
+    constr2 = model.addConstr(d_y >= y[I_flow] - y[J_flow])
+    constr3 = model.addConstr(d_y >= y[J_flow] - y[I_flow])
 
 
     #Constraints to make sure the departments are inside the facility
-    constr4 = model.addConstrs(1/2 * (float(w[i]) - w_F) <= x[i] for i in range(n))
-    constr5 = model.addConstrs(1/2 * (w_F - float(w[i])) >= x[i] for i in range(n))
-    constr6 = model.addConstrs(1/2 * (float(h[i]) - h_F) <= y[i] for i in range(n))
-    constr7 = model.addConstrs(1/2 * (h_F - float(h[i])) >= y[i] for i in range(n))
+    constr4 = model.addConstr(1/2 * (w - w_F) <= x)
+    constr5 = model.addConstr(1/2 * (w_F - w) >= x)
+    constr6 = model.addConstr(1/2 * (h - h_F) <= y)
+    constr7 = model.addConstr(1/2 * (h_F - h) >= y)
 
    
     #non-overlap constraints
-    constr8 = model.addConstrs(x[i] + 1/2 * float(w[i]) <= x[j] - 1/2 * float(w[j]) + w_F * (1 - alpha[i,j]) for i in range(n) for j in range(n) if i != j)
-    constr9 = model.addConstrs(y[i] + 1/2 * float(h[i]) <= y[j] - 1/2 * float(h[j]) + h_F * (1 - beta[i,j]) for i in range(n) for j in range(n) if i != j)
+    constr8 = model.addConstr(x[P] + 1/2 * w[P] <= x[Q] - 1/2 * w[Q] + w_F * (1 - alpha[P,Q]))
+    constr9 = model.addConstr(y[P] + 1/2 * h[P] <= y[Q] - 1/2 * h[Q] + h_F * (1 - beta[P,Q]))
 
     #Alpha Beta constraints
-    constr10 = model.addConstrs(alpha[i,j] + alpha[j,i] + beta[i,j] + beta[j,i] == 1 for i in range(n) for j in range(n) if i < j)
+    constr10 = model.addConstr(alpha[I,J] + alpha[J,I] + beta[I,J] + beta[J,I] == 1)
     
 
     ##############  Objective function  ##############
     
 
-    model.setObjective(sum(c[i,j] * (d_x[i,j] + d_y[i,j]) for i in range(n) for j in range(i+1, n)), GRB.MINIMIZE)
+    model.setObjective(c_flow @ d_x + c_flow @ d_y, GRB.MINIMIZE)
 
     #Optimizing
     model.optimize()
 
-    ansX = []
-    ansY = []
-    
-    for i in range(n):
-        ansX.append(x[i].x)
-        ansY.append(y[i].x)
+    # Reading all values of a variable at once
+    ansX = x.X
+    ansY = y.X
 
 
     DepartmentsXYDict = {
@@ -133,7 +139,11 @@ data_dict = import_data(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileT
 print("Successfully imported the necessary data from the Excel files.")
 
 
-DepartmentsXY, data_dict = first_model(data_dict) 
+# Solve with Gurobi or the open source solver HiGHS, see Solver in settings.ini
+if constants["Solver"] == "highs":
+    DepartmentsXY, data_dict = full_model_highs(data_dict, rotation=False)
+else:
+    DepartmentsXY, data_dict = first_model(data_dict) 
 
 visualize(data_dict, DepartmentsXY, FileName="facility_layout/second_model/visualization_first_stage_10_departments.png", useFacility=True, Grouping=False, drawLabels=False)
 
@@ -1,8 +1,11 @@
 from first_stage_scipy_minimize import first_stage_scipy_minimize
 from first_stage_nonlinear import first_stage_nonlinear
+from first_stage_nonlinear_batched import first_stage_nonlinear_batched
+from first_stage_multilevel import first_stage_multilevel
+from problem_instance import problem_instance
 
 
-def first_stage(data_dict, Alpha, method="gradient_descent"):
+def first_stage(data_dict, Alpha, method="gradient_descent", scipy_method="SLSQP", starts=1, workers=1, seed_sequence=None, repulsion="exact", repulsion_accuracy=0.5, optimizer="steepest", coarsening="flow", initializer="random"):
     """
     This function executes the first stage. with the "method" option you can specify what method this function will use.
     Call the function like this:
@@ -10,17 +13,43 @@ def first_stage(data_dict, Alpha, method="gradient_descent"):
             first_stage(data_dict, Alpha, method="gradient_descent")
           or
             first_stage(data_dict, Alpha)
+          For very large instances the repulsion term can be approximated, see first_stage_nonlinear_iteration:
+            first_stage(data_dict, Alpha, repulsion="approximate", repulsion_accuracy=0.5)
+          Instead of steepest descent, an accelerated optimizer ("heavy_ball", "nesterov", "adam" or "lbfgs") can be used, see first_stage_nonlinear_gradient_descent:
+            first_stage(data_dict, Alpha, optimizer="lbfgs")
 
         - To use the minimize function of scipy.optimize, call:
             first_stage(data_dict, Alpha, method="scipy_minimize")
+          The algorithm used by scipy.optimize.minimize can be chosen with scipy_method ("SLSQP", "L-BFGS-B" or "trust-constr"), e.g.
+            first_stage(data_dict, Alpha, method="scipy_minimize", scipy_method="L-BFGS-B")
+
+        - To run our gradient descent for all start positions at once as one batch of array operations, call:
+            first_stage(data_dict, Alpha, method="batched_gradient_descent", starts=64)
+
+        - To coarsen the departments into clusters, solve the coarse problem and refine it level by level with our gradient descent, call:
+            first_stage(data_dict, Alpha, method="multilevel")
+          The clusters are formed along the highest transport costs (coarsening="flow") or only within groups (coarsening="group"), see first_stage_multilevel_iteration.
+          This is much faster than gradient_descent for large instances. optimizer, repulsion and repulsion_accuracy are used on every level.
+
+    All methods are started from "starts" random start positions, distributed to "workers" processes, and the best relative layout is returned.
+    With initializer="spectral", the first start is placed with the Laplacian eigenvectors of the flow graph instead, see first_stage_start_positions,
+    and the descent iterations it saves compared to the random starts are reported.
+    The batched method does not use worker processes. Every start draws its random numbers from its own stream spawned from seed_sequence (a numpy.random.SeedSequence), see first_stage_multistart.
+    data_dict can also be a ProblemInstance, which all starts share instead of copies of data_dict.
     """
     
+    # All methods work with the read-only ProblemInstance, which is only sent to the worker processes instead of the DataFrames
+    data_dict = problem_instance(data_dict, Alpha)
     
     if method == "gradient_descent":
         #print("Using default method Gradient descent ...")
-        return first_stage_nonlinear(data_dict, Alpha)
+        return first_stage_nonlinear(data_dict, Alpha, starts=starts, workers=workers, seed_sequence=seed_sequence, initializer=initializer, repulsion=repulsion, repulsion_accuracy=repulsion_accuracy, optimizer=optimizer)
+    elif method == "batched_gradient_descent":
+        return first_stage_nonlinear_batched(data_dict, Alpha, starts=starts, seed_sequence=seed_sequence, initializer=initializer)
+    elif method == "multilevel":
+        return first_stage_multilevel(data_dict, Alpha, starts=starts, workers=workers, seed_sequence=seed_sequence, initializer=initializer, coarsening=coarsening, optimizer=optimizer, repulsion=repulsion, repulsion_accuracy=repulsion_accuracy)
     elif method == "scipy_minimize":
         #print("Using method scipy.optimize.minimize ...")
-        return first_stage_scipy_minimize(data_dict, Alpha)
+        return first_stage_scipy_minimize(data_dict, Alpha, scipy_method=scipy_method, starts=starts, workers=workers, seed_sequence=seed_sequence, initializer=initializer)
     else:
-        raise ValueError('Wrong usage of "method". Set it to "gradient_descent", "scipy_minimize", or leave it blank.')
+        raise ValueError('Wrong usage of "method". Set it to "gradient_descent", "batched_gradient_descent", "multilevel", "scipy_minimize", or leave it blank.')
@@ -0,0 +1,163 @@
+import time
+import pandas as pd
+import numpy as np
+from first_stage_nonlinear_gradient_descent import first_stage_nonlinear_gradient_descent
+from first_stage_multistart import first_stage_multistart
+from first_stage_nonlinear import first_stage_nonlinear_objective_gradient_function
+from first_stage_start_positions import first_stage_start_positions
+from problem_instance import problem_instance
+
+def first_stage_multilevel(data_dict, Alpha, starts=1, workers=1, seed_sequence=None, initializer="random", coarsening="flow", optimizer="steepest", repulsion="exact", repulsion_accuracy=0.5):
+    """ Executes the multilevel first stage from several random start positions and chooses the best solution.
+         Input: - data_dict: extract information about departments and facility
+                - Alpha: for calculating param K
+                - starts, workers, seed_sequence, initializer: see first_stage_multistart
+                - coarsening, optimizer, repulsion, repulsion_accuracy: see first_stage_multilevel_iteration
+         Output: - DepartmentsXYrelative: coordinates of the relative positions of the departments
+    """
+
+    DepartmentsXYrelative_list, _ = first_stage_multistart(first_stage_multilevel_iteration, problem_instance(data_dict, Alpha), Alpha, starts=starts, workers=workers, seed_sequence=seed_sequence, initializer=initializer, coarsening=coarsening, optimizer=optimizer, repulsion=repulsion, repulsion_accuracy=repulsion_accuracy)
+
+    return DepartmentsXYrelative_list[0]
+
+def first_stage_multilevel_iteration(instance, Alpha, rng=None, initializer="random", coarsening="flow", coarsest_size=10, refine_iters=100, optimizer="steepest", repulsion="exact", repulsion_accuracy=0.5):
+    """ Executes the first stage as coarsen-solve-refine, the standard way to scale force-directed layouts:
+        1. The departments are merged into clusters level by level, see first_stage_multilevel_coarsen, until at most coarsest_size clusters are left.
+        2. The attractor-repeller problem of the coarsest level is solved with first_stage_nonlinear_gradient_descent from a start position drawn with initializer,
+           see first_stage_start_positions.
+        3. Level by level, every department starts at the position of its cluster (plus a small random offset) and the layout is refined
+           with at most refine_iters iterations. On the finest level, the gradient descent runs until it converges.
+         Input: - instance: ProblemInstance with the information about departments and facility
+                - Alpha: for calculating param K, on every level
+                - rng: numpy.random.Generator for the coarsening, the start positions and the offsets. If None, a fresh unseeded generator is used.
+                - initializer: "random" or "spectral" start positions of the coarsest level
+                - coarsening:
+                    - "flow" merges departments along the pairs with the highest transport costs
+                    - "group" does the same, but only merges departments of the same group
+                - coarsest_size: maximum number of clusters on the coarsest level
+                - refine_iters: maximum number of iterations on the intermediate levels
+                - optimizer, repulsion, repulsion_accuracy: see first_stage_nonlinear_iteration
+         Output: - DepartmentsXYrelative: coordinates of the relative positions of the departments
+                 - ObjValue: objective value of the relative positions
+                 - stats: number of levels, iterations summed over all levels, wall time and whether the finest level converged
+    """
+
+    startSeconds = time.time()
+
+    n = len(instance)   #number of departments
+    w_F = instance.w_F #width of facility
+    h_F = instance.h_F #height of facility
+    w = instance.w  #width of the departments, numpy array of length n
+    h = instance.h  #height of the departments, numpy array of length n
+    DepartmentsDependencies = instance.c
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if coarsening == "group":
+        groups = instance.group
+        groups = np.where(np.isnan(groups), -1 - np.arange(n), groups) # departments without group are a group of their own
+    elif coarsening == "flow":
+        groups = None
+    else:
+        raise ValueError('Wrong usage of "coarsening". Set it to "flow" or "group".')
+
+    ##############  Coarsening  ##############
+
+    # Every level is (w, h, DepartmentsDependencies, cluster), cluster maps the departments of the level to the departments of the next coarser level
+    levels = [(w, h, np.asarray(DepartmentsDependencies, dtype=float), None)]
+    while len(levels[-1][0]) > coarsest_size:
+        w_l, h_l, DD_l, _ = levels[-1]
+        cluster, w_c, h_c, DD_c, groups_c = first_stage_multilevel_coarsen(w_l, h_l, DD_l, groups, rng)
+        if len(w_c) > 0.9 * len(w_l): # hardly anything left to merge
+            break
+        levels[-1] = (w_l, h_l, DD_l, cluster)
+        levels.append((w_c, h_c, DD_c, None))
+        groups = groups_c
+
+    print("Multilevel first stage with level sizes", " -> ".join(str(len(level[0])) for level in levels))
+
+    ##############  Solve coarsest level  ##############
+
+    w_l, h_l, DD_l, _ = levels[-1]
+    x_Dep, y_Dep = first_stage_start_positions(w_F, h_F, DD_l, rng, initializer=initializer)
+    objective_gradient = first_stage_nonlinear_objective_gradient_function(w_l, h_l, DD_l, Alpha, repulsion=repulsion, repulsion_accuracy=repulsion_accuracy)
+    positions, ObjValue, level_stats = first_stage_nonlinear_gradient_descent(np.column_stack((x_Dep, y_Dep)), objective_gradient, optimizer=optimizer)
+    iterations = level_stats["iterations"]
+
+    ##############  Project and refine  ##############
+
+    for level in range(len(levels) - 2, -1, -1):
+        w_l, h_l, DD_l, cluster = levels[level]
+        w_c, h_c, _, _ = levels[level + 1]
+        n_c = len(w_c)
+
+        # Start every department at its cluster, randomly offset within a quarter of the cluster size so that no two departments coincide
+        x_Dep = positions[:n_c][cluster] + rng.uniform(-1/4, 1/4, size=len(w_l)) * w_c[cluster]
+        y_Dep = positions[n_c:][cluster] + rng.uniform(-1/4, 1/4, size=len(w_l)) * h_c[cluster]
+
+        objective_gradient = first_stage_nonlinear_objective_gradient_function(w_l, h_l, DD_l, Alpha, repulsion=repulsion, repulsion_accuracy=repulsion_accuracy)
+        max_iters = 10000 if level == 0 else refine_iters
+        positions, ObjValue, level_stats = first_stage_nonlinear_gradient_descent(np.column_stack((x_Dep, y_Dep)), objective_gradient, optimizer=optimizer, max_iters=max_iters)
+        iterations = iterations + level_stats["iterations"]
+
+    stats = {
+        "optimizer": optimizer,
+        "levels": len(levels),
+        "iterations": iterations,
+        "seconds": time.time() - startSeconds,
+        "converged": level_stats["converged"],
+    }
+
+    # Transform to Dataframe
+    DepartmentsOptPosDict = {
+        "name": instance.names,
+        "x": positions[:n].tolist(),
+        "y": positions[n:].tolist()
+    }
+    DepartmentsXYrelative = pd.DataFrame(data=DepartmentsOptPosDict)
+
+    return DepartmentsXYrelative, ObjValue, stats
+
+def first_stage_multilevel_coarsen(w, h, DepartmentsDependencies, groups, rng):
+    """ Merges the departments of one level into clusters by heavy-edge matching: in random order, every department that is not matched yet
+    is matched with the unmatched department it has the highest transport costs with. Departments without such a partner stay alone.
+    A cluster is a square with the summed area of its departments and the transport costs between clusters are summed up.
+         Input: - w, h, DepartmentsDependencies: widths, heights and (upper triangular) transport costs of the departments
+                - groups: group label of every department, only departments of the same group are merged. None to ignore groups.
+                - rng: numpy.random.Generator for the order of the departments
+         Output: - cluster: array of length n with the cluster of every department
+                 - w_c, h_c, DepartmentsDependencies_c: widths, heights and upper triangular transport costs of the clusters
+                 - groups_c: group label of every cluster, None if groups is None
+    """
+
+    n = len(w)
+    c_sym = np.triu(DepartmentsDependencies, k=1)
+    c_sym = c_sym + c_sym.T
+
+    cluster = np.full(n, -1)
+    n_c = 0
+    for i in rng.permutation(n):
+        if cluster[i] >= 0:
+            continue
+        candidates = np.where(cluster < 0, c_sym[i], 0) # only unmatched departments, c_sym[i,i] is zero
+        if groups is not None:
+            candidates = np.where(groups == groups[i], candidates, 0)
+        j = np.argmax(candidates)
+        cluster[i] = n_c
+        if candidates[j] > 0:
+            cluster[j] = n_c
+        n_c = n_c + 1
+
+    # Aggregate the clusters
+    area = np.bincount(cluster, weights=w*h, minlength=n_c)
+    w_c = np.sqrt(area)
+    h_c = np.sqrt(area)
+    P = np.zeros((n, n_c))
+    P[np.arange(n), cluster] = 1
+    DepartmentsDependencies_c = np.triu(P.T @ c_sym @ P, k=1) # costs inside a cluster are dropped
+    groups_c = None
+    if groups is not None:
+        groups_c = np.zeros(n_c)
+        groups_c[cluster] = groups
+
+    return cluster, w_c, h_c, DepartmentsDependencies_c, groups_c
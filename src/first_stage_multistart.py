@@ -0,0 +1,69 @@
+import os
+import numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+
+def first_stage_multistart(first_stage_start, data_dict, Alpha, starts=1, workers=1, seed_sequence=None, top_k=1, initializer="random", **kwargs):
+    """
+    Executes a first stage method from several random start positions and returns the best relative layouts.
+    Input:
+        - first_stage_start: function solving the first stage from one random start, called as
+            first_stage_start(data_dict, Alpha, rng=rng, initializer=initializer, **kwargs)
+          and returning (DepartmentsXYrelative, ObjValue, stats), e.g. first_stage_iteration or first_stage_nonlinear_iteration.
+          stats is a dictionary with at least the number of "iterations" and the wall time in "seconds" of the start.
+        - data_dict: extract information about departments and facility
+        - Alpha: for calculating param K
+        - starts: number of random start positions
+        - workers: number of processes the starts are distributed to. 1 runs all starts in this process, 0 uses all available cores.
+        - seed_sequence: numpy.random.SeedSequence from which every start gets its own independent random number generator.
+          If None, fresh entropy is drawn, i.e., the result is not reproducible.
+        - top_k: number of relative layouts that are returned
+        - initializer: start positions of the first start, "random" or "spectral", see first_stage_start_positions. All other starts are random,
+          because spectral starts only differ by small random offsets. With a spectral first start, the iterations it needed are compared to the random starts.
+    Output:
+        - DepartmentsXYrelative_list: the top_k relative layouts, sorted by ascending objective value
+        - ObjValues: the corresponding objective values
+    """
+
+    if seed_sequence is None:
+        seed_sequence = np.random.SeedSequence()
+    if workers == 0:
+        workers = os.cpu_count()
+
+    # Every start draws its random numbers from its own stream, so the result does not depend on the number of workers
+    start_seeds = seed_sequence.spawn(starts)
+    initializers = [initializer] + ["random"] * (starts - 1)
+    run_start = partial(first_stage_multistart_start, first_stage_start, data_dict, Alpha, **kwargs)
+
+    if workers == 1 or starts == 1:
+        results = [run_start(start_seed, start_initializer) for start_seed, start_initializer in zip(start_seeds, initializers)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, starts)) as executor:
+            results = list(executor.map(run_start, start_seeds, initializers))
+
+    ObjValues = [ObjValue for _, ObjValue, _ in results]
+    iterations = [stats["iterations"] for _, _, stats in results]
+    seconds = [stats["seconds"] for _, _, stats in results]
+
+    # Messages for debugging purposes
+    #print("Objective values are", ObjValues)
+    if starts > 1:
+        print(f"Mean is {np.mean(ObjValues)} with standard derivation {np.std(ObjValues)} resulting in a gap of {round(100 * np.std(ObjValues) / np.mean(ObjValues), 2)}%")
+    print(f"First stage: {starts} start(s) with on average {round(np.mean(iterations), 1)} iterations and {round(np.mean(seconds), 3)}s per start")
+    if initializer != "random" and starts > 1:
+        saved = np.mean(iterations[1:]) - iterations[0]
+        print(f"The {initializer} start needed {iterations[0]} iterations, {round(saved, 1)} iterations ({round(100 * saved / max(np.mean(iterations[1:]), 1), 1)}%) less than the random starts on average. Its objective value is {ObjValues[0]}, the best random one is {np.min(ObjValues[1:])}")
+
+    # Stable sort, so ties are broken by the index of the start
+    order = np.argsort(ObjValues, kind="stable")[:top_k]
+    DepartmentsXYrelative_list = [results[k][0] for k in order]
+    ObjValues = [ObjValues[k] for k in order]
+
+    return DepartmentsXYrelative_list, ObjValues
+
+
+def first_stage_multistart_start(first_stage_start, data_dict, Alpha, start_seed, initializer, **kwargs):
+    """Executes a single start of first_stage_multistart with a random number generator created from start_seed. Defined on module level so it can be sent to worker processes."""
+
+    return first_stage_start(data_dict, Alpha, rng=np.random.default_rng(start_seed), initializer=initializer, **kwargs)
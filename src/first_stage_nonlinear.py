@@ -1,63 +1,76 @@
 import pandas as pd
 import numpy as np
+from functools import partial
 from first_stage_nonlinear_gradient_descent import first_stage_nonlinear_gradient_descent
-from import_data import unpack_data_dict
+from first_stage_multistart import first_stage_multistart
+from first_stage_nonlinear_gradient import first_stage_nonlinear_K, first_stage_nonlinear_theta_squared, first_stage_nonlinear_pair_matrices, first_stage_nonlinear_objective_gradient
+from first_stage_nonlinear_approx import first_stage_nonlinear_sparse_pairs, first_stage_nonlinear_objective_gradient_approx
+from first_stage_start_positions import first_stage_start_positions
+from problem_instance import problem_instance
 
-def first_stage_nonlinear(data_dict, Alpha):
-    """ Executes the first stage with gradient descent by preprocessing the data and calling the actual gradient descent method.
+def first_stage_nonlinear(data_dict, Alpha, starts=1, workers=1, seed_sequence=None, repulsion="exact", repulsion_accuracy=0.5, optimizer="steepest", initializer="random"):
+    """ Executes the first stage with gradient descent from several random start positions and chooses the best solution.
          Input: - data_dict: extract information about departments and facility
                 - Alpha: for calculating param K
+                - starts, workers, seed_sequence, initializer: see first_stage_multistart
+                - repulsion, repulsion_accuracy, optimizer: see first_stage_nonlinear_iteration
          Output: - DepartmentsXYrelative: coordinates of the relative positions of the departments
     """
 
-    Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+    DepartmentsXYrelative_list, _ = first_stage_multistart(first_stage_nonlinear_iteration, problem_instance(data_dict, Alpha), Alpha, starts=starts, workers=workers, seed_sequence=seed_sequence, initializer=initializer, repulsion=repulsion, repulsion_accuracy=repulsion_accuracy, optimizer=optimizer)
+
+    return DepartmentsXYrelative_list[0]
 
-    # Define Start positions, maybe many startpositions and call grad_descent for every position
+def first_stage_nonlinear_iteration(instance, Alpha, rng=None, repulsion="exact", repulsion_accuracy=0.5, optimizer="steepest", initializer="random"):
+    """ Executes the first stage with gradient descent by preprocessing the data and calling the actual gradient descent method.
+         Input: - instance: ProblemInstance with the departments and the facility, see problem_instance
+                - Alpha: for calculating param K, which the instance already holds
+                - rng: numpy.random.Generator to draw the start positions from. If None, a fresh unseeded generator is used.
+                - repulsion:
+                    - "exact" evaluates the objective for all n^2 pairs of departments
+                    - "approximate" evaluates the attraction only for pairs with nonzero costs and approximates the repulsion of far away departments,
+                      see first_stage_nonlinear_objective_gradient_approx. Only faster than "exact" from about 1000 departments on.
+                - repulsion_accuracy: accuracy parameter of the approximate repulsion, 0 < repulsion_accuracy <= 1, smaller is more accurate
+                - optimizer: "steepest", "heavy_ball", "nesterov", "adam" or "lbfgs", see first_stage_nonlinear_gradient_descent
+                - initializer: "random" or "spectral" start positions, see first_stage_start_positions
+         Output: - DepartmentsXYrelative: coordinates of the relative positions of the departments
+                 - ObjValue: objective value of the relative positions
+                 - stats: number of iterations and wall time of the gradient descent, see first_stage_nonlinear_gradient_descent
+    """
+
+    # Define Start positions, first_stage_nonlinear calls this function for many startpositions
     # to not get stuck in local optimum
-    n = len(Departments)   #number of departments
-    w_F = float(Facility.iloc[0]['w']) #width of facility 
-    h_F = float(Facility.iloc[0]['h']) #height of facility
-    # np.random.seed(42) # to reproduce solution
-    x_Dep = np.random.uniform(low=-1/2 * w_F, high=1/2 * w_F, size=(n,)).astype(float) # random positions in range of facility width
-    y_Dep = np.random.uniform(low=-1/2 * h_F, high=1/2 * h_F, size=(n,)).astype(float) # random positions in range of facility height
-    x_Dep = x_Dep.tolist()
-    y_Dep = y_Dep.tolist()
-    DepartmentsStartDict = {
-        "x": x_Dep,
-        "y": y_Dep
-    }
-    StartPositions = pd.DataFrame(data=DepartmentsStartDict)
-    StartPositions = pd.merge(Departments["name"], StartPositions, left_index=True, right_index=True)
-
-    # Transform StartPositions to array
-    StartPositions = StartPositions[["x","y"]].to_numpy()
-    # Transform DepartmentsWidthHeight to array
-    w = Departments["w"].to_numpy()  #converting the width of the departments into an numpy array of length n
-    h = Departments["h"].to_numpy()  #converting the height of the departments into an numpy array of length n
-
-    # Calculate teta_squared
-    theta_squared = np.zeros(shape=(n,n))
-    for i in range(n):
-        for j in range(n):
-            theta_squared[i,j] = 1/4 * ((w[i]+w[j])**2 + (h[i]+h[j])**2)
+    n = len(instance)   #number of departments
+    if rng is None:
+        rng = np.random.default_rng()
+    x_Dep, y_Dep = first_stage_start_positions(instance.w_F, instance.h_F, instance.c, rng, initializer=initializer)
+    StartPositions = np.column_stack((x_Dep, y_Dep))
+
+    # K (and teta_squared) are calculated once for the instance
+    objective_gradient = first_stage_nonlinear_objective_gradient_function(instance.w, instance.h, instance.c, Alpha, repulsion=repulsion, repulsion_accuracy=repulsion_accuracy, instance=instance)
 
     # Calculate Optimal positions
-    DepartmentsXYrelative = first_stage_nonlinear_gradient_descent(StartPositions,theta_squared, data_dict,Alpha)
+    DepartmentsXYrelative, ObjValue, stats = first_stage_nonlinear_gradient_descent(StartPositions, objective_gradient, optimizer=optimizer)
 
-    # Extract x and y coordinates
-    x = DepartmentsXYrelative[range(0,n)]
-    y = DepartmentsXYrelative[range(n,2*n)]
+    # Extract x and y coordinates and transform to Dataframe
+    DepartmentsXYrelative = pd.DataFrame({"name": instance.names, "x": DepartmentsXYrelative[:n], "y": DepartmentsXYrelative[n:]})
 
-    # Transform to list
-    x = x.tolist()
-    y = y.tolist()
+    return DepartmentsXYrelative, ObjValue, stats
+
+def first_stage_nonlinear_objective_gradient_function(w, h, DepartmentsDependencies, Alpha, repulsion="exact", repulsion_accuracy=0.5, instance=None):
+    """ Precomputes the instance data of the objective and returns the function mapping a position vector to its objective value and gradient,
+    as needed by first_stage_nonlinear_gradient_descent. repulsion and repulsion_accuracy: see first_stage_nonlinear_iteration.
+    If w, h and DepartmentsDependencies are the ones of the ProblemInstance instance, its precomputed data is used instead.
+    """
 
-    # Transform to Dataframe
-    DepartmentsOptPosDict = {
-        "x": x,
-        "y": y
-    }
-    OptPos = pd.DataFrame(data=DepartmentsOptPosDict)
-    DepartmentsXYrelative = pd.merge(Departments["name"], OptPos, left_index=True, right_index=True)
+    K = instance.K if instance is not None else first_stage_nonlinear_K(DepartmentsDependencies, Alpha)
+    if repulsion == "approximate":
+        I, J, C = (instance.I, instance.J, instance.c_pairs) if instance is not None else first_stage_nonlinear_sparse_pairs(DepartmentsDependencies)
+        return partial(first_stage_nonlinear_objective_gradient_approx, w=np.asarray(w, dtype=float), h=np.asarray(h, dtype=float), I=I, J=J, C=C, K=K, accuracy=repulsion_accuracy)
 
-    return DepartmentsXYrelative
\ No newline at end of file
+    if instance is not None:
+        theta_squared_sym, c_sym = instance.pair_matrices()
+    else:
+        theta_squared = first_stage_nonlinear_theta_squared(w, h)
+        theta_squared_sym, c_sym = first_stage_nonlinear_pair_matrices(theta_squared, DepartmentsDependencies)
+    return partial(first_stage_nonlinear_objective_gradient, theta_squared_sym=theta_squared_sym, c_sym=c_sym, K=K)
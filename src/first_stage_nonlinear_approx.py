@@ -0,0 +1,219 @@
+import numpy as np
+
+# Approximate evaluation of the first stage objective sum_{i<j} c_ij*D_ij + K*(theta_squared_ij/D_ij - 1) for large instances.
+# The attraction term is evaluated exactly, but only for the pairs with nonzero transport costs.
+# The repulsion term is approximated on an adaptive quadtree as in the fast multipole method: far away cells interact cell to cell
+# through their aggregated sizes and centroids, the result is handed down to the departments of the target cell by a Taylor expansion,
+# and a department interacts exactly only with the departments in its own and the neighbouring cells of its leaf.
+
+def first_stage_nonlinear_sparse_pairs(DepartmentsDependencies):
+    """ Extracts the pairs i<j with nonzero transport costs.
+         Output:
+             - I, J: arrays with the indices i and j of the pairs
+             - C: array with the transport costs c_ij of the pairs
+    """
+
+    I, J = np.nonzero(np.triu(DepartmentsDependencies, k=1))
+    C = np.asarray(DepartmentsDependencies, dtype=float)[I, J]
+
+    return I, J, C
+
+def first_stage_nonlinear_objective_gradient_approx(ActualPositions, w, h, I, J, C, K, accuracy=0.5, leaf_size=8, max_levels=20):
+    """ Calculates an approximation of the objective value and gradient of first_stage_nonlinear_objective_gradient in O(n log n + nnz).
+        Input:
+            - ActualPositions: vector [x_1, ..., x_n, y_1, ..., y_n]
+            - w, h: widths and heights of the departments
+            - I, J, C: pairs with nonzero transport costs, see first_stage_nonlinear_sparse_pairs
+            - K: repulsion constant, see first_stage_nonlinear_K
+            - accuracy: opening parameter as in Barnes-Hut, 0 < accuracy <= 1. Cells are only aggregated if they are at least 1/accuracy cell widths away,
+              i.e., smaller values are more accurate and slower.
+            - leaf_size: cells whose own and neighbouring cells contain more departments on average are refined, all other cells are leaves
+            - max_levels: maximum depth of the quadtree
+        Output:
+            - function_value, gradient_evaluated: as in first_stage_nonlinear_objective_gradient
+    """
+
+    n = len(w)
+    x = ActualPositions[:n] # Extract x coordinates of actual positions
+    y = ActualPositions[n:] # Extract y coordinates of actual positions
+
+    ##############  Attraction, exact over the pairs with nonzero costs  ##############
+
+    dx = x[I] - x[J]
+    dy = y[I] - y[J]
+    function_value = np.sum(C * (dx**2 + dy**2))
+    x_grad = np.bincount(I, weights=2*C*dx, minlength=n) - np.bincount(J, weights=2*C*dx, minlength=n)
+    y_grad = np.bincount(I, weights=2*C*dy, minlength=n) - np.bincount(J, weights=2*C*dy, minlength=n)
+
+    ##############  Repulsion, approximated on a quadtree  ##############
+
+    radius = int(np.ceil(1/accuracy)) # cells within this Chebyshev distance are resolved on the next finer level
+
+    # Bounding square of all departments
+    x_min = np.min(x)
+    y_min = np.min(y)
+    size = max(np.max(x) - x_min, np.max(y) - y_min, 1e-12) * (1 + 1e-9)
+
+    # sum_{q in cell} theta_squared_pq = sum_m a_p[m] * sum_{q in cell} moment_q[m] with the moments (1, w_q, h_q, w_q^2+h_q^2)
+    # and the coefficients a_p = 1/4 * (w_p^2+h_p^2, 2*w_p, 2*h_p, 1)
+    wh_squared = w**2 + h**2
+    moments = np.column_stack((np.ones(n), w, h, wh_squared))
+    a = 1/4 * np.column_stack((wh_squared, 2*w, 2*h, np.ones(n)))
+    # Per department weights of the cell aggregates: position, moments and moments weighted by the position
+    aggregate_weights = np.column_stack((x, y, moments, moments * x[:,None], moments * y[:,None]))
+
+    # Offsets of the cells that are children of the neighbours of the parent cell, but not neighbours of the own cell themselves.
+    # These cells are aggregated on a level; one row per parity 2*(cx % 2) + cy % 2 of the own cell.
+    far_OX = []
+    far_OY = []
+    for parity_x in range(2):
+        for parity_y in range(2):
+            OX, OY = np.meshgrid(np.arange(-2*radius - parity_x, 2*radius + 2 - parity_x), np.arange(-2*radius - parity_y, 2*radius + 2 - parity_y), indexing="ij")
+            far = np.maximum(np.abs(OX), np.abs(OY)) > radius
+            far_OX.append(OX[far])
+            far_OY.append(OY[far])
+    far_OX = np.array(far_OX)
+    far_OY = np.array(far_OY)
+
+    # Offsets of all neighbouring cells including the own cell, and the half of them that is seen from the other cell with the opposite offset
+    near_OX, near_OY = np.meshgrid(np.arange(-radius, radius + 1), np.arange(-radius, radius + 1), indexing="ij")
+    near_OX = near_OX.ravel()
+    near_OY = near_OY.ravel()
+    half = (near_OX > 0) | ((near_OX == 0) & (near_OY > 0))
+
+    repulsion = np.zeros(n)
+    repulsion_x_grad = np.zeros(n)
+    repulsion_y_grad = np.zeros(n)
+
+    # Quadtree, one level after the other: crowded cells are refined, all other cells are leaves and
+    # their departments interact exactly with the neighbouring cells. Only the departments around refined cells take part in the next level.
+    members = np.arange(n)
+    active = np.ones(n, dtype=bool) # whether the member is in a cell of this level, i.e. not in a leaf of a coarser level
+    level = 0
+    while True:
+        level = level + 1
+        cells_per_side = 2**level
+        x_members = x[members]
+        y_members = y[members]
+        cx = np.minimum(((x_members - x_min) / size * cells_per_side).astype(np.int64), cells_per_side - 1)
+        cy = np.minimum(((y_members - y_min) / size * cells_per_side).astype(np.int64), cells_per_side - 1)
+
+        # Aggregates of all occupied cells: centroid, sums of the moments and the centroids weighted by every moment,
+        # so that a cell has no dipole moment with respect to the centroid of each of its moments
+        cell_keys, cell_index, cell_count = np.unique(cx * cells_per_side + cy, return_inverse=True, return_counts=True)
+        cells = len(cell_keys)
+        aggregates = np.bincount((cell_index[:,None] * 14 + np.arange(14)).ravel(), weights=aggregate_weights[members].ravel(), minlength=cells * 14).reshape(cells, 14)
+        cell_x = aggregates[:,0] / cell_count
+        cell_y = aggregates[:,1] / cell_count
+        cell_moments = aggregates[:,2:6]
+        cell_moments_x = aggregates[:,6:10] / cell_moments
+        cell_moments_y = aggregates[:,10:14] / cell_moments
+        cell_cx = cell_keys // cells_per_side
+        cell_cy = cell_keys % cells_per_side
+        cell_active = np.zeros(cells, dtype=bool)
+        cell_active[cell_index[active]] = True
+
+        # Interaction list of every active cell on this level
+        targets = np.flatnonzero(cell_active)
+        parity = 2 * (cell_cx[targets] % 2) + cell_cy[targets] % 2
+        ncx = cell_cx[targets,None] + far_OX[parity]
+        ncy = cell_cy[targets,None] + far_OY[parity]
+        neighbour_keys = ncx * cells_per_side + ncy
+        position = np.minimum(np.searchsorted(cell_keys, neighbour_keys), cells - 1)
+        occupied = (ncx >= 0) & (ncx < cells_per_side) & (ncy >= 0) & (ncy < cells_per_side) & (cell_keys[position] == neighbour_keys)
+        T, k = np.nonzero(occupied)
+        S = position[T, k]
+        T = targets[T]
+        if len(T):
+            # Cell to cell interactions: the kernel 1/D of every moment of the source cell S and its derivatives at the centroid of the target cell T,
+            # with D the squared distance to the centroid of the moment
+            rx = cell_x[T,None] - cell_moments_x[S]
+            ry = cell_y[T,None] - cell_moments_y[S]
+            inverse_D = 1 / (rx**2 + ry**2)
+            M = cell_moments[S] * inverse_D
+            M_x = M * rx * inverse_D
+            M_y = M * ry * inverse_D
+            M_D = M * inverse_D
+            terms = np.stack((M, -2*M_x, -2*M_y, 8*M_x*rx*inverse_D - 2*M_D, 8*M_x*ry*inverse_D, 8*M_y*ry*inverse_D - 2*M_D), axis=1)
+
+            # Local expansions of the target cells, cells x 6 terms x 4 moments. T is sorted, so the terms of a target cell are consecutive.
+            first = np.flatnonzero(np.concatenate(([True], T[1:] != T[:-1])))
+            local = np.zeros((cells, 6, 4))
+            local[T[first]] = np.add.reduceat(terms, first, axis=0)
+
+            # Hand the local expansions of the cells down to their departments (Taylor expansion of second order around the centroid)
+            departments = members[active]
+            department_cell = cell_index[active]
+            L0, Lx, Ly, Lxx, Lxy, Lyy = np.einsum("nm,ntm->tn", a[departments], local[department_cell])
+            ddx = x[departments] - cell_x[department_cell]
+            ddy = y[departments] - cell_y[department_cell]
+            repulsion[departments] += L0 + Lx*ddx + Ly*ddy + 0.5*(Lxx*ddx**2 + 2*Lxy*ddx*ddy + Lyy*ddy**2)
+            repulsion_x_grad[departments] += Lx + Lxx*ddx + Lxy*ddy
+            repulsion_y_grad[departments] += Ly + Lxy*ddx + Lyy*ddy
+
+        # Neighbouring cells of the active cells. A cell is a leaf if its neighbourhood contains at most leaf_size departments per cell,
+        # so that a sparse cell next to a dense one is refined as well
+        ncx = cell_cx[targets,None] + near_OX
+        ncy = cell_cy[targets,None] + near_OY
+        neighbour_keys = ncx * cells_per_side + ncy
+        position = np.minimum(np.searchsorted(cell_keys, neighbour_keys), cells - 1)
+        occupied = (ncx >= 0) & (ncx < cells_per_side) & (ncy >= 0) & (ncy < cells_per_side) & (cell_keys[position] == neighbour_keys)
+        neighbourhood_count = np.sum(np.where(occupied, cell_count[position], 0), axis=1)
+        is_leaf = (neighbourhood_count <= leaf_size * len(near_OX)) | (level >= max_levels)
+        leaves = np.zeros(cells, dtype=bool)
+        leaves[targets[is_leaf]] = True
+        refined = cell_active & ~leaves
+
+        # Near field of the leaves: exact interaction with all departments in the same cell or in neighbouring cells.
+        # Pairs of two leaves are only evaluated once and added to both departments.
+        leaf_cells = targets[is_leaf]
+        position = position[is_leaf]
+        A, k = np.nonzero(occupied[is_leaf] & (~leaves[position] | half | ((near_OX == 0) & (near_OY == 0))))
+        B = position[A, k]
+        A = leaf_cells[A]
+        both = leaves[B]
+
+        # Expand the cell pairs to all pairs of their departments in the order sorted by cell
+        order = np.argsort(cell_index, kind="stable")
+        cell_start = np.cumsum(cell_count) - cell_count
+        pair_count = cell_count[A] * cell_count[B]
+        pair = np.repeat(np.arange(len(A)), pair_count)
+        within = np.arange(len(pair)) - np.repeat(np.cumsum(pair_count) - pair_count, pair_count)
+        i = within // cell_count[B][pair]
+        j = within % cell_count[B][pair]
+        distinct = (A[pair] != B[pair]) | (i < j)
+        pair = pair[distinct]
+        p = members[order[cell_start[A][pair] + i[distinct]]]
+        q = members[order[cell_start[B][pair] + j[distinct]]]
+        weight_q = both[pair]
+
+        theta_squared = 1/4 * ((w[p] + w[q])**2 + (h[p] + h[q])**2)
+        ddx = x[p] - x[q]
+        ddy = y[p] - y[q]
+        inverse_D = 1 / (ddx**2 + ddy**2)
+        near = theta_squared * inverse_D
+        near_x_grad = -2 * near * inverse_D * ddx
+        near_y_grad = -2 * near * inverse_D * ddy
+        repulsion = repulsion + np.bincount(p, weights=near, minlength=n) + np.bincount(q, weights=near*weight_q, minlength=n)
+        repulsion_x_grad = repulsion_x_grad + np.bincount(p, weights=near_x_grad, minlength=n) - np.bincount(q, weights=near_x_grad*weight_q, minlength=n)
+        repulsion_y_grad = repulsion_y_grad + np.bincount(p, weights=near_y_grad, minlength=n) - np.bincount(q, weights=near_y_grad*weight_q, minlength=n)
+
+        if not np.any(refined):
+            break
+
+        # Departments of the next level: all departments in cells within radius of a refined cell, since the children of these cells
+        # are the far and near cells of the children of the refined cells
+        refined_cells = np.flatnonzero(refined)
+        relevant = np.isin(cell_keys, ((cell_cx[refined_cells,None] + near_OX) * cells_per_side + cell_cy[refined_cells,None] + near_OY).ravel())
+        keep = relevant[cell_index]
+        active = refined[cell_index][keep]
+        members = members[keep]
+
+    # Every pair is seen from both departments, but the gradient of a department only contains its own share
+    function_value = function_value + K * (0.5*np.sum(repulsion) - n*(n-1)/2)
+    x_grad = x_grad + K * repulsion_x_grad
+    y_grad = y_grad + K * repulsion_y_grad
+
+    gradient_evaluated = np.concatenate((x_grad, y_grad)) # transform to combined vector
+
+    return function_value, gradient_evaluated
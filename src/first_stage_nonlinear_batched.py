@@ -0,0 +1,129 @@
+import time
+import pandas as pd
+import numpy as np
+from functools import partial
+from first_stage_nonlinear_gradient import first_stage_nonlinear_objective_gradient_batch
+from first_stage_start_positions import first_stage_start_positions
+from problem_instance import problem_instance
+
+def first_stage_nonlinear_batched(data_dict, Alpha, starts=1, seed_sequence=None, initializer="random"):
+    """ Executes the first stage with gradient descent from several random start positions at once and chooses the best solution.
+    In contrast to first_stage_nonlinear, all start layouts are held in one starts x 2n array and every gradient step evaluates all of them with one set of numpy operations.
+         Input: - data_dict: extract information about departments and facility, a data_dict or a ProblemInstance
+                - Alpha: for calculating param K
+                - starts: number of random start positions
+                - seed_sequence: numpy.random.SeedSequence from which every start gets its own random number generator. The start positions are the same as in first_stage_nonlinear for the same seed_sequence.
+                - initializer: start positions of the first start, "random" or "spectral", see first_stage_multistart
+         Output: - DepartmentsXYrelative: coordinates of the relative positions of the departments
+    """
+
+    instance = problem_instance(data_dict, Alpha)
+
+    n = len(instance)   #number of departments
+    w_F = instance.w_F #width of facility
+    h_F = instance.h_F #height of facility
+    DepartmentsDependencies = instance.c
+
+    # Define Start positions, one row [x_1,...,x_n,y_1,...,y_n] per start
+    if seed_sequence is None:
+        seed_sequence = np.random.SeedSequence()
+    StartPositions = np.zeros((starts, 2*n))
+    for k, start_seed in enumerate(seed_sequence.spawn(starts)):
+        rng = np.random.default_rng(start_seed)
+        StartPositions[k,:n], StartPositions[k,n:] = first_stage_start_positions(w_F, h_F, DepartmentsDependencies, rng, initializer=initializer if k == 0 else "random")
+
+    # teta_squared and K are calculated once for the instance
+    theta_squared_sym, c_sym = instance.pair_matrices()
+    objective_gradient_batch = partial(first_stage_nonlinear_objective_gradient_batch, theta_squared_sym=theta_squared_sym, c_sym=c_sym, K=instance.K)
+
+    # Calculate Optimal positions of all starts
+    OptPositions, ObjValues, iterations = first_stage_nonlinear_gradient_descent_batch(StartPositions, objective_gradient_batch)
+
+    if starts > 1:
+        print(f"Mean is {np.mean(ObjValues)} with standard derivation {np.std(ObjValues)} resulting in a gap of {round(100 * np.std(ObjValues) / np.mean(ObjValues), 2)}%")
+    if initializer != "random" and starts > 1:
+        saved = np.mean(iterations[1:]) - iterations[0]
+        print(f"The {initializer} start needed {iterations[0]} iterations, {round(saved, 1)} iterations ({round(100 * saved / max(np.mean(iterations[1:]), 1), 1)}%) less than the random starts on average. Its objective value is {ObjValues[0]}, the best random one is {np.min(ObjValues[1:])}")
+
+    # Choose best start and transform to Dataframe
+    best = np.argmin(ObjValues)
+    DepartmentsOptPosDict = {
+        "name": instance.names,
+        "x": OptPositions[best,:n].tolist(),
+        "y": OptPositions[best,n:].tolist()
+    }
+    DepartmentsXYrelative = pd.DataFrame(data=DepartmentsOptPosDict)
+
+    return DepartmentsXYrelative
+
+def first_stage_nonlinear_gradient_descent_batch(StartPositions, objective_gradient_batch, max_iters=10000, tolerance=1e-10, patience=5):
+    """ Executes the gradient descent of first_stage_nonlinear_gradient_descent for several start positions simultaneously.
+    Every start keeps its own Armijo step length and stopping criterion. Starts that have converged are masked out and not evaluated anymore.
+         Input:
+             - StartPositions: B x 2n array, every row is a start position vector [x_1,...,x_n,y_1,...,y_n]
+             - objective_gradient_batch: function mapping a k x 2n array of position vectors to their k objective values and k x 2n gradients,
+               e.g. first_stage_nonlinear_objective_gradient_batch with the precomputed instance data bound via functools.partial
+             - max_iters, tolerance, patience: maximum number of iterations and stopping criterion on the relative decrease of the objective value, as in first_stage_nonlinear_gradient_descent
+         Output:
+             - OptPositions: B x 2n array of the optimized positions
+             - ObjValues: objective values of the rows of OptPositions
+             - iters: number of iterations of every start
+    """
+
+    startSeconds = time.time()
+
+    ActualPositions = np.array(StartPositions, dtype=float)
+    B = ActualPositions.shape[0]
+
+    function_evaluated, gradient_evaluated = objective_gradient_batch(ActualPositions)
+    active = np.ones(B, dtype=bool) # starts that have not converged yet
+    iters = np.zeros(B, dtype=int)
+    small_decreases = np.zeros(B, dtype=int) # consecutive iterations with a relative decrease below tolerance
+
+    while np.any(active):
+        idx = np.flatnonzero(active)
+        SearchDirection = -gradient_evaluated[idx]
+        rate, new_function, new_gradient = ArmijoLineSearchBatch(ActualPositions[idx], SearchDirection, gradient_evaluated[idx], function_evaluated[idx], 1, objective_gradient_batch, rho=0.5, c1=1e-4)
+
+        # Gradientstep of all active starts
+        ActualPositions[idx] = ActualPositions[idx] + rate[:,None]*SearchDirection
+        old_function_evaluated = function_evaluated[idx]
+        function_evaluated[idx] = new_function
+        gradient_evaluated[idx] = new_gradient
+        iters[idx] = iters[idx] + 1
+
+        # Mask out converged starts
+        small_decrease = np.abs(old_function_evaluated - new_function) <= tolerance * np.maximum(1, np.abs(old_function_evaluated))
+        small_decreases[idx] = np.where(small_decrease, small_decreases[idx] + 1, 0)
+        active[idx] = (small_decreases[idx] < patience) & (iters[idx] < max_iters)
+
+    print('\nBatched gradient descent: {} of {} starts converged, iterations between {} and {}, time {:.2f}s, best y = {:.4f}'.format(np.sum(small_decreases >= patience), B, np.min(iters), np.max(iters), time.time() - startSeconds, np.min(function_evaluated)))
+
+    return ActualPositions, function_evaluated, iters
+
+def ArmijoLineSearchBatch(ActualPositions,SearchDirection,ActualGradient,ActualFunction,alpha0,objective_gradient_batch,rho=0.5,c1=1e-4,max_backtracks=100):
+    """ Executes the Armijo LineSearch Algorithm for all rows of ActualPositions simultaneously. Only the rows whose step length is not yet accepted are evaluated again.
+    Returns the step lengths and the function values and gradients at the accepted points.
+    As in ArmijoLineSearch, the step length of a row is shrunk at most max_backtracks times. Rows that reach it are masked out with their last step length.
+    """
+
+    derphi0 = np.sum(ActualGradient*SearchDirection, axis=1) # intermediate step
+    steplength = np.full(len(ActualPositions), float(alpha0))
+    function_evaluated = np.empty(len(ActualPositions))
+    gradient_evaluated = np.empty_like(ActualPositions)
+
+    pending = np.arange(len(ActualPositions)) # rows whose step length is not accepted yet
+    backtracks = 0 # all pending rows have been shrunk equally often
+    while len(pending):
+        NewPositions = ActualPositions[pending] + steplength[pending,None]*SearchDirection[pending]
+        phi_a0, gradient_a0 = objective_gradient_batch(NewPositions)
+        accepted = phi_a0 <= ActualFunction[pending] + c1*steplength[pending]*derphi0[pending]
+        if backtracks >= max_backtracks:
+            accepted[:] = True # mask out the rows that reached max_backtracks
+        function_evaluated[pending[accepted]] = phi_a0[accepted]
+        gradient_evaluated[pending[accepted]] = gradient_a0[accepted]
+        pending = pending[~accepted]
+        steplength[pending] = steplength[pending] * rho # shrink step length
+        backtracks = backtracks + 1
+
+    return steplength, function_evaluated, gradient_evaluated
@@ -1,68 +1,124 @@
 import numpy as np
 from import_data import unpack_data_dict
 
+def first_stage_nonlinear_K(DepartmentsDependencies, Alpha):
+    """ Calculates the repulsion constant K = Alpha * sum_{i<j} c_ij. Only needs to be calculated once per instance.
+    """
+
+    return Alpha * np.triu(DepartmentsDependencies, k=1).sum()
+
+def first_stage_nonlinear_theta_squared(w, h):
+    """ Calculates the matrix theta_squared[i,j] = 1/4 * ((w_i+w_j)^2 + (h_i+h_j)^2) for the department widths w and heights h.
+    """
+
+    w = np.asarray(w, dtype=float)
+    h = np.asarray(h, dtype=float)
+
+    return 1/4 * ((w[:,None] + w[None,:])**2 + (h[:,None] + h[None,:])**2)
+
+def first_stage_nonlinear_pair_matrices(theta_squared, DepartmentsDependencies):
+    """ Prepares theta_squared and DepartmentsDependencies for first_stage_nonlinear_objective_gradient.
+    Only the upper triangle (i<j) of both matrices enters the objective, so it is mirrored to the lower triangle and the diagonal is set to zero.
+    This only needs to be done once per instance.
+    """
+
+    n = len(DepartmentsDependencies)
+    upper = np.triu(np.ones((n,n), dtype=bool), k=1) # mask of all pairs i<j
+
+    c_sym = np.where(upper, DepartmentsDependencies, 0.0)
+    c_sym = c_sym + c_sym.T
+    theta_squared_sym = np.where(upper, theta_squared, 0.0)
+    theta_squared_sym = theta_squared_sym + theta_squared_sym.T
+
+    return theta_squared_sym, c_sym
+
+def first_stage_nonlinear_objective_gradient(ActualPositions, theta_squared_sym, c_sym, K):
+    """ Calculates the objective value and the gradient at the current position in one pass.
+        Input:
+            - ActualPositions: vector [x_1, ..., x_n, y_1, ..., y_n]
+            - theta_squared_sym, c_sym: symmetric matrices with zero diagonal, see first_stage_nonlinear_pair_matrices
+            - K: repulsion constant, see first_stage_nonlinear_K
+        Output:
+            - function_value: sum_{i<j} c_ij*D_ij + K*(theta_squared_ij/D_ij - 1), D_ij squared distance between i and j
+            - gradient_evaluated: vector [df/dx_1, ..., df/dx_n, df/dy_1, ..., df/dy_n]
+    """
+
+    n = len(c_sym)
+    x = ActualPositions[:n] # Extract x coordinates of actual positions
+    y = ActualPositions[n:] # Extract y coordinates of actual positions
+
+    # Pairwise differences and squared distance matrix, dx[i,j] = x_i - x_j
+    dx = x[:,None] - x[None,:]
+    dy = y[:,None] - y[None,:]
+    D_ij = dx**2 + dy**2
+    np.fill_diagonal(D_ij, 1) # diagonal is not used, avoid division by zero
+
+    repulsion = K * theta_squared_sym / D_ij # diagonal is zero because theta_squared_sym has zero diagonal
+
+    # Every pair appears twice in the symmetric matrices
+    function_value = 0.5 * np.sum(c_sym*D_ij + repulsion) - K * n*(n-1)/2
+
+    # df/dx_t = sum_j (2*c_tj - 2*K*theta_squared_tj/D_tj^2) * (x_t - x_j), analogously for y
+    coefficients = 2*c_sym - 2*repulsion/D_ij
+    x_grad = np.sum(coefficients*dx, axis=1)
+    y_grad = np.sum(coefficients*dy, axis=1)
+
+    gradient_evaluated = np.concatenate((x_grad, y_grad)) # transform to combined vector
+
+    return function_value, gradient_evaluated
+
 def first_stage_nonlinear_gradient(ActualPositions,theta_squared, data_dict,Alpha):
     """ Calculates the evaluated Gradient at the current position
     """
-    
-    Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
 
-    n = len(DepartmentsDependencies)
-    x = ActualPositions[range(0,n)] # Extract x coordinates of actual positions
-    y = ActualPositions[range(n,2*n)] # Extract y coordinates of actual positions
-    x_grad = np.zeros((n,))
-    y_grad = np.zeros((n,))
-
-    # Calculate distance matrix
-    D_ij = np.zeros((n,n))
-    for i in range(n):
-        for j in range(i+1,n):
-            D_ij[i,j] = (x[i]-x[j])**2 + (y[i]-y[j])**2
-    
-    #calculating K; size: 1 x 1 Array
-    K = np.zeros(shape=(1)) 
-    K = Alpha * sum(DepartmentsDependencies[i,j] for i in range(n) for j in range(n) if i<j)
-
-
-    # calculate gradient
-    for t in range(n):
-        # gradient for x_t
-        x_first_sum = sum((-2*DepartmentsDependencies[j,t]*(x[j]-x[t]) + K*(2*theta_squared[j,t]/(((x[j]-x[t])**2+(y[j]-y[t])**2)**2))*(x[j]-x[t])) for j in range(t) if j != t)
-        x_second_sum = sum((2*DepartmentsDependencies[t,j]*(x[t]-x[j]) + K*(-2*theta_squared[t,j]/(((x[t]-x[j])**2+(y[t]-y[j])**2)**2))*(x[t]-x[j])) for j in range(t,n) if j != t)
-        x_grad[t] = x_first_sum + x_second_sum
-        # gradient for y_t
-        y_first_sum = sum((-2*DepartmentsDependencies[j,t]*(y[j]-y[t]) + K*(2*theta_squared[j,t]/(((x[j]-x[t])**2+(y[j]-y[t])**2)**2))*(y[j]-y[t])) for j in range(t) if j != t)
-        y_second_sum = sum((2*DepartmentsDependencies[t,j]*(y[t]-y[j]) + K*(-2*theta_squared[t,j]/(((x[t]-x[j])**2+(y[t]-y[j])**2)**2))*(y[t]-y[j])) for j in range(t,n) if j != t)
-        y_grad[t] = y_first_sum + y_second_sum
-
-
-    gradient_evaluated = np.concatenate((x_grad, y_grad), axis=None) # transform to combined vector
-
-    
+    _, _, DepartmentsDependencies = unpack_data_dict(data_dict)
+
+    K = first_stage_nonlinear_K(DepartmentsDependencies, Alpha)
+    theta_squared_sym, c_sym = first_stage_nonlinear_pair_matrices(theta_squared, DepartmentsDependencies)
+    _, gradient_evaluated = first_stage_nonlinear_objective_gradient(ActualPositions, theta_squared_sym, c_sym, K)
+
     return gradient_evaluated
 
 def first_stage_nonlinear_objective(ActualPositions,theta_squared,data_dict,Alpha):
     """Calculates the objective value at the current position
     """
 
-    Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+    _, _, DepartmentsDependencies = unpack_data_dict(data_dict)
 
-    # preparation of objective
-    n = len(DepartmentsDependencies)
-    x = ActualPositions[range(0,n)] # Extract x coordinates of actual positions
-    y = ActualPositions[range(n,2*n)] # Extract y coordinates of actual positions
-    
-    # Calculate distance matrix
-    D_ij = np.zeros((n,n))
-    for i in range(n):
-        for j in range(i+1,n):
-            D_ij[i,j] = (x[i]-x[j])**2 + (y[i]-y[j])**2
-    
-    #calculating K; size: 1 x 1 Array
-    K = np.zeros(shape=(1)) 
-    K = Alpha * sum(DepartmentsDependencies[i,j] for i in range(n) for j in range(n) if i<j)
-
-
-    function_value = sum((DepartmentsDependencies[i,j]*D_ij[i,j] + K*(theta_squared[i,j]/D_ij[i,j] - 1)) for i in range(n) for j in range(n) if i<j)
-    
-    return function_value
\ No newline at end of file
+    K = first_stage_nonlinear_K(DepartmentsDependencies, Alpha)
+    theta_squared_sym, c_sym = first_stage_nonlinear_pair_matrices(theta_squared, DepartmentsDependencies)
+    function_value, _ = first_stage_nonlinear_objective_gradient(ActualPositions, theta_squared_sym, c_sym, K)
+
+    return function_value
+
+def first_stage_nonlinear_objective_gradient_batch(PositionsBatch, theta_squared_sym, c_sym, K):
+    """ Batched version of first_stage_nonlinear_objective_gradient that evaluates several layouts with one set of array operations.
+        Input:
+            - PositionsBatch: B x 2n array, every row is a position vector [x_1, ..., x_n, y_1, ..., y_n]
+            - theta_squared_sym, c_sym, K: see first_stage_nonlinear_objective_gradient
+        Output:
+            - function_values: array of length B with the objective values of the rows
+            - gradients_evaluated: B x 2n array with the gradients of the rows
+    """
+
+    n = len(c_sym)
+    x = PositionsBatch[:,:n] # Extract x coordinates of actual positions
+    y = PositionsBatch[:,n:] # Extract y coordinates of actual positions
+
+    # Pairwise differences and squared distance matrices, dx[b,i,j] = x_bi - x_bj
+    dx = x[:,:,None] - x[:,None,:]
+    dy = y[:,:,None] - y[:,None,:]
+    D_ij = dx**2 + dy**2
+    D_ij[:, range(n), range(n)] = 1 # diagonal is not used, avoid division by zero
+
+    repulsion = K * theta_squared_sym / D_ij
+
+    function_values = 0.5 * np.sum(c_sym*D_ij + repulsion, axis=(1,2)) - K * n*(n-1)/2
+
+    coefficients = 2*c_sym - 2*repulsion/D_ij
+    x_grad = np.sum(coefficients*dx, axis=2)
+    y_grad = np.sum(coefficients*dy, axis=2)
+
+    gradients_evaluated = np.concatenate((x_grad, y_grad), axis=1)
+
+    return function_values, gradients_evaluated
@@ -1,73 +1,178 @@
+import time
 import numpy as np
-from first_stage_nonlinear_gradient import first_stage_nonlinear_gradient
-from first_stage_nonlinear_gradient import first_stage_nonlinear_objective
 
-def first_stage_nonlinear_gradient_descent(StartPositions,theta_squared, data_dict,Alpha):
+def first_stage_nonlinear_gradient_descent(StartPositions, objective_gradient, optimizer="steepest", max_iters=10000, tolerance=1e-10, patience=5):
     """ Executes the gradient descent of the first stage
          Input:
              - StartPositions: nx2 array [x,y]
-             - DepartmentsWidthHeight: nx2 array [w,h]
-             - DepartmentsDependencies: nxn array upper triangular
-             - Alpha to specify param K
+             - objective_gradient: function mapping a position vector [x_1,...,x_n,y_1,...,y_n] to its objective value and gradient,
+               e.g. first_stage_nonlinear_objective_gradient with the precomputed instance data bound via functools.partial
+             - optimizer: how the search direction and step length are chosen
+                 - "steepest": negative gradient with Armijo line search
+                 - "heavy_ball": negative gradient plus 0.9 times the last search direction (Polyak momentum) with Armijo line search
+                 - "nesterov": Nesterov's accelerated gradient with Armijo line search, the momentum is restarted whenever the objective value increases
+                 - "adam": Adam with a fixed learning rate of 0.3% of the spread of the start positions, no line search
+                 - "lbfgs": limited-memory BFGS direction from the last 10 steps with Armijo line search
+             - max_iters: maximum number of iterations
+             - tolerance, patience: converged if the relative decrease |f_old - f_new| / max(1, |f_old|) is at most tolerance in patience consecutive iterations
+         Output:
+             - opt_positions: vector [x_1,...,x_n,y_1,...,y_n] of the optimized positions
+             - function_evaluated: objective value at opt_positions
+             - stats: dictionary with the optimizer, the number of iterations, the wall time in seconds and whether the descent converged
 
     """
-    # input: - StartPositions: nx2 array [x,y]
-    #        - DepartmentsWidthHeight: nx2 array [w,h]
-    #        - DepartmentsDependencies: nxn array upper triangular
-    #        - Alpha to specify param K
 
-    
+    startSeconds = time.time()
+
     # params for gradient descent
-    max_iters = 10000
-    tolerance = 0.00000000000001 # for difference of gradient
     iters = 0
+    small_decreases = 0 # consecutive iterations with a relative decrease below tolerance
     alpha0 = 1 # Startvalue for ArmijoLineSearch, standard value for this in literature
+    rate = alpha0
 
     ActualPositions = StartPositions.flatten('F') # transform matrix of positions into vector
     # form: [x_1, x_2, x_3,..., x_n, y_1, y_2, y_3,...., y_n]
 
-    function_evaluated = first_stage_nonlinear_objective(ActualPositions, theta_squared, data_dict, Alpha)
-    gradient_evaluated = first_stage_nonlinear_gradient(ActualPositions, theta_squared, data_dict, Alpha)
-    gradient_evaluated_norm = np.linalg.norm(gradient_evaluated)
-    gradient_difference = gradient_evaluated_norm
+    function_evaluated, gradient_evaluated = objective_gradient(ActualPositions)
+
+    # State of the optimizers with memory
+    SearchDirection = np.zeros_like(ActualPositions) # heavy_ball
+    PreviousPositions = ActualPositions # nesterov
+    nesterov_iters = 0 # nesterov, iterations since the last restart
+    first_moment = np.zeros_like(ActualPositions) # adam
+    second_moment = np.zeros_like(ActualPositions) # adam
+    learning_rate = 0.003 * max(np.std(ActualPositions), 1) # adam
+    s_list = [] # lbfgs, last steps
+    y_list = [] # lbfgs, last differences of the gradients
 
     print('Initial condition: y = {:.4f}, x = {} \n'.format(function_evaluated, ActualPositions))
 
-    while gradient_difference > tolerance and iters < max_iters:
-        old_function_evaluated = gradient_evaluated_norm
-        SearchDirection = -gradient_evaluated
-        rate, function_evaluated = ArmijoLineSearch(ActualPositions,SearchDirection,gradient_evaluated,function_evaluated,alpha0,theta_squared,data_dict,Alpha,rho=0.5,c1=1e-4)
-        ActualPositions = ActualPositions + rate*SearchDirection # Gradientstep
-        gradient_evaluated = first_stage_nonlinear_gradient(ActualPositions, theta_squared, data_dict, Alpha)
-        gradient_evaluated_norm = np.linalg.norm(gradient_evaluated)
-        gradient_difference = np.abs(old_function_evaluated-gradient_evaluated_norm)
+    while small_decreases < patience and iters < max_iters:
+        old_function_evaluated = function_evaluated
+
+        if optimizer == "steepest":
+            SearchDirection = -gradient_evaluated
+            rate, function_evaluated, gradient_evaluated = ArmijoLineSearch(ActualPositions,SearchDirection,gradient_evaluated,function_evaluated,alpha0,objective_gradient,rho=0.5,c1=1e-4)
+            ActualPositions = ActualPositions + rate*SearchDirection # Gradientstep
+
+        elif optimizer == "heavy_ball":
+            SearchDirection = -gradient_evaluated + 0.9*SearchDirection
+            if np.dot(SearchDirection, gradient_evaluated) >= 0: # momentum points uphill, restart
+                SearchDirection = -gradient_evaluated
+            rate, function_evaluated, gradient_evaluated = ArmijoLineSearch(ActualPositions,SearchDirection,gradient_evaluated,function_evaluated,min(alpha0, 2*rate),objective_gradient,rho=0.5,c1=1e-4)
+            ActualPositions = ActualPositions + rate*SearchDirection
+
+        elif optimizer == "nesterov":
+            # Gradient step from the extrapolated point
+            ExtrapolatedPositions = ActualPositions + nesterov_iters/(nesterov_iters + 3) * (ActualPositions - PreviousPositions)
+            extrapolated_function, extrapolated_gradient = objective_gradient(ExtrapolatedPositions)
+            SearchDirection = -extrapolated_gradient
+            rate, new_function, new_gradient = ArmijoLineSearch(ExtrapolatedPositions,SearchDirection,extrapolated_gradient,extrapolated_function,min(alpha0, 2*rate),objective_gradient,rho=0.5,c1=1e-4)
+            if new_function <= function_evaluated:
+                PreviousPositions = ActualPositions
+                ActualPositions = ExtrapolatedPositions + rate*SearchDirection
+                function_evaluated, gradient_evaluated = new_function, new_gradient
+                nesterov_iters = nesterov_iters + 1
+            else:
+                # Adaptive restart: forget the momentum and do a plain gradient step
+                SearchDirection = -gradient_evaluated
+                rate, function_evaluated, gradient_evaluated = ArmijoLineSearch(ActualPositions,SearchDirection,gradient_evaluated,function_evaluated,alpha0,objective_gradient,rho=0.5,c1=1e-4)
+                ActualPositions = ActualPositions + rate*SearchDirection
+                PreviousPositions = ActualPositions
+                nesterov_iters = 0
+
+        elif optimizer == "adam":
+            first_moment = 0.9*first_moment + 0.1*gradient_evaluated
+            second_moment = 0.999*second_moment + 0.001*gradient_evaluated**2
+            first_moment_hat = first_moment / (1 - 0.9**(iters+1)) # bias correction
+            second_moment_hat = second_moment / (1 - 0.999**(iters+1))
+            ActualPositions = ActualPositions - learning_rate*first_moment_hat/(np.sqrt(second_moment_hat) + 1e-8)
+            function_evaluated, gradient_evaluated = objective_gradient(ActualPositions)
+
+        elif optimizer == "lbfgs":
+            SearchDirection = -lbfgs_direction(gradient_evaluated, s_list, y_list)
+            if np.dot(SearchDirection, gradient_evaluated) >= 0: # no descent direction, forget the curvature information
+                s_list, y_list = [], []
+                SearchDirection = -gradient_evaluated
+            rate, new_function, new_gradient = ArmijoLineSearch(ActualPositions,SearchDirection,gradient_evaluated,function_evaluated,alpha0,objective_gradient,rho=0.5,c1=1e-4)
+            s = rate*SearchDirection
+            y = new_gradient - gradient_evaluated
+            if np.dot(s, y) > 1e-10 * np.linalg.norm(s) * np.linalg.norm(y): # only keep pairs with positive curvature
+                s_list.append(s)
+                y_list.append(y)
+                if len(s_list) > 10:
+                    s_list.pop(0)
+                    y_list.pop(0)
+            ActualPositions = ActualPositions + s
+            function_evaluated, gradient_evaluated = new_function, new_gradient
+
+        else:
+            raise ValueError('Wrong usage of "optimizer". Set it to "steepest", "heavy_ball", "nesterov", "adam", or "lbfgs".')
+
         iters = iters + 1
+        if np.abs(old_function_evaluated - function_evaluated) <= tolerance * max(1, np.abs(old_function_evaluated)):
+            small_decreases = small_decreases + 1
+        else:
+            small_decreases = 0
         #print('Iteration: {} \t y = {:.4f}, x = {}, gradient = {:.4f}'.
-        #      format(iters, function_evaluated, ActualPositions, gradient_evaluated_norm))
+        #      format(iters, function_evaluated, ActualPositions, np.linalg.norm(gradient_evaluated)))
 
-    if iters == max_iters:
-            print('\nGradient descent does not converge.')
+    seconds = time.time() - startSeconds
+    converged = small_decreases >= patience
+    if not converged:
+            print('\nGradient descent ({}) does not converge within {} iterations ({:.2f}s).'.format(optimizer, iters, seconds))
     else:
-        print('\nSolution: \t Iteration: {}, y = {:.4f}, x = {}'.format(iters, function_evaluated, ActualPositions))
+        print('\nSolution: \t Optimizer: {}, Iteration: {}, Time: {:.2f}s, y = {:.4f}, x = {}'.format(optimizer, iters, seconds, function_evaluated, ActualPositions))
 
     opt_positions = ActualPositions
+    stats = {
+        "optimizer": optimizer,
+        "iterations": iters,
+        "seconds": seconds,
+        "converged": converged,
+    }
+
+    return opt_positions, function_evaluated, stats
+
+def lbfgs_direction(gradient, s_list, y_list):
+    """ Two-loop recursion of L-BFGS, approximates the inverse Hessian times gradient from the last steps s and gradient differences y.
+    """
+
+    q = gradient.copy()
+    rhos = [1 / np.dot(y, s) for s, y in zip(s_list, y_list)]
+    alphas = []
+    for s, y, rho in reversed(list(zip(s_list, y_list, rhos))):
+        alpha = rho * np.dot(s, q)
+        q = q - alpha*y
+        alphas.append(alpha)
+    alphas.reverse()
+    if s_list:
+        q = q * np.dot(s_list[-1], y_list[-1]) / np.dot(y_list[-1], y_list[-1]) # scaling of the initial Hessian approximation
+    for s, y, rho, alpha in zip(s_list, y_list, rhos, alphas):
+        beta = rho * np.dot(y, q)
+        q = q + (alpha - beta)*s
 
-    return opt_positions
+    return q
 
-def ArmijoLineSearch(ActualPositions,SearchDirection,ActualGradient,ActualFunction,alpha0,theta_squared,data_dict,Alpha,rho=0.5,c1=1e-4):
-    """ Executes the Armijo LineSearch Algorithm for generating the step length of the gradient descent method
+def ArmijoLineSearch(ActualPositions,SearchDirection,ActualGradient,ActualFunction,alpha0,objective_gradient,rho=0.5,c1=1e-4,max_backtracks=100):
+    """ Executes the Armijo LineSearch Algorithm for generating the step length of the gradient descent method.
+    Also returns the gradient at the accepted point, which the fused objective_gradient kernel computes anyway.
+    The step length is shrunk at most max_backtracks times, which is only reached if objective_gradient is approximate and not exactly consistent with its gradient.
     """
 
     derphi0 = np.dot(ActualGradient, SearchDirection) # intermediate step
     NewPositions = ActualPositions + alpha0*SearchDirection # intermediate step
-    phi_a0 = first_stage_nonlinear_objective(NewPositions,theta_squared,data_dict,Alpha) # function value when going with length alpha0 in Searchdirection
+    phi_a0, gradient_a0 = objective_gradient(NewPositions) # function value when going with length alpha0 in Searchdirection
 
-    while not phi_a0 <= ActualFunction + c1*alpha0*derphi0:
+    backtracks = 0
+    while not phi_a0 <= ActualFunction + c1*alpha0*derphi0 and backtracks < max_backtracks:
         alpha0 = alpha0 * rho # shrink step length
+        backtracks = backtracks + 1
         NewPositions = ActualPositions + alpha0*SearchDirection
-        phi_a0 = first_stage_nonlinear_objective(NewPositions,theta_squared,data_dict,Alpha) # function value when going with new length alpha0 in Searchdirection
+        phi_a0, gradient_a0 = objective_gradient(NewPositions) # function value when going with new length alpha0 in Searchdirection
 
     steplength = alpha0
     function_evaluated = phi_a0
+    gradient_evaluated = gradient_a0
 
-    return steplength, function_evaluated
\ No newline at end of file
+    return steplength, function_evaluated, gradient_evaluated
@@ -1,130 +1,118 @@
+import time
 import pandas as pd
 import numpy as np
-from scipy.optimize import minimize
-from import_data import unpack_data_dict
+from functools import partial
+from scipy.optimize import minimize, Bounds
+from problem_instance import problem_instance
+from first_stage_start_positions import first_stage_start_positions
+from first_stage_multistart import first_stage_multistart
 
 
 
-def first_stage_scipy_minimize(data_dict, Alpha):
-    """Iteratively calls the first stage nonlinear optimization problem and chooses the best solution."""
+def first_stage_scipy_minimize(data_dict, Alpha, scipy_method="SLSQP", starts=1, workers=1, seed_sequence=None, initializer="random"):
+    """Calls the first stage nonlinear optimization problem from several random start positions and chooses the best solution.
+    scipy_method is passed on to scipy.optimize.minimize, see first_stage_iteration. starts, workers, seed_sequence and initializer are passed on to first_stage_multistart."""
 
-    n = 1  # Number of iterations
-    ObjValues = []  # Array in which we record the objective values of the iterations
-    ObjValue = -1
+    DepartmentsXYrelative_list, _ = first_stage_multistart(first_stage_iteration, problem_instance(data_dict, Alpha), Alpha, starts=starts, workers=workers, seed_sequence=seed_sequence, initializer=initializer, scipy_method=scipy_method)
 
-    for i in range(n):
-        prevObjValue = ObjValue
-        DepartmentsXYrelativeTemp, ObjValue = first_stage_iteration(data_dict, Alpha)
-        if(ObjValue < prevObjValue or prevObjValue == -1):
-            DepartmentsXYrelative = DepartmentsXYrelativeTemp
-        ObjValues.append(ObjValue)
+    return DepartmentsXYrelative_list[0]
 
-    # Messages for debugging purposes
-    #print("Objective values are", ObjValues)
-    if n > 1:
-        print(f"Mean is {np.mean(ObjValues)} with standard derivation {np.std(ObjValues)} resulting in a gap of {round(100 * np.std(ObjValues) / np.mean(ObjValues), 2)}%")
 
-    return DepartmentsXYrelative
 
+def first_stage_objective_gradient(params, theta_squared_sym, c_sym, K):
+    """Objective function of the attractor-repeller problem with euclidean distances and its analytic gradient (used as jac for scipy.optimize.minimize).
+    params has the form [x_1, ..., x_n, y_1, ..., y_n], theta_squared_sym and c_sym are prepared by first_stage_nonlinear_pair_matrices."""
 
+    n = len(c_sym)
+    x = params[:n]
+    y = params[n:]
 
-def first_stage_iteration(data_dict, Alpha):
-    """Actually solves the nonlinear attractor-repeller optimization problem (without non-overlap constraints) using scipy.optimize.minimize."""
+    # Calculate matrix D of euclidean distances, dx[i,j] = x_i - x_j
+    dx = x[:,None] - x[None,:]
+    dy = y[:,None] - y[None,:]
+    D = np.sqrt(dx**2 + dy**2)
+    np.fill_diagonal(D, 1)  # diagonal is not used, avoid division by zero
 
-    ##############  Import constants  ##############
+    repulsion = K * theta_squared_sym / D
 
-    Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+    # Every pair appears twice in the symmetric matrices
+    ObjValue = 0.5 * np.sum(c_sym * D + repulsion) - K * n*(n-1)/2
 
-    n = len(Departments)   #number of departments
-    w_F = float(Facility.iloc[0]['w']) #width of facility 
-    h_F = float(Facility.iloc[0]['h']) #height of facility 
-    w = Departments["w"].to_numpy()  #converting the width of the departments into an numpy array of length n
-    h = Departments["h"].to_numpy()  #converting the height of the departments into an numpy array of length n
-    c = DepartmentsDependencies #numpy-Array with the Dependencies between the departments, n rows and n columns
+    # df/dx_t = sum_j (c_tj - K*theta_squared_tj/D_tj^2) * (x_t - x_j)/D_tj, analogously for y
+    coefficients = (c_sym - repulsion / D) / D
+    x_grad = np.sum(coefficients * dx, axis=1)
+    y_grad = np.sum(coefficients * dy, axis=1)
 
+    return ObjValue, np.concatenate((x_grad, y_grad))
 
 
-    ##############  Preprocessing for the objective function  ##############
 
-    #calculating the thetas; size: n x n array
-    theta_squared = np.zeros(shape=(n,n))
-    for i in range(n):
-        for j in range(n):
-            theta_squared[i,j] = 1/4 * ((w[i]+w[j])**2 + (h[i]+h[j])**2)
+def first_stage_iteration(instance, Alpha, scipy_method="SLSQP", rng=None, initializer="random"):
+    """Actually solves the nonlinear attractor-repeller optimization problem (without non-overlap constraints) using scipy.optimize.minimize.
+    The analytic gradient is passed as jac and the facility containment is expressed as box bounds on the coordinates, so scipy_method can be any bound-constrained method, e.g. "SLSQP", "L-BFGS-B" or "trust-constr".
+    The start position is drawn from rng (a numpy.random.Generator), or from a fresh unseeded generator if rng is None, with the initializer "random" or "spectral", see first_stage_start_positions.
+    instance is the ProblemInstance, which already holds K for Alpha.
+    Returns the relative layout, its objective value and a dictionary with the number of iterations and the wall time of scipy.optimize.minimize."""
 
-    #calculating K; size: 1 x 1 Array
-    K = np.zeros(shape=(1)) 
-    K = Alpha * sum(c[i,j] for i in range(n) for j in range(n) if i<j)
+    ##############  Import constants  ##############
 
+    n = len(instance)   #number of departments
+    w_F = instance.w_F #width of facility 
+    h_F = instance.h_F #height of facility 
+    w = instance.w  #width of the departments, numpy array of length n
+    h = instance.h  #height of the departments, numpy array of length n
+    c = instance.c #numpy-Array with the Dependencies between the departments, n rows and n columns
 
 
-    ##############  Objective function  ##############
 
-    def objective(params):
-        params = params.reshape(2, n)
-        x = params[0]
-        y = params[1]
-        # Calculate matrix D
-        D = np.zeros((n, n))
-        for i in range(n):
-            for j in range(n):
-                D[i,j] = np.sqrt((x[i] - x[j])**2 + (y[i] - y[j])**2)
+    ##############  Preprocessing for the objective function  ##############
 
-        return sum([c[i,j] * D[i,j] + K * (theta_squared[i,j]/D[i,j] - 1) for i in range(n) for j in range(n) if i<j])
+    # thetas and K are calculated once for the instance
+    theta_squared_sym, c_sym = instance.pair_matrices()
+    K = instance.K
+
+
+
+    ##############  Objective function  ##############
+
+    objective = partial(first_stage_objective_gradient, theta_squared_sym=theta_squared_sym, c_sym=c_sym, K=K)
 
 
 
     ##############  Constraints  ##############
 
-    cons = []
-
-    for i in range(n):
-        #def f1(params, i=i):
-        def f1(params):
-            params = params.reshape(2, n)
-            x = params[0]
-            y = params[1]
-            return 1/2 * (float(w[i]) - w_F) - x[i]
-        cons.append({'type': 'ineq', 'fun': f1})
-        #def f2(params, i=i):
-        def f2(params):
-            params = params.reshape(2, n)
-            x = params[0]
-            y = params[1]
-            return x[i] - 1/2 * (w_F - float(w[i]))
-        cons.append({'type': 'ineq', 'fun': f2})
-        #def f3(params, i=i):
-        def f3(params):
-            params = params.reshape(2, n)
-            x = params[0]
-            y = params[1]
-            return 1/2 * (float(h[i]) - h_F) - y[i]
-        cons.append({'type': 'ineq', 'fun': f3})
-        #def f4(params, i=i):
-        def f4(params):
-            params = params.reshape(2, n)
-            x = params[0]
-            y = params[1]
-            return y[i] - 1/2 * (h_F - float(h[i]))
-        cons.append({'type': 'ineq', 'fun': f4})
+    # Every department has to lie inside the facility: 1/2 * (w_i - w_F) <= x_i <= 1/2 * (w_F - w_i), analogously for y.
+    # A department that is larger than the facility in one direction is fixed to the center in that direction.
+    x_lb = np.minimum(1/2 * (w - w_F), 0)
+    x_ub = np.maximum(1/2 * (w_F - w), 0)
+    y_lb = np.minimum(1/2 * (h - h_F), 0)
+    y_ub = np.maximum(1/2 * (h_F - h), 0)
+    bounds = Bounds(np.concatenate((x_lb, y_lb)), np.concatenate((x_ub, y_ub)))
 
 
 
     ##############  Output  ##############
 
-    #np.random.seed(17)
-    x0 = np.random.uniform(low=-1/2 * w_F, high=1/2 * w_F , size=(n,)).astype(float)
-    y0 = np.random.uniform(low=-1/2 * h_F, high=1/2 * h_F , size=(n,)).astype(float)
+    if rng is None:
+        rng = np.random.default_rng()
+    x0, y0 = first_stage_start_positions(w_F, h_F, c, rng, initializer=initializer)
 
-    params = np.concatenate((x0, y0))
+    params = np.clip(np.concatenate((x0, y0)), bounds.lb, bounds.ub)
 
     options = {
         "maxiter": 10**2,
         "disp": False
     }
 
-    sol = minimize(objective, params, method='SLSQP', constraints=cons, options=options)
+    startSeconds = time.time()
+    sol = minimize(objective, params, method=scipy_method, jac=True, bounds=bounds, options=options)
     #print(sol)
+    stats = {
+        "optimizer": scipy_method,
+        "iterations": sol.get("nit", 0),
+        "seconds": time.time() - startSeconds,
+        "converged": bool(sol["success"]),
+    }
 
     output = sol["x"]
     output = np.array(output).reshape(2, n)
@@ -137,14 +125,14 @@ def first_stage_iteration(data_dict, Alpha):
     # Create DataFrames for Output
 
     DepartmentsXYrelativeDict = {
+        "name": instance.names,
         "x": x,
         "y": y
     }
 
     DepartmentsXYrelative = pd.DataFrame(data=DepartmentsXYrelativeDict)
-    DepartmentsXYrelative = pd.merge(Departments["name"], DepartmentsXYrelative, left_index=True, right_index=True)
     ObjValue = sol["fun"]
 
-    return DepartmentsXYrelative, ObjValue
+    return DepartmentsXYrelative, ObjValue, stats
 
 
@@ -0,0 +1,72 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator, eigsh
+
+def first_stage_start_positions(w_F, h_F, DepartmentsDependencies, rng, initializer="random"):
+    """ Draws the start positions of the first stage.
+         Input: - w_F, h_F: width and height of the facility
+                - DepartmentsDependencies: (upper triangular) transport costs between the departments
+                - rng: numpy.random.Generator
+                - initializer:
+                    - "random" draws every department uniformly in the facility
+                    - "spectral" places the departments with first_stage_spectral_positions, so departments with high transport costs start close to each other
+         Output: - x_Dep, y_Dep: arrays with the x and y coordinates of the departments
+    """
+
+    n = len(DepartmentsDependencies)
+    if initializer == "spectral":
+        return first_stage_spectral_positions(w_F, h_F, DepartmentsDependencies, rng)
+    if initializer != "random":
+        raise ValueError('Wrong usage of "initializer". Set it to "random" or "spectral".')
+
+    x_Dep = rng.uniform(low=-1/2 * w_F, high=1/2 * w_F, size=(n,)).astype(float) # random positions in range of facility width
+    y_Dep = rng.uniform(low=-1/2 * h_F, high=1/2 * h_F, size=(n,)).astype(float) # random positions in range of facility height
+
+    return x_Dep, y_Dep
+
+def first_stage_spectral_positions(w_F, h_F, DepartmentsDependencies, rng, jitter=0.05, dense_size=200):
+    """ Embeds the departments with the two smallest nontrivial eigenvectors of the Laplacian L = D - C of the flow graph (spectral layout),
+    scaled to 90% of the facility. These eigenvectors minimize sum_{i<j} c_ij * ||p_i - p_j||^2, the attraction term of the first stage,
+    among all centered layouts of unit spread, so the start has few crossings to untangle.
+    To keep the embedding well defined for disconnected flow graphs, 1e-3 times the mean degree divided by n times the Laplacian of the complete graph is added.
+    Departments with identical coordinates (e.g., without any transport costs) are separated by a random offset of jitter times the facility size.
+         Input: - w_F, h_F: width and height of the facility
+                - DepartmentsDependencies: (upper triangular) transport costs between the departments
+                - rng: numpy.random.Generator for the offsets and the start vector of the eigensolver
+                - dense_size: up to this number of departments, the dense eigensolver is used. Otherwise the sparse Lanczos solver
+                  only needs products with L, i.e., O(nnz) per iteration.
+         Output: - x_Dep, y_Dep: arrays with the x and y coordinates of the departments
+    """
+
+    n = len(DepartmentsDependencies)
+    if n < 3:
+        return first_stage_start_positions(w_F, h_F, DepartmentsDependencies, rng)
+
+    C = sp.triu(sp.csr_matrix(np.asarray(DepartmentsDependencies, dtype=float)), k=1)
+    C = (C + C.T).tocsr()
+    degree = np.asarray(C.sum(axis=1)).ravel()
+    epsilon = 1e-3 * max(np.mean(degree), 1) / n
+
+    if n <= dense_size:
+        L = np.diag(degree) - C.toarray() + epsilon * (n*np.eye(n) - np.ones((n,n)))
+        _, eigenvectors = np.linalg.eigh(L)
+        X = eigenvectors[:, 1:3]
+    else:
+        # The smallest eigenvalues of L are the largest of shift*I - L, for which Lanczos converges without factorizing L.
+        # By Gershgorin, all eigenvalues of the regularized L are at most shift.
+        shift = 2*np.max(degree) + 2*epsilon*n
+        def matvec(v):
+            v = np.ravel(v)
+            return shift*v - (degree*v - C @ v + epsilon*(n*v - np.sum(v)))
+        M = LinearOperator((n, n), matvec=matvec, dtype=float)
+        eigenvalues, eigenvectors = eigsh(M, k=3, which="LA", v0=rng.uniform(-1, 1, n))
+        order = np.argsort(-eigenvalues) # descending, the first one is the constant vector
+        X = eigenvectors[:, order[1:3]]
+
+    # Scale to the facility
+    X = X - np.mean(X, axis=0)
+    X = X / np.maximum(np.max(np.abs(X), axis=0), 1e-12)
+    x_Dep = 0.9 * 1/2 * w_F * X[:,0] + rng.uniform(-jitter, jitter, n) * w_F
+    y_Dep = 0.9 * 1/2 * h_F * X[:,1] + rng.uniform(-jitter, jitter, n) * h_F
+
+    return x_Dep, y_Dep
@@ -0,0 +1,78 @@
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+from import_data import unpack_data_dict
+from milp_model import milp_layout_model, milp_layout_non_overlap
+
+def full_model_highs(data_dict, rotation=True):
+    """
+    Solves the whole optimization problem (the model of first_model.py, or of first_model_no_rot.py if rotation is False) with the open source solver HiGHS
+    through scipy.optimize.milp instead of Gurobi. The relative positions alpha and beta are binary variables, the non-overlap constraint of a pair is only
+    active if its alpha (beta) is 1. Instead of w_F_hat * (1 - alpha[i,j]) this uses the big M max(w_F, h_F) * (1 - alpha[i,j]), which keeps the model linear
+    and does not cut off any layout, because two departments inside the facility are never further apart than the facility is wide (high).
+        Input:
+            - data_dict: extract information about departments and facility
+            - rotation: False to forbid rotations of departments and the facility
+        Output:
+            - DepartmentsXY: DataFrame with the x- and y-coordinates of the departments
+            - data_dict: data_dict with the widths and heights of the solution
+    """
+
+    Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+
+    n = len(Departments)   #number of departments
+    w = Departments["w"].to_numpy(dtype=float)
+    h = Departments["h"].to_numpy(dtype=float)
+    w_F = float(Facility.iloc[0]['w'])
+    h_F = float(Facility.iloc[0]['h'])
+
+    # Pairs i<j in the order of np.triu_indices and all pairs i != j
+    I, J = np.triu_indices(n, k=1)
+    P, Q = np.nonzero(~np.eye(n, dtype=bool))
+    c_pairs = np.asarray(DepartmentsDependencies, dtype=float)[I, J]
+    I_flow, J_flow, c_flow = I[c_pairs > 0], J[c_pairs > 0], c_pairs[c_pairs > 0]
+
+    model, variables = milp_layout_model(w, h, w_F, h_F, I_flow, J_flow, c_flow, rotation=rotation)
+
+    # alpha[k] = 1 if department P[k] is left of Q[k], beta[k] = 1 if department P[k] is below Q[k]
+    alpha = model.add_variables(len(P), ub=1, integer=True)
+    beta = model.add_variables(len(P), ub=1, integer=True)
+
+    #non-overlap constraints
+    M = max(w_F, h_F)
+    milp_layout_non_overlap(model, variables, w, h, P, Q, "x", indicator=alpha, M=M)
+    milp_layout_non_overlap(model, variables, w, h, P, Q, "y", indicator=beta, M=M)
+
+    #Alpha Beta constraints, alpha[i,j] + alpha[j,i] + beta[i,j] + beta[j,i] == 1 for i<j
+    index = -np.ones((n, n), dtype=int)
+    index[P, Q] = np.arange(len(P))
+    k = np.arange(len(I))
+    Pairs = sp.csr_matrix((np.ones(2*len(I)), (np.concatenate((k, k)), np.concatenate((index[I, J], index[J, I])))), shape=(len(I), len(P)))
+    model.add_constraints([(alpha, Pairs), (beta, Pairs)], 1, 1)
+
+    #Optimizing
+    result = model.solve()
+    if result.status != 0:
+        raise ValueError('Model does not have an optimal value.')
+
+    ansX = result.x[variables["x"]]
+    ansY = result.x[variables["y"]]
+    ansr = np.round(result.x[variables["r"]])
+    ansr_F = np.round(result.x[variables["r_F"]][0])
+
+    DepartmentsXY = pd.DataFrame(data={"x": ansX, "y": ansY})
+    DepartmentsXY = pd.merge(Departments["name"], DepartmentsXY, left_index=True, right_index=True)
+
+    # setting new widh and hight for departments and facility as rotations might occur
+    Departments["w"] = (ansr*w) + (1-ansr)*h
+    Departments["h"] = (1-ansr)*w + ansr*h
+    Facility["w"] = (ansr_F*w_F) + (1-ansr_F)*h_F
+    Facility["h"] = (1-ansr_F)*w_F + ansr_F*h_F
+
+    data_dict = {
+        "Departments": Departments,
+        "Facility": Facility,
+        "DepartmentsDependencies": DepartmentsDependencies,
+    }
+
+    return DepartmentsXY, data_dict
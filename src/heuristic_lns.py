@@ -0,0 +1,181 @@
+import os
+import time
+import numpy as np
+import scipy.sparse as sp
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from problem_instance import ProblemInstance, LayoutResult
+from relation_graph import relation_graph_reduction
+from milp_model import milp_layout_model, milp_layout_non_overlap
+from second_stage_presolve import second_stage_presolve
+
+def heuristic_lns(data_dict, DepartmentsXYoptimal, DepartmentsAlpha, DepartmentsBeta, obj_val, time_limit=10, neighbourhood_size=2, neighbourhood="mixed", workers=1, seed_sequence=None, patience=10, repair_time_limit=5):
+    """
+    Large neighbourhood search over the relative positions, a postprocessing heuristic like heuristic_relpos_loop.
+    In every round, the relative positions of all pairs with at least one department of a small neighbourhood are destroyed and repaired by
+    heuristic_lns_repair: a restricted second stage, in which the relative positions of these pairs are binary variables (as in full_model_highs)
+    and all other pairs keep their relative positions. The current layout is a solution of the restricted second stage, so a repair never makes it worse.
+    Every round repairs `workers` neighbourhoods of the same layout in parallel and continues with the best repaired layout.
+    The repairs are solved with HiGHS, which needs no license, so any number of them can run at the same time.
+        Input:
+            - data_dict: data_dict of the layout, with the widths and heights of the departments in their current orientation
+            - DepartmentsXYoptimal: DataFrame with the coordinates of the departments
+            - DepartmentsAlpha, DepartmentsBeta: relative positions of the layout
+            - obj_val: objective value of the layout
+            - time_limit: time budget in seconds
+            - neighbourhood_size: number of departments of a neighbourhood
+            - neighbourhood: how the departments of a neighbourhood are chosen, starting from a random department
+                - "flow": the departments with the highest transport costs to the neighbourhood so far
+                - "spatial": the departments closest to it in the layout
+                - "mixed": alternately "flow" and "spatial"
+            - workers: number of neighbourhoods repaired in parallel in every round, 0 uses all available cores. 1 repairs them in this process.
+            - seed_sequence: numpy.random.SeedSequence of the random departments the neighbourhoods start from
+            - patience: stop after this many rounds in a row without improvement
+            - repair_time_limit: time limit of a single repair in seconds (at most the remaining time budget). If it is reached, the best solution
+              HiGHS found so far is used.
+        Output:
+            - DepartmentsAlpha, DepartmentsBeta: relative positions of the best layout
+            - DepartmentsXYoptimal: DataFrame with the coordinates of the best layout
+            - data_dict: data_dict with the widths and heights of the best layout (new DataFrames, the given data_dict is not changed)
+            - obj_val: objective value of the best layout
+    """
+
+    startSeconds = time.time()
+
+    instance = ProblemInstance.from_data_dict(data_dict)
+    n = len(instance)
+    neighbourhood_size = min(neighbourhood_size, n)
+    if workers == 0:
+        workers = os.cpu_count()
+    rng = np.random.default_rng(seed_sequence)
+    c_sym = instance.c + instance.c.T
+
+    DepartmentsAlpha = np.asarray(DepartmentsAlpha).copy()
+    DepartmentsBeta = np.asarray(DepartmentsBeta).copy()
+    x = DepartmentsXYoptimal["x"].to_numpy(dtype=float)
+    y = DepartmentsXYoptimal["y"].to_numpy(dtype=float)
+    best_result = None
+    obj_val_before = obj_val
+    rounds = 0
+    rounds_without_improvement = 0
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while rounds_without_improvement < patience and neighbourhood_size >= 2:
+            remaining = time_limit - (time.time() - startSeconds)
+            if remaining <= 0:
+                break
+
+            # Neighbourhoods of this round, each starting from a different random department
+            neighbourhoods = []
+            for k, start in enumerate(rng.choice(n, size=min(workers, n), replace=False)):
+                kind = neighbourhood if neighbourhood != "mixed" else ("flow", "spatial")[(rounds + k) % 2]
+                neighbourhoods.append(heuristic_lns_neighbourhood(start, neighbourhood_size, kind, x, y, c_sym))
+
+            if executor is None:
+                repairs = [heuristic_lns_repair(instance, DepartmentsAlpha, DepartmentsBeta, min(repair_time_limit, remaining), free) for free in neighbourhoods]
+            else:
+                repairs = list(executor.map(heuristic_lns_repair, repeat(instance), repeat(DepartmentsAlpha), repeat(DepartmentsBeta), repeat(min(repair_time_limit, remaining)), neighbourhoods))
+
+            # Continue with the best repair, if it is better than the current layout
+            rounds += 1
+            rounds_without_improvement += 1
+            for repair in repairs:
+                if repair is not None and repair[0].obj_val < obj_val - 1e-6 * max(abs(obj_val), 1):
+                    best_result, DepartmentsAlpha, DepartmentsBeta = repair
+                    obj_val = best_result.obj_val
+                    x, y = best_result.x, best_result.y
+                    rounds_without_improvement = 0
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print(f"LNS: {rounds} rounds of {min(workers, n)} neighbourhoods of {neighbourhood_size} departments took {time.time() - startSeconds:.2f}s, objective value {obj_val} (before: {obj_val_before})")
+
+    if best_result is None:
+        return DepartmentsAlpha, DepartmentsBeta, DepartmentsXYoptimal, data_dict, obj_val
+    DepartmentsXYoptimal, data_dict, obj_val = best_result.solution(data_dict)
+
+    return DepartmentsAlpha, DepartmentsBeta, DepartmentsXYoptimal, data_dict, obj_val
+
+def heuristic_lns_neighbourhood(start, size, kind, x, y, c_sym):
+    """
+    Neighbourhood of size departments starting from the department start.
+    kind "flow" adds the department with the highest transport costs to the neighbourhood so far, "spatial" the departments closest to start.
+    """
+
+    if kind == "spatial":
+        distance = np.abs(x - x[start]) + np.abs(y - y[start])
+        return np.argsort(distance, kind="stable")[:size]
+
+    free = [start]
+    costs = c_sym[start].astype(float)
+    costs[start] = -np.inf
+    for _ in range(size - 1):
+        # ties (e.g. no transport costs at all) are broken by the distance to start
+        candidates = np.flatnonzero(costs == costs.max())
+        j = candidates[np.argmin(np.abs(x[candidates] - x[start]) + np.abs(y[candidates] - y[start]))]
+        free.append(j)
+        costs = costs + c_sym[j]
+        costs[free] = -np.inf
+
+    return np.array(free)
+
+def heuristic_lns_repair(instance, DepartmentsAlpha, DepartmentsBeta, time_limit, free):
+    """
+    Restricted second stage of heuristic_lns: the pairs with at least one department in free get binary relative positions alpha and beta
+    with the big M non-overlap constraints of full_model_highs, all other pairs keep the relative positions DepartmentsAlpha and DepartmentsBeta.
+    So the departments in free can be moved anywhere, while the others can only shift. Only the departments in free can be rotated.
+    Defined on module level so it can be sent to worker processes.
+        Output:
+            - (LayoutResult, DepartmentsAlpha, DepartmentsBeta) of the repaired layout, None if HiGHS found no solution within time_limit
+    """
+
+    n = len(instance)
+    w, h, w_F, h_F = instance.w, instance.h, instance.w_F, instance.h_F
+    is_free = np.zeros(n, dtype=bool)
+    is_free[free] = True
+
+    model, variables = milp_layout_model(w, h, w_F, h_F, instance.I, instance.J, instance.c_pairs)
+    # Only the departments of the neighbourhood can be rotated, the others and the facility keep their current orientation (r = 1)
+    r_lb, r_ub, _, _, _ = second_stage_presolve(w, h, w_F, h_F)
+    model.set_bounds(variables["r"], np.where(is_free, r_lb, 1), np.where(is_free, r_ub, 1))
+    model.set_bounds(variables["r_F"], 1, 1)
+
+    # Kept relative positions of all other pairs, only the edges of the transitive reduction as in SecondStageModel
+    for Relation, axis in ((DepartmentsAlpha, "x"), (DepartmentsBeta, "y")):
+        Relation_kept = np.asarray(Relation).copy()
+        Relation_kept[is_free, :] = 0
+        Relation_kept[:, is_free] = 0
+        I, J = relation_graph_reduction(Relation_kept, fallback=True)
+        milp_layout_non_overlap(model, variables, w, h, I, J, axis)
+
+    # Binary relative positions of the pairs i<j with at least one department of the neighbourhood, alpha[k] = 1 if P[k] is left of Q[k], beta[k] = 1 if P[k] is below Q[k]
+    I, J = np.triu_indices(n, k=1)
+    pairs = is_free[I] | is_free[J]
+    I, J = I[pairs], J[pairs]
+    m = len(I)
+    P, Q = np.concatenate((I, J)), np.concatenate((J, I))
+    alpha = model.add_variables(2*m, ub=1, integer=True)
+    beta = model.add_variables(2*m, ub=1, integer=True)
+    # The facility is not rotated, so two departments are never further apart than its width (height), which is the big M
+    milp_layout_non_overlap(model, variables, w, h, P, Q, "x", indicator=alpha, M=w_F)
+    milp_layout_non_overlap(model, variables, w, h, P, Q, "y", indicator=beta, M=h_F)
+    # alpha[i,j] + alpha[j,i] + beta[i,j] + beta[j,i] == 1
+    Pairs = sp.hstack((sp.identity(m), sp.identity(m)))
+    model.add_constraints([(alpha, Pairs), (beta, Pairs)], 1, 1)
+
+    result = model.solve(time_limit=time_limit)
+    if result.x is None:
+        return None
+
+    DepartmentsAlpha = np.asarray(DepartmentsAlpha).copy()
+    DepartmentsBeta = np.asarray(DepartmentsBeta).copy()
+    DepartmentsAlpha[P, Q] = np.round(result.x[alpha])
+    DepartmentsBeta[P, Q] = np.round(result.x[beta])
+
+    ansr = np.round(result.x[variables["r"]])
+    ansr_F = np.round(result.x[variables["r_F"]][0])
+
+    return LayoutResult(result.x[variables["x"]], result.x[variables["y"]], (ansr*w) + (1-ansr)*h, (1-ansr)*w + ansr*h,
+                        (ansr_F*w_F) + (1-ansr_F)*h_F, (1-ansr_F)*w_F + ansr_F*h_F, result.fun), DepartmentsAlpha, DepartmentsBeta
@@ -1,8 +1,10 @@
 import os
+import time
 from heuristic_relpos import heuristic_relpos
-from second_stage import second_stage
+from second_stage import second_stage_solve
+from triangulation import pack_relations, unpack_relations
 
-def heuristic_relpos_loop(Alpha, data_dict, DepartmentsXYoptimal, DepartmentsAlpha, DepartmentsBeta, best_obj_val, iterations=5, dir=""):
+def heuristic_relpos_loop(Alpha, data_dict, DepartmentsXYoptimal, DepartmentsAlpha, DepartmentsBeta, best_obj_val, iterations=5, dir="", cache=None, start="warm"):
 
     """
     This function uses a heuristic to close gaps between departments. It changes some parameters of the relative positions and runs the second stage again.
@@ -18,6 +20,12 @@ def heuristic_relpos_loop(Alpha, data_dict, DepartmentsXYoptimal, DepartmentsAlp
         - best_obj_val: Integer, best objective value so far
         - iterations: Integer to set the number of iterations
             default: 5
+        - cache: SecondStageCache to look up the second stage solves in, None to always solve them
+        - start: MIP start of the second stage solves
+            - "warm": the solution of the previous pass, which satisfies the modified relative positions
+            - "cold": no MIP start
+            - "compare": solves every pass with and without MIP start (bypassing the cache) and reports the saved time
+            default: "warm"
     Output:
         - best_DepartmentsAlpha: Binary Dataframe for the updated relative positions
         - best_DepartmentsBeta: Binary Dataframe for the updated relative positions
@@ -26,11 +34,19 @@ def heuristic_relpos_loop(Alpha, data_dict, DepartmentsXYoptimal, DepartmentsAlp
         - best_obj_value: (updated) best objective value so far 
     """
     
+    # The second stage returns new DataFrames instead of changing data_dict, so the best solution does not need to be copied
     best_obj_value = best_obj_val
-    best_DepartmentsXY = DepartmentsXYoptimal.copy()
-    best_data_dict = {key: value.copy() for key, value in data_dict.items()}
-    best_DepartmentsAlpha = DepartmentsAlpha.copy()
-    best_DepartmentsBeta = DepartmentsBeta.copy()
+    best_DepartmentsXY = DepartmentsXYoptimal
+    best_data_dict = data_dict
+    best_DepartmentsRelations = pack_relations(DepartmentsAlpha, DepartmentsBeta)  # heuristic_relpos modifies alpha and beta in place
+
+    solve_second_stage = cache.solve if cache is not None else second_stage_solve
+    if start == "compare":
+        # Without the cache to measure the actual solve times
+        solve_second_stage = cache.solver if cache is not None else second_stage_solve
+    solves = 0
+    seconds_warm = 0.0
+    seconds_cold = 0.0
 
     for k in range(iterations):
         
@@ -40,14 +56,30 @@ def heuristic_relpos_loop(Alpha, data_dict, DepartmentsXYoptimal, DepartmentsAlp
             break
         print(f"Heuristic modified Alphas or Betas in iteration {k}, optimizing again...")
 
-        DepartmentsXYoptimal, data_dict, obj_val = second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output=dir+f"GurobiLogsHeuristicIteration{k}.log")
+        # heuristic_relpos only changes relative positions that the layout of the previous pass already satisfies, so it is a feasible MIP start
+        if start == "compare":
+            t = time.time()
+            solve_second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output=dir+f"GurobiLogsHeuristicIteration{k}.log")
+            seconds_cold += time.time() - t
+        mip_start = (DepartmentsXYoptimal, data_dict) if start != "cold" else None
+        t = time.time()
+        result = solve_second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output=dir+f"GurobiLogsHeuristicIteration{k}.log", start=mip_start)
+        DepartmentsXYoptimal, data_dict, obj_val = result.solution(data_dict)
+        seconds_warm += time.time() - t
+        solves += 1
         
         # update variables with best solution if calculated solution is better
         if obj_val < best_obj_val:
             best_obj_value = obj_val
-            best_DepartmentsXY = DepartmentsXYoptimal.copy()
-            best_data_dict = {key: value.copy() for key, value in data_dict.items()}
-            best_DepartmentsAlpha = DepartmentsAlpha.copy()
-            best_DepartmentsBeta = DepartmentsBeta.copy()
+            best_DepartmentsXY = DepartmentsXYoptimal
+            best_data_dict = data_dict
+            best_DepartmentsRelations = pack_relations(DepartmentsAlpha, DepartmentsBeta)
+
+    if start == "compare" and solves:
+        print(f"Heuristic: {solves} second stage solves took {seconds_warm:.2f}s with MIP start and {seconds_cold:.2f}s without, the MIP start saved {seconds_cold - seconds_warm:.2f}s ({(seconds_cold - seconds_warm) / seconds_cold:.0%})")
+    elif solves:
+        print(f"Heuristic: {solves} second stage solves took {seconds_warm:.2f}s ({'with' if start == 'warm' else 'without'} MIP start)")
+
+    best_DepartmentsAlpha, best_DepartmentsBeta = unpack_relations(best_DepartmentsRelations, len(DepartmentsAlpha))
 
     return best_DepartmentsAlpha, best_DepartmentsBeta, best_DepartmentsXY, best_data_dict, best_obj_value
@@ -36,11 +36,34 @@ import parser
         - Grouping: Defines whether grouping will be active or not. Must be True or False.
         - Method:
             - "gradient_descent" to use the gradient descent function we implemented ourselves to solve the first stage
+            - "batched_gradient_descent" to run our gradient descent for all first stage start positions at once
             - "scipy_minimize" to use the minimize function of scipy.optimize to solve the first stage 
+        - ScipyMethod: Algorithm used by scipy.optimize.minimize if Method is "scipy_minimize" ("SLSQP", "L-BFGS-B", "trust-constr")
         - Min: Defines after which criterion the solution will be chosen from all available iteration solutions. Note that this does NOT change the optimization objective, which will always be to minimize the total cost, not the total area.
             - "cost" opt solution with respect to cost
             - "area" opt solution with respect ro area
         - Iterations: Number of iterations of first and second stage
+        - FirstStageStarts: Number of random start positions of the first stage in every iteration
+        - FirstStageWorkers: Number of processes the first stage start positions are distributed to. 0 uses all available cores.
+        - IterationWorkers: Number of processes the iterations are distributed to. 0 uses all available cores.
+        - TimeLimit: Time in seconds after which no further iterations are started, 0 for no time limit
+        - Patience: Number of iterations without improvement after which no further iterations are started, 0 to disable
+        - Gap: Relative gap between the best objective value and a lower bound at which no further iterations are started, 0 to disable
+        - TopK: Number of best iteration solutions that are kept
+        - Seed: Seed for the random start positions, None for a different result in every run
+        - Repulsion: "exact" or "approximate" evaluation of the repulsion term of the gradient descent
+        - RepulsionAccuracy: Accuracy of the approximate repulsion, 0 < RepulsionAccuracy <= 1
+        - Optimizer: "steepest", "heavy_ball", "nesterov", "adam" or "lbfgs" optimizer of the gradient descent
+        - Coarsening: "flow" or "group" clustering of the departments of the multilevel first stage
+        - Initializer: "random" or "spectral" start positions of the first first stage start
+        - Solver: "gurobi", "highs" or "flow" solver of the second stage
+        - HeuristicSolver: "same" or "flow" solver of the second stage solves of the heuristic
+        - HeuristicStart: "warm", "cold" or "compare" MIP start of the second stage solves of the heuristic
+        - Rotations: "free" or "pattern" rotations of the second stage
+        - LNSTimeLimit: Time budget in seconds of the large neighbourhood search after the heuristic, 0 to skip it
+        - LNSNeighbourhoodSize: Number of departments of a neighbourhood of the large neighbourhood search
+        - LNSNeighbourhood: "flow", "spatial" or "mixed" choice of the neighbourhoods of the large neighbourhood search
+        - LNSWorkers: Number of processes the neighbourhoods are repaired in. 0 uses all available cores.
         - NameVisualizationFirstStage: Name of the file that stores the image of the visualization of the first stage (e.g. "visualization_main_first_stage.png")
         - NameVisualization: Name of the file that stores the image of the visualization of the solution (e.g."visualization_main.png")
     
@@ -51,34 +74,58 @@ import parser
 """
 
 
-# Start logging console output to log file
-logFileName = "FacilityLayout.log"
-sys.stdout = logger.Logger(logFileName)
-
-
-rootDir = os.path.dirname(__file__) + "/../"  # Root directory of this repo (i.e., where files like README.md and requirements.txt are located)
-constants = parser.parseIni(rootDir + "settings.ini")  # Parse all constants in .ini file to single dictionary
-
-
-# Set all constants from constants dictionary
-ExcelFilesInputPath = rootDir + constants["ExcelFilesInputPath"]
-ExcelFileInformation = ExcelFilesInputPath + "/" + constants["ExcelFileInformation"]
-ExcelFileTransportFlow = ExcelFilesInputPath + "/" + constants["ExcelFileTransportFlow"]
-ExcelFileTransportMeans = ExcelFilesInputPath + "/" + constants["ExcelFileTransportMeans"]
-ExcelFilesOutputPath = rootDir + constants["ExcelFilesOutputPath"]
-Alpha = constants["Alpha"]
-Grouping = constants["Grouping"]
-GroupingValue = constants["GroupingValue"]
-Method = constants["Method"]
-Min = constants["Min"]
-Iterations = constants["Iterations"]
-VisualizationFirstStagePath = rootDir + constants["VisualizationFirstStagePath"]
-VisualizationPath = rootDir + constants["VisualizationPath"]
-drawLabels = constants["drawLabels"]
-
-
-main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha=Alpha, Grouping=Grouping, GroupingValue=GroupingValue, Method=Method, Min=Min, Iterations=Iterations, VisualizationFirstStagePath=VisualizationFirstStagePath, VisualizationPath=VisualizationPath, drawLabels=drawLabels)
-
-
-# Stop logging to "FacilityLayout.log"
-sys.stdout.close()
+# Worker processes (e.g. of the first stage) import this script again on Windows and macOS, so only run it when executed directly
+if __name__ == "__main__":
+    # Start logging console output to log file
+    logFileName = "FacilityLayout.log"
+    sys.stdout = logger.Logger(logFileName)
+
+
+    rootDir = os.path.dirname(__file__) + "/../"  # Root directory of this repo (i.e., where files like README.md and requirements.txt are located)
+    constants = parser.parseIni(rootDir + "settings.ini")  # Parse all constants in .ini file to single dictionary
+
+
+    # Set all constants from constants dictionary
+    ExcelFilesInputPath = rootDir + constants["ExcelFilesInputPath"]
+    ExcelFileInformation = ExcelFilesInputPath + "/" + constants["ExcelFileInformation"]
+    ExcelFileTransportFlow = ExcelFilesInputPath + "/" + constants["ExcelFileTransportFlow"]
+    ExcelFileTransportMeans = ExcelFilesInputPath + "/" + constants["ExcelFileTransportMeans"]
+    ExcelFilesOutputPath = rootDir + constants["ExcelFilesOutputPath"]
+    Alpha = constants["Alpha"]
+    Grouping = constants["Grouping"]
+    GroupingValue = constants["GroupingValue"]
+    Method = constants["Method"]
+    ScipyMethod = constants["ScipyMethod"]
+    Min = constants["Min"]
+    Iterations = constants["Iterations"]
+    FirstStageStarts = constants["FirstStageStarts"]
+    FirstStageWorkers = constants["FirstStageWorkers"]
+    IterationWorkers = constants["IterationWorkers"]
+    TimeLimit = constants["TimeLimit"]
+    Patience = constants["Patience"]
+    Gap = constants["Gap"]
+    TopK = constants["TopK"]
+    Seed = constants["Seed"]
+    Repulsion = constants["Repulsion"]
+    RepulsionAccuracy = constants["RepulsionAccuracy"]
+    Optimizer = constants["Optimizer"]
+    Coarsening = constants["Coarsening"]
+    Initializer = constants["Initializer"]
+    Solver = constants["Solver"]
+    HeuristicSolver = constants["HeuristicSolver"]
+    HeuristicStart = constants["HeuristicStart"]
+    Rotations = constants["Rotations"]
+    LNSTimeLimit = constants["LNSTimeLimit"]
+    LNSNeighbourhoodSize = constants["LNSNeighbourhoodSize"]
+    LNSNeighbourhood = constants["LNSNeighbourhood"]
+    LNSWorkers = constants["LNSWorkers"]
+    VisualizationFirstStagePath = rootDir + constants["VisualizationFirstStagePath"]
+    VisualizationPath = rootDir + constants["VisualizationPath"]
+    drawLabels = constants["drawLabels"]
+
+
+    main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha=Alpha, Grouping=Grouping, GroupingValue=GroupingValue, Method=Method, ScipyMethod=ScipyMethod, Min=Min, Iterations=Iterations, FirstStageStarts=FirstStageStarts, FirstStageWorkers=FirstStageWorkers, IterationWorkers=IterationWorkers, TimeLimit=TimeLimit, Patience=Patience, Gap=Gap, TopK=TopK, Seed=Seed, Repulsion=Repulsion, RepulsionAccuracy=RepulsionAccuracy, Optimizer=Optimizer, Coarsening=Coarsening, Initializer=Initializer, Solver=Solver, HeuristicSolver=HeuristicSolver, HeuristicStart=HeuristicStart, Rotations=Rotations, LNSTimeLimit=LNSTimeLimit, LNSNeighbourhoodSize=LNSNeighbourhoodSize, LNSNeighbourhood=LNSNeighbourhood, LNSWorkers=LNSWorkers, VisualizationFirstStagePath=VisualizationFirstStagePath, VisualizationPath=VisualizationPath, drawLabels=drawLabels)
+
+
+    # Stop logging to "FacilityLayout.log"
+    sys.stdout.close()
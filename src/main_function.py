@@ -1,28 +1,32 @@
 import time
-import copy
 import warnings
 import sys
 import os
 import numpy as np
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
 
 # Importing all the other functions needed
 from import_data import import_data
 from grouping import grouping
-from change_facility_rot import change_facility_rot
 from visualize import visualize
 from evaluate_solution import evaluate_solution
-from first_stage import first_stage
-from triangulation import triangulation
-from second_stage import second_stage
+from triangulation import unpack_relations
+from second_stage_cache import SecondStageCache
+from problem_instance import ProblemInstance
+from top_k_solutions import TopKSolutions
+from second_stage import second_stage_models
+from main_iteration import main_iteration, main_iteration_worker_init, main_iteration_worker
 from heuristic_relpos_loop import heuristic_relpos_loop
+from heuristic_lns import heuristic_lns
 from export_data import export_data
 from rotate_facility import rotate_facility
 
 
 
 
-def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha=0.5, Grouping=False, GroupingValue=0.5, Method="gradient_descent", Min="cost", Iterations=10, VisualizationFirstStagePath="visualization_first_stage.png", VisualizationPath="visualization.png", drawLabels=True):
+def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha=0.5, Grouping=False, GroupingValue=0.5, Method="gradient_descent", ScipyMethod="SLSQP", Min="cost", Iterations=10, FirstStageStarts=1, FirstStageWorkers=1, IterationWorkers=1, TimeLimit=0, Patience=0, Gap=0.0, TopK=5, Seed=None, Repulsion="exact", RepulsionAccuracy=0.5, Optimizer="steepest", Coarsening="flow", Initializer="random", Solver="gurobi", HeuristicSolver="same", HeuristicStart="warm", Rotations="free", LNSTimeLimit=0, LNSNeighbourhoodSize=2, LNSNeighbourhood="mixed", LNSWorkers=1, VisualizationFirstStagePath="visualization_first_stage.png", VisualizationPath="visualization.png", drawLabels=True):
 
     """This function executes the entire problem.
 
@@ -33,11 +37,38 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
             - Grouping: Specify whether grouping will be active or not
             - Method:
                 - "gradient_descent" to use the gradient descent function we implemented ourselves to solve the first stage
+                - "batched_gradient_descent" to run our gradient descent for all first stage start positions at once
+                - "multilevel" to solve the first stage on clusters of departments first and refine it with our gradient descent, for large instances
                 - "scipy_minimize" to use the minimize function of scipy.optimize to solve the first stage 
+            - ScipyMethod: Algorithm used by scipy.optimize.minimize if Method is "scipy_minimize". Available options: "SLSQP", "L-BFGS-B", "trust-constr"
             - Min: Defines after which criterion the solution will be chosen from all available iteration solutions. Note that this does NOT change the optimization objective, which will always be to minimize the total cost, not the total area.
                 - "cost" opt solution with respect to cost
                 - "area" opt solution with respect ro area
             - Iterations: Number of iterations of first and second stage
+            - FirstStageStarts: Number of random start positions of the first stage in every iteration. The best relative layout is used.
+            - FirstStageWorkers: Number of processes the first stage start positions are distributed to. 0 uses all available cores.
+            - IterationWorkers: Number of processes the iterations are distributed to, each with its own second stage model (and Gurobi environment). 0 uses all available cores.
+            - TimeLimit: Time in seconds after which no further iterations are started. 0 for no time limit.
+            - Patience: Number of iterations without a better solution after which no further iterations are started. 0 to disable.
+            - Gap: No further iterations are started once the gap (best objective value - lower bound) / best objective value is at most Gap, see ProblemInstance.lower_bound. 0 to disable.
+            - TopK: Number of best iteration solutions that are kept
+            - Seed: Integer seed to make the random start positions reproducible. None draws a fresh seed in every run.
+            - Repulsion: Evaluation of the repulsion term if Method is "gradient_descent"
+                - "exact" for all pairs of departments
+                - "approximate" only exactly for nearby departments, only faster than "exact" for instances with about 1000+ departments
+            - RepulsionAccuracy: Accuracy of the approximate repulsion. 0 < RepulsionAccuracy <= 1, smaller is more accurate.
+            - Optimizer: Optimizer of the gradient descent if Method is "gradient_descent" or "multilevel" ("steepest", "heavy_ball", "nesterov", "adam", "lbfgs")
+            - Coarsening: How departments are merged into clusters if Method is "multilevel" ("flow" or "group")
+            - Initializer: Start positions of the first first stage start in every iteration ("random" or "spectral"). All other starts are random.
+            - Solver: Solver of the second stage ("gurobi", "highs" for the open source solver HiGHS, which needs no license,
+              or "flow" for minimum cost flows without rotating departments, see SecondStageFlow. Most iterations fail with "flow" if the facility is tight.)
+            - HeuristicSolver: Solver of the second stage solves of the heuristic ("same" as Solver, or "flow" keeping the rotations of the best solution)
+            - HeuristicStart: MIP start of the second stage solves of the heuristic ("warm" from the previous layout, "cold", or "compare" to report the time saved by "warm")
+            - Rotations: Rotations of the second stage ("free" optimizes them, "pattern" chooses them from the relative positions first, see SecondStageModel)
+            - LNSTimeLimit: Time budget in seconds of the large neighbourhood search after the heuristic, see heuristic_lns. 0 to skip it.
+            - LNSNeighbourhoodSize: Number of departments whose relative positions are destroyed and repaired together by the large neighbourhood search
+            - LNSNeighbourhood: How the departments of a neighbourhood are chosen ("flow", "spatial" or "mixed")
+            - LNSWorkers: Number of neighbourhoods that are repaired in parallel processes. 0 uses all available cores.
             - NameVisualizationFirstStage: Name of the file that stores the image of the visualization of the first stage (e.g. "visualization_main_first_stage.png")
             - NameVisualization: Name of the file that stores the image of the visualization of the solution (e.g."visualization_main.png")
         
@@ -45,13 +76,55 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
             - Console log logs the result of the various preparation and optimization steps. We took special care to make this function especially easy to read, so please take the time to read it. It explains what every step does, see the individual function definitions for more details.
             - Visualizations: This program generates two visualizations (of first and second optimization step). It can be used as an intermediate step to inspect the output of this program without having to import it into visTable.
             - Excel Output File: Excel File with the determined x- and y-coordinates of the departments. Can be directly imported into visTable.
+            - solution: dictionary describing the solution, which can be passed to relayout to warm start small changes of the instance:
+                - "data_dict": data_dict of the solution, the widths and heights of the departments are the ones of their final orientation
+                - "DepartmentsXYrelative": relative positions of the first stage
+                - "DepartmentsAlpha", "DepartmentsBeta": relative positions of the second stage, in the orientation of the original facility
+                - "DepartmentsXYoptimal": coordinates of the departments
+                - "obj_val": objective value
+                - "rotated": boolean array, True for the departments that are rotated by 90° compared to the Excel file
+                - "top_k": list of (iteration, obj_val, area, LayoutResult) of the TopK best iterations (before the heuristic), the best first
+    """
+
+    # Run main_function_events to the end, its console output is the log of the run
+    for event in main_function_events(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha=Alpha, Grouping=Grouping, GroupingValue=GroupingValue, Method=Method, ScipyMethod=ScipyMethod, Min=Min, Iterations=Iterations, FirstStageStarts=FirstStageStarts, FirstStageWorkers=FirstStageWorkers, IterationWorkers=IterationWorkers, TimeLimit=TimeLimit, Patience=Patience, Gap=Gap, TopK=TopK, Seed=Seed, Repulsion=Repulsion, RepulsionAccuracy=RepulsionAccuracy, Optimizer=Optimizer, Coarsening=Coarsening, Initializer=Initializer, Solver=Solver, HeuristicSolver=HeuristicSolver, HeuristicStart=HeuristicStart, Rotations=Rotations, LNSTimeLimit=LNSTimeLimit, LNSNeighbourhoodSize=LNSNeighbourhoodSize, LNSNeighbourhood=LNSNeighbourhood, LNSWorkers=LNSWorkers, VisualizationFirstStagePath=VisualizationFirstStagePath, VisualizationPath=VisualizationPath, drawLabels=drawLabels):
+        if event["event"] == "finished":
+            if event["solution"] is None:
+                sys.exit(0)  # Quit program if we find no solution
+            return event["solution"]
+
+
+
+
+
+def main_function_events(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha=0.5, Grouping=False, GroupingValue=0.5, Method="gradient_descent", ScipyMethod="SLSQP", Min="cost", Iterations=10, FirstStageStarts=1, FirstStageWorkers=1, IterationWorkers=1, TimeLimit=0, Patience=0, Gap=0.0, TopK=5, Seed=None, Repulsion="exact", RepulsionAccuracy=0.5, Optimizer="steepest", Coarsening="flow", Initializer="random", Solver="gurobi", HeuristicSolver="same", HeuristicStart="warm", Rotations="free", LNSTimeLimit=0, LNSNeighbourhoodSize=2, LNSNeighbourhood="mixed", LNSWorkers=1, VisualizationFirstStagePath="visualization_first_stage.png", VisualizationPath="visualization.png", drawLabels=True):
+    """
+    Executes the entire problem like main_function, but as a generator that yields an event (a dictionary) whenever the run makes progress.
+    Every event has the entries "event" (its type) and "seconds" since the start of the run:
+        - "stage_started", "stage_finished": "stage" is "import", "grouping", "iterations", "heuristic", "visualization" or "export"
+        - "iteration": "iteration" (index), "success", "rejected" (see relation_graph_fits), and "obj_val" and "area" if it was successful
+        - "incumbent": a new best solution of the iterations (see Min) or of the heuristic, with "iteration" (None for the heuristic),
+          "obj_val", "area", "DepartmentsXYoptimal" and "data_dict" in the orientation of the original facility
+        - "stopped": the iterations stopped early, "reason" is the stopping criterion (see TimeLimit, Patience and Gap)
+        - "finished": "solution" is the return value of main_function, None if no iteration found a solution
+    The run can be cancelled by closing the generator (events.close()), e.g. once an incumbent is good enough. Iterations in other processes that
+    have not started yet are cancelled with it, iterations that are already running are not interrupted and finish in the background.
+    Usage:
+        events = main_function_events(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Iterations=100)
+        for event in events:
+            if event["event"] == "incumbent" and event["obj_val"] < good_enough:
+                events.close()
+    Input: see main_function
     """
 
     # Record how much time the script takes
     startSeconds = time.time()
+
+    def event(name, **data):
+        return {"event": name, "seconds": time.time() - startSeconds, **data}
     
     # Validate that all input parameters have the correct type and are defined correctly
-    validateInput(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha, Grouping, GroupingValue, Method, Min, Iterations, VisualizationFirstStagePath, VisualizationPath, drawLabels)
+    validateInput(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha, Grouping, GroupingValue, Method, ScipyMethod, Min, Iterations, FirstStageStarts, FirstStageWorkers, IterationWorkers, TimeLimit, Patience, Gap, TopK, Seed, Repulsion, RepulsionAccuracy, Optimizer, Coarsening, Initializer, Solver, HeuristicSolver, HeuristicStart, Rotations, LNSTimeLimit, LNSNeighbourhoodSize, LNSNeighbourhood, LNSWorkers, VisualizationFirstStagePath, VisualizationPath, drawLabels)
     
     srcDir = os.path.dirname(__file__)
     # Prepare for gurobi Logs Folder
@@ -68,10 +141,12 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
 ###########################
     """)
     """Here we import the data from the excel files to DataFrames and a numpy matrix."""
+    yield event("stage_started", stage="import")
 
     # Import all relevant data from excel files into DataFrames
     data_dict = import_data(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans)
     print("Successfully imported the necessary data from the Excel files.")
+    yield event("stage_finished", stage="import")
 
 
 
@@ -84,6 +159,7 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
     """)
     """Here we modify the imported data to implement grouping of departments;
     We increase the dependencies between departments in the same group. This means that they will be closer together in the end."""
+    yield event("stage_started", stage="grouping")
 
     # Evaluate whether grouping should be active in the first place.
     # If Grouping is active, but all grouping variables are not set, we set Grouping to False.
@@ -96,6 +172,7 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
         print("The Departments are grouped.")
     else:
         print("The Departments are not grouped.") 
+    yield event("stage_finished", stage="grouping")
 
 
 
@@ -108,137 +185,95 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
     """)
     """We execute our optimization steps multiple times, because we get different solutions (or sometimes even no solutions at all) in every execution. For that purpose we must keep track of the solutions and their objective values, whose setup we do here."""
 
-    # Save the original data_dict to use it in every iteration
-    data_dict_original = copy.deepcopy(data_dict)
-
-    # initialize list for the variables which need to be saved
-    DepartmentsXYrelative_list = []
-    DepartmentsAlpha_list = []
-    DepartmentsBeta_list = []
-    DepartmentsXYoptimal_list = []
-    obj_val_list = []
-    area_list = []
-    data_dict_list = []
-    success_list = []
+    # Save the original data_dict to use it in every iteration. No stage changes it, so all iterations share it and its read-only ProblemInstance.
+    data_dict_original = data_dict
+    instance = ProblemInstance.from_data_dict(data_dict_original, Alpha)
+    w_input = data_dict["Departments"]["w"].to_numpy(dtype=float)  # to find the rotated departments in the end
+    h_input = data_dict["Departments"]["h"].to_numpy(dtype=float)
+
+    # The k best solutions are kept in a bounded heap instead of lists of all iterations
+    solutions = TopKSolutions(k=TopK, Min=Min)
+    number_success = 0
+
+    # The model of the second stage is built once and only its non-overlap constraints are exchanged for every solve.
+    # Iterations that triangulate to the same relative positions share one second stage solve (with IterationWorkers > 1 only within a worker process).
+    second_stage_model = second_stage_models[Solver](data_dict_original, output=srcDir + "/gurobiLogs/GurobiLogsHeuristicIteration0.log", rotations=Rotations)
+    second_stage_cache = SecondStageCache(solver=second_stage_model.solve)
+    # Number of relative positions that certainly do not fit into the facility, see relation_graph_fits
+    rejected = 0
+
+    # Every iteration gets its own independent stream of random numbers for the first stage, the last stream is the one of heuristic_lns
+    *iteration_seeds, lns_seed = np.random.SeedSequence(Seed).spawn(Iterations + 1)
+
+    # Anytime mode: the iterations stop early if the time limit is reached, if the best solution did not improve for Patience iterations,
+    # or if the gap between the best objective value and a lower bound of it is at most Gap. 0 disables the criterion.
+    lower_bound = instance.lower_bound()
+    best_obj_val = None
+    last_improvement = -1
+    stop_reason = None
 
     # unnecessary since the programm stops if no solution is found
     #success = False  # Initialize success variable. After the loop we will know if we ever had success executing the second stage.
     print("Trying to solve the optimization problem...")
-    for i in range(Iterations):
-        # Preprocessing data dict
-        data_dict = copy.deepcopy(data_dict_original)  # Start with the original data dict
-
-
-
-
-
-        """
-###############################
-######  Rotate Facility  ######
-###############################
-        """
-        """Here we rotate the facility in every other iteration. We do this because it can change the objective value."""
-        if i%2:
-            data_dict = change_facility_rot(data_dict)
-
-
-
-
-
-        f"""
-#################################################
-######  Executing First Stage Iteration {i+1}  ######
-#################################################
-        """
-        """Here we execute the first step of the optimization. TODO: Mehr Details"""
-
-        DepartmentsXYrelative = first_stage(data_dict, Alpha, method=Method)
-        #print("")  # Empty print statement for spacing
-        if DepartmentsXYrelative is None:
-            raise ValueError("First stage failed, DepartmentsXYrelative is empty.")
-        #print("Successfully solved the first stage. Following relative positions were calculated:")
-        #print(DepartmentsXYrelative)
-
-
-        # adjust list
-        DepartmentsXYrelative_list.append(copy.deepcopy(DepartmentsXYrelative))
-
-
-
-
-
-        f"""
-###################################################
-######  Executing Triangulation Iteration {i+1}  ######
-###################################################
-        """
-        """Here we determine the alpha and beta matrices which encode the relative positions of the departments. If department i is on the left of department j, alpha[i,j] = 1, otherwise alpha[i,j] = 0. Similarly beta[i,j] = 1 if i is below j, otherwise beta[i,j] = 0. Note that between two departments only the bigger relation of left/right or up/down is considered, i.e., two departments can only lay left/right OR above/below each other. This means we have alpha[i,j] + alpha[j,i] + beta[i,j] + beta[j,i] = 1, for all 1 <= i < j <= n."""
-
-        # Do Comparison/Triangulation to get the relative positions of the departments
-        DepartmentsAlpha, DepartmentsBeta = triangulation(DepartmentsXYrelative)
-        if DepartmentsAlpha is None or DepartmentsBeta is None:
-            raise ValueError("Triangulation step failed, DepartmentsAlpha or DepartmentsBeta is empty.")
-        #print("Successfully executed Triangulation step. Following Alphas and Betas were calculated:")
-        #print("Alpha = ", DepartmentsAlpha, sep="\n")
-        #print("Beta = ", DepartmentsBeta, sep="\n")
-
-
-        # adjust list
-        DepartmentsAlpha_list.append(copy.deepcopy(DepartmentsAlpha))
-        DepartmentsBeta_list.append(copy.deepcopy(DepartmentsBeta))
-
-
-
-
-
-        f"""
-##################################################
-######  Executing Second Stage Iteration {i+1}  ######
-##################################################
-        """
-        """Here we execute the second step of the optimization. We use Gurobi to solve the rest of the optimization problem, but with easier to solve non-overlap constraints, thanks to the alpha and beta matrices."""
-
-        # Trying to solve second stage
-        try:
-            DepartmentsXYoptimal, data_dict, obj_val = second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict_original, output=srcDir + "/gurobiLogs/" + f"GurobiLogsHeuristicIteration{i}.log")
-            success = True
-            # Adjust lists by deepcopy of the new generated variables
-            DepartmentsXYoptimal_list.append(copy.deepcopy(DepartmentsXYoptimal))
-            obj_val_list.append(copy.deepcopy(obj_val))
-            width, height, area = evaluate_solution(DepartmentsXYoptimal, data_dict)
-            area_list.append(copy.deepcopy(area))
-            data_dict_list.append(copy.deepcopy(data_dict))
-            success_list.append(True)
-            print(f"Iteration {i+1}/{Iterations}: Success ✅")
-        except ValueError:
-            # Generate Dummy entries for the lists such that it is possible to get optimal layout
-            DepartmentsXYoptimal_list.append(0)
-            obj_val_list.append(0)
-            area_list.append(0)
-            data_dict_list.append(0)
-            success_list.append(False)
-            print(f"Iteration {i+1}/{Iterations}: Failure ❌")
-
-
-
-
-
-    """
-######################################
-######  Iteration Verification  ######
-######################################
-    """
-    # check if everything is correct in previous step
-    correct = False
-    lengths_list = [len(DepartmentsXYrelative_list),len(DepartmentsAlpha_list),len(DepartmentsBeta_list),len(DepartmentsXYoptimal_list),len(obj_val_list),len(area_list),len(data_dict_list),len(success_list)]
-    if all(v == Iterations for v in lengths_list):
-        correct = True
-    if not correct:
-        print("There is a problem with storing the information during the iterations.")
-        return
-
-
-    opt_index = find_best_solution(Min, obj_val_list, area_list)
+    # The iterations are executed by main_iteration, in this process or distributed to IterationWorkers processes.
+    # The results arrive in the order of the iterations in both cases, and every iteration has its own seed, so the result does not depend on IterationWorkers
+    # (unless TimeLimit stops the iterations).
+    first_stage_options = {"method": Method, "scipy_method": ScipyMethod, "starts": FirstStageStarts, "workers": FirstStageWorkers, "repulsion": Repulsion, "repulsion_accuracy": RepulsionAccuracy, "optimizer": Optimizer, "coarsening": Coarsening, "initializer": Initializer}
+    log_dir = srcDir + "/gurobiLogs/"
+    if IterationWorkers == 0:
+        IterationWorkers = os.cpu_count()
+    executor = None
+    iterationsStartSeconds = time.time()
+    yield event("stage_started", stage="iterations")
+    if IterationWorkers == 1 or Iterations == 1:
+        results = (main_iteration(i, instance, data_dict_original, second_stage_cache, Alpha, iteration_seeds[i], log_dir, fixed_facility=Solver == "flow", **first_stage_options) for i in range(Iterations))
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(IterationWorkers, Iterations), initializer=main_iteration_worker_init, initargs=(instance, data_dict_original, Solver, Rotations, log_dir))
+        results = executor.map(main_iteration_worker, range(Iterations), iteration_seeds, repeat(Alpha), repeat(log_dir), repeat(first_stage_options))
+
+    # If the caller closes the generator while the iterations run, the finally block cancels the iterations of the other processes that have not started yet
+    all_iterations_done = False
+    try:
+        for i, (DepartmentsXYrelative, DepartmentsRelations, result, rejected_iteration) in enumerate(results):
+            rejected += rejected_iteration
+            if result is not None:
+                # LayoutResults are read-only, so they are stored without copying them
+                number_success += 1
+                area = result.evaluate()[2]
+                improved = solutions.add(i, result.obj_val, area, (DepartmentsXYrelative, DepartmentsRelations, result))
+                if improved:
+                    last_improvement = i
+                if best_obj_val is None or result.obj_val < best_obj_val:
+                    best_obj_val = result.obj_val
+                print(f"Iteration {i+1}/{Iterations}: Success ✅")
+                yield event("iteration", iteration=i, success=True, rejected=False, obj_val=result.obj_val, area=area)
+                if improved:
+                    DepartmentsXYincumbent, data_dict_incumbent, _ = result.solution(data_dict_original)
+                    DepartmentsXYincumbent, data_dict_incumbent = rotate_facility(DepartmentsXYincumbent, data_dict_incumbent, data_dict_original)
+                    yield event("incumbent", iteration=i, obj_val=result.obj_val, area=area, DepartmentsXYoptimal=DepartmentsXYincumbent, data_dict=data_dict_incumbent)
+            else:
+                print(f"Iteration {i+1}/{Iterations}: Failure ❌")
+                yield event("iteration", iteration=i, success=False, rejected=bool(rejected_iteration))
+
+            # Stopping criteria of the anytime mode
+            if TimeLimit > 0 and time.time() - iterationsStartSeconds >= TimeLimit:
+                stop_reason = f"the time limit of {TimeLimit}s is reached"
+            elif Patience > 0 and last_improvement >= 0 and i - last_improvement >= Patience:
+                stop_reason = f"the best solution did not improve in the last {Patience} iterations"
+            elif Gap > 0 and best_obj_val is not None and best_obj_val - lower_bound <= Gap * best_obj_val:
+                stop_reason = f"the gap to the lower bound {lower_bound} is at most {Gap:.1%}"
+            if stop_reason is not None and i+1 < Iterations:
+                print(f"Stopping after iteration {i+1}/{Iterations}, because {stop_reason}.")
+                yield event("stopped", reason=stop_reason)
+                break
+        else:
+            all_iterations_done = True
+    finally:
+        if executor is not None:
+            # Iterations that have not started yet are cancelled, running ones are only waited for if all iterations are done
+            executor.shutdown(wait=all_iterations_done, cancel_futures=True)
+    iterations_done = i+1
+    yield event("stage_finished", stage="iterations")
 
 
 
@@ -249,13 +284,22 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
 ######  Iteration Management  ######
 ####################################
     """
+    # Stop method if no solution is found
+    if len(solutions) == 0:
+        print(f"""
+################################################################################
+######  There is no solution to this problem. The facility is too small.  ######
+######  Use larger facility or increase number of iterations.             ######
+################################################################################
+    """)
+        yield event("finished", solution=None)
+        return
+
     # reassign optimal layout for later heuristic
-    DepartmentsXYrelative = DepartmentsXYrelative_list[opt_index]
-    DepartmentsAlpha = DepartmentsAlpha_list[opt_index]
-    DepartmentsBeta = DepartmentsBeta_list[opt_index]
-    DepartmentsXYoptimal = DepartmentsXYoptimal_list[opt_index]
-    obj_val = obj_val_list[opt_index]
-    data_dict = data_dict_list[opt_index]
+    opt_index, obj_val, area, (DepartmentsXYrelative, DepartmentsRelations, result) = solutions.best()
+    DepartmentsAlpha, DepartmentsBeta = unpack_relations(DepartmentsRelations, len(DepartmentsXYrelative))
+    DepartmentsXYoptimal, data_dict, obj_val = result.solution(data_dict_original)
+    print(f"The best solution was found in iteration {opt_index+1}. The gap between the best objective value {best_obj_val} and the lower bound {lower_bound} is {(best_obj_val - lower_bound) / max(best_obj_val, 1e-12):.1%}.")
 
 
 
@@ -267,10 +311,20 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
 ###################################################
     """)
     """Here we execute postprocessing heuristics trying to improve the solution. For that purpose we modify some entries of the alpha and beta matrices."""
+    yield event("stage_started", stage="heuristic")
 
     # Alpha-Beta Heuristic (change relative positions) to close some gaps
     heuristic_iterations = 5
-    DepartmentsAlpha, DepartmentsBeta, DepartmentsXYoptimal, data_dict, obj_value = heuristic_relpos_loop(Alpha, data_dict, DepartmentsXYoptimal, DepartmentsAlpha, DepartmentsBeta, obj_val, iterations=heuristic_iterations, dir=srcDir + "/gurobiLogs/")
+    # The minimum cost flows of SecondStageFlow keep the rotations of the solution and are much faster than a MIP solver for large instances
+    heuristic_cache = second_stage_cache
+    if HeuristicSolver == "flow":
+        heuristic_cache = SecondStageCache(solver=second_stage_models["flow"](data_dict_original).solve)
+    DepartmentsAlpha, DepartmentsBeta, DepartmentsXYoptimal, data_dict, obj_value = heuristic_relpos_loop(Alpha, data_dict, DepartmentsXYoptimal, DepartmentsAlpha, DepartmentsBeta, obj_val, iterations=heuristic_iterations, dir=srcDir + "/gurobiLogs/", cache=heuristic_cache, start=HeuristicStart)
+
+    # Large neighbourhood search: destroys and repairs the relative positions of a few departments at a time
+    if LNSTimeLimit > 0:
+        DepartmentsAlpha, DepartmentsBeta, DepartmentsXYoptimal, data_dict, obj_value = heuristic_lns(data_dict, DepartmentsXYoptimal, DepartmentsAlpha, DepartmentsBeta, obj_value, time_limit=LNSTimeLimit, neighbourhood_size=LNSNeighbourhoodSize, neighbourhood=LNSNeighbourhood, workers=LNSWorkers, seed_sequence=lns_seed)
+    yield event("stage_finished", stage="heuristic")
 
 
 
@@ -282,12 +336,19 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
 #######################################
     """)
 
-    # rotate Facility Layout back to original format of facility
+    yield event("stage_started", stage="visualization")
+    # rotate Facility Layout back to original format of facility. Mirroring the layout along the diagonal exchanges left/right and below/above.
+    facility_rotated = float(data_dict["Facility"].iloc[0]["w"]) != float(data_dict_original["Facility"].iloc[0]["w"])
     DepartmentsXYoptimal, data_dict = rotate_facility(DepartmentsXYoptimal, data_dict, data_dict_original)
+    if facility_rotated:
+        DepartmentsAlpha, DepartmentsBeta = DepartmentsBeta, DepartmentsAlpha
+    if obj_value < obj_val:
+        yield event("incumbent", iteration=None, obj_val=obj_value, area=evaluate_solution(DepartmentsXYoptimal, data_dict)[2], DepartmentsXYoptimal=DepartmentsXYoptimal.copy(), data_dict=data_dict)
 
     # Visualize the solution 
     visualize(data_dict, DepartmentsXYrelative, VisualizationFirstStagePath, Grouping=Grouping, useFacility=False, drawLabels=drawLabels)
     visualize(data_dict, DepartmentsXYoptimal, VisualizationPath, Grouping=Grouping, drawLabels=drawLabels)
+    yield event("stage_finished", stage="visualization")
 
 
 
@@ -299,7 +360,9 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
 ##################################
     """)
     # Export data to an Excel files importable by visTable
+    yield event("stage_started", stage="export")
     export_data(ExcelFilesOutputPath, ExcelFileTransportFlow, DepartmentsXYoptimal, data_dict)
+    yield event("stage_finished", stage="export")
 
 
 
@@ -313,7 +376,7 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
 
     # Print the objective Value
     print('The location of the departments are:', DepartmentsXYoptimal, sep="\n")
-    print('The objective value is:', obj_val, "(quality of the solution, less means better)")
+    print('The objective value is:', obj_value, "(quality of the solution, less means better)")
 
     # Get measure for size of created solution
     width, height, area = evaluate_solution(DepartmentsXYoptimal, data_dict)
@@ -321,8 +384,9 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
     print('The width is:', width, 'and the height is:', height)
 
     # Print number of successful tries
-    number_success = sum(success_list)
-    print('The success rate is: ', number_success, '/', Iterations)
+    print('The success rate is: ', number_success, '/', iterations_done)
+    print('Relative positions rejected before the second stage, because they cannot fit into the facility:', rejected, '/', iterations_done)
+    print('The second stage cache had', second_stage_cache.hits, 'hits and', second_stage_cache.misses, 'misses (Gurobi solves)')
     
     # Record how much time the script takes
     endSeconds = time.time()
@@ -335,13 +399,24 @@ def main_function(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
 
 
 
-    return
+    solution = {
+        "data_dict": data_dict,
+        "DepartmentsXYrelative": DepartmentsXYrelative,
+        "DepartmentsAlpha": DepartmentsAlpha,
+        "DepartmentsBeta": DepartmentsBeta,
+        "DepartmentsXYoptimal": DepartmentsXYoptimal,
+        "obj_val": obj_value,
+        "rotated": (data_dict["Departments"]["w"].to_numpy(dtype=float) != w_input) & (w_input != h_input),
+        "top_k": [(i, obj_val_i, area_i, result_i) for i, obj_val_i, area_i, (_, _, result_i) in solutions.sorted()],
+    }
 
+    yield event("finished", solution=solution)
 
 
 
 
-def validateInput(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha, Grouping, GroupingValue, Method, Min, Iterations, VisualizationFirstStagePath, VisualizationPath, drawText):
+
+def validateInput(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTransportMeans, ExcelFilesOutputPath, Alpha, Grouping, GroupingValue, Method, ScipyMethod, Min, Iterations, FirstStageStarts, FirstStageWorkers, IterationWorkers, TimeLimit, Patience, Gap, TopK, Seed, Repulsion, RepulsionAccuracy, Optimizer, Coarsening, Initializer, Solver, HeuristicSolver, HeuristicStart, Rotations, LNSTimeLimit, LNSNeighbourhoodSize, LNSNeighbourhood, LNSWorkers, VisualizationFirstStagePath, VisualizationPath, drawText):
     """This function checks for type and value errors in the inputs of the main_function."""
 
 
@@ -368,6 +443,42 @@ def validateInput(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
     if not isinstance(Iterations, int):
         raise TypeError("The variable Iterations is not an integer.")
 
+    if not isinstance(FirstStageStarts, int):
+        raise TypeError("The variable FirstStageStarts is not an integer.")
+
+    if not isinstance(FirstStageWorkers, int):
+        raise TypeError("The variable FirstStageWorkers is not an integer.")
+
+    if not isinstance(IterationWorkers, int):
+        raise TypeError("The variable IterationWorkers is not an integer.")
+
+    if not isinstance(TimeLimit, (int, float)):
+        raise TypeError("The variable TimeLimit is not a number.")
+
+    if not isinstance(Patience, int):
+        raise TypeError("The variable Patience is not an integer.")
+
+    if not isinstance(Gap, (int, float)):
+        raise TypeError("The variable Gap is not a number.")
+
+    if not isinstance(TopK, int):
+        raise TypeError("The variable TopK is not an integer.")
+
+    if not isinstance(LNSTimeLimit, (int, float)):
+        raise TypeError("The variable LNSTimeLimit is not a number.")
+
+    if not isinstance(LNSNeighbourhoodSize, int):
+        raise TypeError("The variable LNSNeighbourhoodSize is not an integer.")
+
+    if not isinstance(LNSWorkers, int):
+        raise TypeError("The variable LNSWorkers is not an integer.")
+
+    if not (Seed is None or isinstance(Seed, int)):
+        raise TypeError("The variable Seed is neither None nor an integer.")
+
+    if not isinstance(RepulsionAccuracy, (int, float)):
+        raise TypeError("The variable RepulsionAccuracy is not a number.")
+
     if not isinstance(VisualizationFirstStagePath, str):
         raise TypeError("The name of the visualization of the first stage is not a string.")
 
@@ -383,60 +494,86 @@ def validateInput(ExcelFileInformation, ExcelFileTransportFlow, ExcelFileTranspo
     if Iterations == 0:
         raise ValueError("There is no Iteration. Increase the number of Iterations to at least 1.")
 
-    if not (Method == "gradient_descent" or Method == "scipy_minimize"):
-        raise ValueError('The variable Method is wrongly specified. Available options: "scipy_minimize", "gradient_descent"')
+    if not (Method == "gradient_descent" or Method == "batched_gradient_descent" or Method == "multilevel" or Method == "scipy_minimize"):
+        raise ValueError('The variable Method is wrongly specified. Available options: "scipy_minimize", "gradient_descent", "batched_gradient_descent", "multilevel"')
+
+    if not ScipyMethod in ["SLSQP", "L-BFGS-B", "trust-constr"]:
+        raise ValueError('The variable ScipyMethod is wrongly specified. Available options: "SLSQP", "L-BFGS-B", "trust-constr"')
     
-    if not (0 <= GroupingValue and GroupingValue <= 1):
-        raise ValueError('The variable GroupingValue is not between 0 and 1.')
+    if FirstStageStarts < 1:
+        raise ValueError("There is no first stage start position. Increase FirstStageStarts to at least 1.")
 
-    if not (Min == "cost" or Min == "area"):
-        raise ValueError('The variable Min is wrongly specified. Available options: "cost", "area"')
+    if FirstStageWorkers < 0:
+        raise ValueError("The variable FirstStageWorkers is negative.")
 
-    if not VisualizationFirstStagePath.endswith(".png"):
-        warnings.warn("The name of the visualization of the first stage does not end with '.png'")
+    if IterationWorkers < 0:
+        raise ValueError("The variable IterationWorkers is negative.")
 
-    if not VisualizationPath.endswith(".png"):
-        warnings.warn("The name of the visualization does not end with '.png'")
+    if TimeLimit < 0:
+        raise ValueError("The variable TimeLimit is negative.")
 
+    if Patience < 0:
+        raise ValueError("The variable Patience is negative.")
 
-    return
+    if Gap < 0:
+        raise ValueError("The variable Gap is negative.")
 
+    if TopK < 1:
+        raise ValueError("There is no solution kept. Increase TopK to at least 1.")
 
+    if not (Seed is None or Seed >= 0):
+        raise ValueError("The variable Seed is negative.")
 
+    if not (Repulsion == "exact" or Repulsion == "approximate"):
+        raise ValueError('The variable Repulsion is wrongly specified. Available options: "exact", "approximate"')
 
+    if not (0 < RepulsionAccuracy and RepulsionAccuracy <= 1):
+        raise ValueError('The variable RepulsionAccuracy is not in (0, 1].')
 
-def find_best_solution(Min, obj_val_list, area_list):
-    """This function chooses the best solution based on obj_val_list or area_list"""
+    if Optimizer not in ["steepest", "heavy_ball", "nesterov", "adam", "lbfgs"]:
+        raise ValueError('The variable Optimizer is wrongly specified. Available options: "steepest", "heavy_ball", "nesterov", "adam", "lbfgs"')
 
-    index_list = []  # Initialize empty index list
+    if not (Coarsening == "flow" or Coarsening == "group"):
+        raise ValueError('The variable Coarsening is wrongly specified. Available options: "flow", "group"')
 
-    # Check which minimization type we have. A deep copy is not needed here.
-    if Min == "cost":
-        val_list = obj_val_list
-    elif Min == "area":
-        val_list = area_list
-    else:
-        raise Exception('Fatal error: Min is neither "cost" nor "area", which actually should be noticed by validateInput()')
+    if not (Initializer == "random" or Initializer == "spectral"):
+        raise ValueError('The variable Initializer is wrongly specified. Available options: "random", "spectral"')
 
+    if Solver not in ["gurobi", "highs", "flow"]:
+        raise ValueError('The variable Solver is wrongly specified. Available options: "gurobi", "highs", "flow"')
 
-    # Stop method if no solution is found
-    if all(b == 0 for b in val_list):
-        print(f"""
-################################################################################
-######  There is no solution to this problem. The facility is too small.  ######
-######  Use larger facility or increase number of iterations.             ######
-################################################################################
-    """)
-        sys.exit(0)  # Quit program if we find no solution
-    
-    # Get indices of unsuccessful tries
-    for k in range(len(val_list)):
-        if val_list[k] == 0:
-            index_list.append(k)
-    # Increase entries of unsuccessful tries such that they cannot be optimal
-    for kk in range(len(index_list)):
-        val_list[index_list[kk]]= max(val_list) + 1
-    # Get optimal index
-    opt_index = val_list.index(min(val_list))
-    
-    return opt_index
+    if not (HeuristicSolver == "same" or HeuristicSolver == "flow"):
+        raise ValueError('The variable HeuristicSolver is wrongly specified. Available options: "same", "flow"')
+
+    if HeuristicStart not in ["warm", "cold", "compare"]:
+        raise ValueError('The variable HeuristicStart is wrongly specified. Available options: "warm", "cold", "compare"')
+
+    if Rotations not in ["free", "pattern"]:
+        raise ValueError('The variable Rotations is wrongly specified. Available options: "free", "pattern"')
+
+    if LNSTimeLimit < 0:
+        raise ValueError("The variable LNSTimeLimit is negative.")
+
+    if LNSNeighbourhoodSize < 2:
+        raise ValueError("The neighbourhoods of the large neighbourhood search are too small. Increase LNSNeighbourhoodSize to at least 2.")
+
+    if LNSNeighbourhood not in ["flow", "spatial", "mixed"]:
+        raise ValueError('The variable LNSNeighbourhood is wrongly specified. Available options: "flow", "spatial", "mixed"')
+
+    if LNSWorkers < 0:
+        raise ValueError("The variable LNSWorkers is negative.")
+
+    if not (0 <= GroupingValue and GroupingValue <= 1):
+        raise ValueError('The variable GroupingValue is not between 0 and 1.')
+
+    if not (Min == "cost" or Min == "area"):
+        raise ValueError('The variable Min is wrongly specified. Available options: "cost", "area"')
+
+    if not VisualizationFirstStagePath.endswith(".png"):
+        warnings.warn("The name of the visualization of the first stage does not end with '.png'")
+
+    if not VisualizationPath.endswith(".png"):
+        warnings.warn("The name of the visualization does not end with '.png'")
+
+
+    return
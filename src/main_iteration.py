@@ -0,0 +1,145 @@
+import os
+import gurobipy as gp
+from first_stage import first_stage
+from triangulation import triangulation_relations, unpack_relations
+from relation_graph import relation_graph_fits
+from second_stage import SecondStageModel, second_stage_models
+from second_stage_cache import SecondStageCache
+
+def main_iteration(i, instance, data_dict_original, second_stage_cache, Alpha, seed_sequence, log_dir, fixed_facility=False, **first_stage_options):
+    """
+    Executes one iteration of main_function: first stage, triangulation and second stage.
+    Iterations only depend on each other through the second stage cache, whose result for the same relative positions is the same as a new solve,
+    so they can be executed in any order and in different processes, see main_iteration_worker.
+        Input:
+            - i: index of the iteration, the facility is rotated in every other iteration
+            - instance: ProblemInstance of data_dict_original, which all iterations share
+            - data_dict_original: data_dict after grouping, is not modified
+            - second_stage_cache: SecondStageCache of the second stage model of data_dict_original, whose solver returns LayoutResults
+            - Alpha: for calculating param K
+            - seed_sequence: numpy.random.SeedSequence of the first stage of this iteration
+            - log_dir: directory of the Gurobi log files
+            - fixed_facility: True if the second stage cannot rotate the facility (SecondStageFlow). It is then solved for both orientations of the
+              facility and the better layout is kept, like the free rotation of the facility in SecondStageModel.
+            - first_stage_options: keyword arguments of first_stage
+        Output:
+            - DepartmentsXYrelative: result of the first stage
+            - DepartmentsRelations: packed relative positions, see pack_relations
+            - result: LayoutResult of the second stage, None if it failed. The facility of the result can be rotated compared to data_dict_original.
+            - rejected: True if the relative positions certainly do not fit into the facility, see relation_graph_fits
+    """
+
+    # All iterations share the read-only instance instead of copying data_dict
+    iteration_instance = instance
+
+
+
+
+
+    """
+###############################
+######  Rotate Facility  ######
+###############################
+    """
+    """Here we rotate the facility in every other iteration. We do this because it can change the objective value."""
+    if i%2:
+        iteration_instance = instance.rotated_facility()
+
+
+
+
+
+    f"""
+#################################################
+######  Executing First Stage Iteration {i+1}  ######
+#################################################
+    """
+    """Here we execute the first step of the optimization. TODO: Mehr Details"""
+
+    DepartmentsXYrelative = first_stage(iteration_instance, Alpha, seed_sequence=seed_sequence, **first_stage_options)
+    #print("")  # Empty print statement for spacing
+    if DepartmentsXYrelative is None:
+        raise ValueError("First stage failed, DepartmentsXYrelative is empty.")
+    #print("Successfully solved the first stage. Following relative positions were calculated:")
+    #print(DepartmentsXYrelative)
+
+
+
+
+
+    f"""
+###################################################
+######  Executing Triangulation Iteration {i+1}  ######
+###################################################
+    """
+    """Here we determine the alpha and beta matrices which encode the relative positions of the departments. If department i is on the left of department j, alpha[i,j] = 1, otherwise alpha[i,j] = 0. Similarly beta[i,j] = 1 if i is below j, otherwise beta[i,j] = 0. Note that between two departments only the bigger relation of left/right or up/down is considered, i.e., two departments can only lay left/right OR above/below each other. This means we have alpha[i,j] + alpha[j,i] + beta[i,j] + beta[j,i] = 1, for all 1 <= i < j <= n."""
+
+    # Do Comparison/Triangulation to get the relative positions of the departments.
+    # They are stored packed with one int8 code per pair and only expanded to the matrices alpha and beta for the second stage.
+    DepartmentsRelations = triangulation_relations(DepartmentsXYrelative)
+    DepartmentsAlpha, DepartmentsBeta = unpack_relations(DepartmentsRelations, len(DepartmentsXYrelative))
+    #print("Successfully executed Triangulation step. Following Alphas and Betas were calculated:")
+    #print("Alpha = ", DepartmentsAlpha, sep="\n")
+    #print("Beta = ", DepartmentsBeta, sep="\n")
+
+
+
+
+
+    f"""
+##################################################
+######  Executing Second Stage Iteration {i+1}  ######
+##################################################
+    """
+    """Here we execute the second step of the optimization. We use Gurobi to solve the rest of the optimization problem, but with easier to solve non-overlap constraints, thanks to the alpha and beta matrices."""
+
+    # Trying to solve second stage, if the relative positions can fit into the facility at all
+    fits, width_required, height_required = relation_graph_fits(DepartmentsAlpha, DepartmentsBeta, data_dict_original)
+    if not fits:
+        return DepartmentsXYrelative, DepartmentsRelations, None, True
+    # The second stage returns a LayoutResult and does not change data_dict_original, so the iterations do not depend on each other's rotations.
+    # A second stage that keeps the orientation of the facility is also solved with the rotated facility, and the better layout is kept.
+    data_dicts = [data_dict_original]
+    if fixed_facility:
+        data_dicts.append(instance.rotated_facility().data_dict())
+    result = None
+    for data_dict_second_stage in data_dicts:
+        try:
+            result_orientation = second_stage_cache.solve(DepartmentsAlpha, DepartmentsBeta, data_dict_second_stage, output=log_dir + f"GurobiLogsHeuristicIteration{i}.log")
+        except ValueError:
+            continue
+        if result is None or result_orientation.obj_val < result.obj_val:
+            result = result_orientation
+
+    return DepartmentsXYrelative, DepartmentsRelations, result, False
+
+
+# Data of the worker processes of main_function, set by main_iteration_worker_init
+worker_instance = None
+worker_data_dict = None
+worker_cache = None
+worker_fixed_facility = False
+
+def main_iteration_worker_init(instance, data_dict_original, Solver, Rotations, log_dir):
+    """
+    Initializes a worker process of main_function that executes iterations with main_iteration_worker.
+    Every worker builds its own second stage model and cache. With Gurobi, the model gets its own Gurobi environment, which logs to the file
+    GurobiLogsWorker<process id>.log in log_dir, so the workers do not share a license token or a log file.
+    """
+
+    global worker_instance, worker_data_dict, worker_cache, worker_fixed_facility
+
+    if Solver == "gurobi":
+        env = gp.Env(log_dir + f"GurobiLogsWorker{os.getpid()}.log", params={"LogToConsole": 0})
+        model = SecondStageModel(data_dict_original, rotations=Rotations, env=env)
+    else:
+        model = second_stage_models[Solver](data_dict_original, rotations=Rotations)
+    worker_instance = instance
+    worker_data_dict = data_dict_original
+    worker_cache = SecondStageCache(solver=model.solve)
+    worker_fixed_facility = Solver == "flow"
+
+def main_iteration_worker(i, seed_sequence, Alpha, log_dir, first_stage_options):
+    """Executes main_iteration in a worker process initialized by main_iteration_worker_init. Defined on module level so it can be sent to worker processes."""
+
+    return main_iteration(i, worker_instance, worker_data_dict, worker_cache, Alpha, seed_sequence, log_dir, fixed_facility=worker_fixed_facility, **first_stage_options)
@@ -0,0 +1,179 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, LinearConstraint, Bounds
+
+class MilpModel:
+    """
+    Mixed integer linear program that is solved with the open source solver HiGHS through scipy.optimize.milp. It is the counterpart of the Gurobi models
+    for the solver "highs", which needs no license and can therefore be solved in any number of processes at the same time.
+    Variables are added in blocks and referenced by their column indices. Constraints are added as blocks of rows with sparse coefficient matrices
+    for some of the variable blocks. Adding constraints with the name of existing ones replaces them.
+    Usage:
+        model = MilpModel()
+        x = model.add_variables(n, lb=-np.inf)
+        model.add_constraints([(x, A)], lb, ub)  # lb <= A @ x <= ub
+        model.add_objective(x, c)  # minimize c @ x
+        result = model.solve()  # see scipy.optimize.milp
+    """
+
+    def __init__(self):
+        self.num_vars = 0
+        self.lb = []
+        self.ub = []
+        self.integrality = []
+        self.objective = []  # (columns, coefficients)
+        self.constraints = {}  # name -> (coefficient matrix in COO format without the number of columns, lb, ub)
+
+    def add_variables(self, size, lb=0, ub=np.inf, integer=False):
+        """Adds size variables and returns their column indices."""
+
+        columns = np.arange(self.num_vars, self.num_vars + size)
+        self.num_vars += size
+        self.lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (size,)))
+        self.ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (size,)))
+        self.integrality.append(np.full(size, int(integer)))
+
+        return columns
+
+    def set_bounds(self, columns, lb, ub):
+        """Changes the bounds of the variables with the column indices columns."""
+
+        lb_all = np.concatenate(self.lb)
+        ub_all = np.concatenate(self.ub)
+        lb_all[columns] = lb
+        ub_all[columns] = ub
+        self.lb = [lb_all]
+        self.ub = [ub_all]
+
+    def add_constraints(self, terms, lb, ub, name=None):
+        """Adds the constraints lb <= sum(A @ variables[columns] for columns, A in terms) <= ub. All coefficient matrices A need the same number of rows."""
+
+        if name is None:
+            name = len(self.constraints)
+        rows, cols, data = [], [], []
+        for columns, A in terms:
+            A = sp.coo_matrix(A)
+            rows.append(A.row)
+            cols.append(np.asarray(columns)[A.col])
+            data.append(A.data)
+            num_rows = A.shape[0]
+        self.constraints[name] = ((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), num_rows,
+                                  np.broadcast_to(np.asarray(lb, dtype=float), (num_rows,)), np.broadcast_to(np.asarray(ub, dtype=float), (num_rows,)))
+
+    def add_objective(self, columns, coefficients):
+        """Adds coefficients @ variables[columns] to the objective, which is minimized."""
+
+        self.objective.append((np.asarray(columns), np.asarray(coefficients, dtype=float)))
+
+    def solve(self, time_limit=None):
+        """Solves the model with HiGHS and returns the scipy.optimize.OptimizeResult of scipy.optimize.milp."""
+
+        c = np.zeros(self.num_vars)
+        for columns, coefficients in self.objective:
+            np.add.at(c, columns, coefficients)
+
+        blocks = [sp.csr_matrix(coo, shape=(num_rows, self.num_vars)) for coo, num_rows, lb, ub in self.constraints.values()]
+        constraints = []
+        if blocks:
+            constraints = LinearConstraint(sp.vstack(blocks, format="csr"),
+                                           np.concatenate([lb for _, _, lb, _ in self.constraints.values()]),
+                                           np.concatenate([ub for _, _, _, ub in self.constraints.values()]))
+        options = {"disp": False}
+        if time_limit is not None:
+            options["time_limit"] = time_limit
+
+        return milp(c, integrality=np.concatenate(self.integrality), bounds=Bounds(np.concatenate(self.lb), np.concatenate(self.ub)),
+                    constraints=constraints, options=options)
+
+
+def pair_difference_matrix(I, J, n):
+    """ Sparse matrix with one row per pair k, which has the entry 1 in column I[k] and -1 in column J[k], i.e., (D @ x)[k] = x[I[k]] - x[J[k]].
+    """
+
+    k = np.arange(len(I))
+
+    return sp.csr_matrix((np.concatenate((np.ones(len(I)), -np.ones(len(J)))), (np.concatenate((k, k)), np.concatenate((I, J)))), shape=(len(I), n))
+
+def milp_layout_model(w, h, w_F, h_F, I, J, c_pairs, rotation=True):
+    """
+    Builds the part of the layout models that does not depend on the relative positions, as MilpModel. This is the same as in SecondStageModel:
+    coordinates x, y, rotations r, r_F, facility size w_F_hat, h_F_hat, distances d_x, d_y of the pairs I, J with the linearization constraints,
+    the constraints keeping the departments inside the facility and the objective sum(c_pairs * (d_x + d_y)).
+        Input:
+            - w, h: widths and heights of the departments
+            - w_F, h_F: width and height of the facility
+            - I, J, c_pairs: pairs of departments with transport costs
+            - rotation: False to fix r and r_F to 1, i.e., no department and not the facility can be rotated
+        Output:
+            - model: MilpModel
+            - variables: dictionary of the column indices of the variables "x", "y", "r", "r_F", "w_F_hat", "h_F_hat", "d_x", "d_y"
+    """
+
+    n = len(w)
+    m = len(I)
+    model = MilpModel()
+
+    ##############  Variables  ##############
+
+    x = model.add_variables(n, lb=-np.inf)
+    y = model.add_variables(n, lb=-np.inf)
+    # r = 1: not rotated, r = 0: rotated by 90°, same for r_F
+    r = model.add_variables(n, lb=0 if rotation else 1, ub=1, integer=True)
+    r_F = model.add_variables(1, lb=0 if rotation else 1, ub=1, integer=True)
+    w_F_hat = model.add_variables(1)
+    h_F_hat = model.add_variables(1)
+    d_x = model.add_variables(m)
+    d_y = model.add_variables(m)
+
+    ##############  Constraints  ##############
+
+    # The width of a department is w_hat = h + (w-h) * r, the height h_hat = w + (h-w) * r
+    D = pair_difference_matrix(I, J, n)
+    E = sp.identity(m)
+    E_n = sp.identity(n)
+    ones = np.ones((n, 1))
+
+    #Constraints for the linearization of the objective function
+    model.add_constraints([(d_x, E), (x, -D)], 0, np.inf)
+    model.add_constraints([(d_x, E), (x, D)], 0, np.inf)
+    model.add_constraints([(d_y, E), (y, -D)], 0, np.inf)
+    model.add_constraints([(d_y, E), (y, D)], 0, np.inf)
+
+    #Constraints to make sure the departments are inside the facility, -(w_F_hat - w_hat)/2 <= x <= (w_F_hat - w_hat)/2
+    model.add_constraints([(x, E_n), (r, sp.diags(-(w-h)/2)), (w_F_hat, ones/2)], h/2, np.inf)
+    model.add_constraints([(x, E_n), (r, sp.diags((w-h)/2)), (w_F_hat, -ones/2)], -np.inf, -h/2)
+    model.add_constraints([(y, E_n), (r, sp.diags(-(h-w)/2)), (h_F_hat, ones/2)], w/2, np.inf)
+    model.add_constraints([(y, E_n), (r, sp.diags((h-w)/2)), (h_F_hat, -ones/2)], -np.inf, -w/2)
+
+    #rotation constraints, w_F_hat = r_F*w_F + (1-r_F)*h_F, h_F_hat = (1-r_F)*w_F + r_F*h_F
+    model.add_constraints([(w_F_hat, [[1]]), (r_F, [[-(w_F - h_F)]])], h_F, h_F)
+    model.add_constraints([(h_F_hat, [[1]]), (r_F, [[-(h_F - w_F)]])], w_F, w_F)
+
+    ##############  Objective function  ##############
+
+    model.add_objective(d_x, c_pairs)
+    model.add_objective(d_y, c_pairs)
+
+    variables = {"x": x, "y": y, "r": r, "r_F": r_F, "w_F_hat": w_F_hat, "h_F_hat": h_F_hat, "d_x": d_x, "d_y": d_y}
+
+    return model, variables
+
+def milp_layout_non_overlap(model, variables, w, h, I, J, axis, indicator=None, M=0, name=None):
+    """
+    Adds the non-overlap constraints "I[k] is left of J[k]" (axis "x") or "I[k] is below J[k]" (axis "y") to a model of milp_layout_model.
+    If indicator are the column indices of binary variables, the constraint of pair k is only active if indicator[k] = 1, using the big M method.
+    """
+
+    n = len(w)
+    m = len(I)
+    coordinate = variables[axis]
+    # size along the axis: b + (a-b) * r
+    a, b = (w, h) if axis == "x" else (h, w)
+
+    k = np.arange(m)
+    R = sp.csr_matrix((np.concatenate(((a-b)[I]/2, (a-b)[J]/2)), (np.concatenate((k, k)), np.concatenate((I, J)))), shape=(m, n))
+    terms = [(coordinate, pair_difference_matrix(I, J, n)), (variables["r"], R)]
+    if indicator is not None:
+        terms.append((indicator, M * sp.identity(m)))
+
+    model.add_constraints(terms, -np.inf, M - (b[I] + b[J])/2, name=name)
@@ -26,7 +26,7 @@ def parseIni(iniPath):
 
 
 def convert(input):
-    """This function smartly casts a string to integer, float, bool, or leave it as a string, depending on its content."""
+    """This function smartly casts a string to integer, float, bool, None, or leave it as a string, depending on its content."""
 
     assert isinstance(input, str), "Input is not a string!"
 
@@ -50,6 +50,10 @@ def convert(input):
     elif input.lower() == "false":
         return False
 
+    # Try to convert to None
+    if input.lower() == "none":
+        return None
+
     # No appropriate data type was found, just return string input.
     return input
 
@@ -69,6 +73,8 @@ if __name__ == "__main__":
     print(f'{type(convert("True"))=}')
     print(f'{convert("False")=}')
     print(f'{type(convert("False"))=}')
+    print(f'{convert("None")=}')
+    print(f'{type(convert("None"))=}')
     print("\n")
 
     """Test parseIni function"""
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+from import_data import unpack_data_dict
+from first_stage_nonlinear_gradient import first_stage_nonlinear_K, first_stage_nonlinear_theta_squared, first_stage_nonlinear_pair_matrices
+
+class ProblemInstance:
+    """
+    Compact, read-only representation of an instance that all stages share instead of copies of data_dict.
+    All arrays are numpy arrays that cannot be written to, so the same object can be passed to every iteration and every stage without copying it.
+    The instance data that the first stage needs in every start (the repulsion constant K and the matrix theta_squared) is computed once.
+    Usage:
+        instance = ProblemInstance.from_data_dict(data_dict, Alpha)
+        instance.w, instance.h, instance.w_F, instance.h_F, instance.c, instance.I, instance.J, instance.c_pairs, instance.K, instance.theta_squared()
+        rotated_instance = instance.rotated_facility()
+        data_dict = instance.data_dict()
+    """
+
+    __slots__ = ("names", "w", "h", "group", "w_F", "h_F", "c", "I", "J", "c_pairs", "Alpha", "K", "_theta_squared", "_pair_matrices")
+
+    def __init__(self, names, w, h, group, w_F, h_F, c, Alpha=0.5):
+        """
+        Input:
+            - names, w, h, group: names, widths, heights and groups (nan if none) of the departments
+            - w_F, h_F: width and height of the facility
+            - c: transport costs between the departments, only the upper triangle (i<j) is used
+            - Alpha: for calculating param K of the first stage
+        """
+
+        self.names = read_only(np.array(names, dtype=object))
+        self.w = read_only(np.array(w, dtype=float))
+        self.h = read_only(np.array(h, dtype=float))
+        self.group = read_only(np.array(group, dtype=float))
+        self.w_F = float(w_F)
+        self.h_F = float(h_F)
+        self.c = read_only(np.array(c, dtype=float))
+
+        # Sparse pair table: the pairs i<j with positive transport costs
+        I, J = np.triu_indices(len(self.w), k=1)
+        c_pairs = self.c[I, J]
+        self.I = read_only(I[c_pairs > 0])
+        self.J = read_only(J[c_pairs > 0])
+        self.c_pairs = read_only(c_pairs[c_pairs > 0])
+
+        # repulsion constant of the first stage
+        self.Alpha = Alpha
+        self.K = first_stage_nonlinear_K(self.c, Alpha)
+        self._theta_squared = None
+        self._pair_matrices = None
+
+    @classmethod
+    def from_data_dict(cls, data_dict, Alpha=0.5):
+        """Creates the instance of a data_dict, see import_data."""
+
+        Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+
+        return cls(Departments["name"].to_numpy(), Departments["w"].to_numpy(dtype=float), Departments["h"].to_numpy(dtype=float),
+                   Departments["group"].to_numpy(dtype=float), Facility.iloc[0]["w"], Facility.iloc[0]["h"], DepartmentsDependencies, Alpha=Alpha)
+
+    def __len__(self):
+        return len(self.w)
+
+    def theta_squared(self):
+        """Matrix theta_squared of the first stage, see first_stage_nonlinear_theta_squared. Computed at the first call, since it needs n^2 memory."""
+
+        if self._theta_squared is None:
+            self._theta_squared = read_only(first_stage_nonlinear_theta_squared(self.w, self.h))
+
+        return self._theta_squared
+
+    def pair_matrices(self):
+        """theta_squared_sym and c_sym of the first stage, see first_stage_nonlinear_pair_matrices. Computed at the first call."""
+
+        if self._pair_matrices is None:
+            theta_squared_sym, c_sym = first_stage_nonlinear_pair_matrices(self.theta_squared(), self.c)
+            self._pair_matrices = (read_only(theta_squared_sym), read_only(c_sym))
+
+        return self._pair_matrices
+
+    def lower_bound(self):
+        """
+        Lower bound of the objective value of the second stage, sum(c_ij * (|x_i-x_j| + |y_i-y_j|)). Two departments that do not overlap are at least half
+        the sum of their widths apart in x-direction or half the sum of their heights apart in y-direction, so |x_i-x_j| + |y_i-y_j| is at least
+        half the sum of their shorter sides, in any rotation.
+        """
+
+        short = np.minimum(self.w, self.h)
+
+        return float(np.sum(self.c_pairs * (short[self.I] + short[self.J]) / 2))
+
+    def copy(self):
+        """Copy of the instance that shares all arrays."""
+
+        instance = object.__new__(ProblemInstance)
+        for slot in ProblemInstance.__slots__:
+            setattr(instance, slot, getattr(self, slot))
+
+        return instance
+
+    def rotated_facility(self):
+        """Same instance with width and height of the facility swapped, see change_facility_rot."""
+
+        instance = self.copy()
+        instance.w_F, instance.h_F = self.h_F, self.w_F
+
+        return instance
+
+    def with_alpha(self, Alpha):
+        """Same instance with the repulsion constant K of Alpha."""
+
+        instance = self.copy()
+        instance.Alpha = Alpha
+        instance.K = first_stage_nonlinear_K(self.c, Alpha)
+
+        return instance
+
+    def data_dict(self):
+        """New data_dict of the instance for the functions that work with DataFrames, e.g. visualize and export_data."""
+
+        # The DataFrames get copies of the arrays, since DataFrames are changed in place, e.g. by rotate_facility
+        Departments = pd.DataFrame({"name": self.names.copy(), "w": self.w.copy(), "h": self.h.copy(), "group": self.group.copy()})
+        Facility = pd.DataFrame({"name": ["Facility"], "w": [self.w_F], "h": [self.h_F]})
+
+        return {
+            "Departments": Departments,
+            "Facility": Facility,
+            "DepartmentsDependencies": self.c,
+        }
+
+
+class LayoutResult:
+    """
+    Result of a second stage solve: coordinates, widths and heights (i.e., the rotations) of the departments, the size of the facility and the objective value.
+    The second stages return it instead of setting the widths and heights of the DataFrames of data_dict in place.
+    """
+
+    __slots__ = ("x", "y", "w", "h", "w_F", "h_F", "obj_val")
+
+    def __init__(self, x, y, w, h, w_F, h_F, obj_val):
+        self.x = read_only(np.array(x, dtype=float))
+        self.y = read_only(np.array(y, dtype=float))
+        self.w = read_only(np.array(w, dtype=float))
+        self.h = read_only(np.array(h, dtype=float))
+        self.w_F = float(w_F)
+        self.h_F = float(h_F)
+        self.obj_val = float(obj_val)
+
+    def DepartmentsXY(self, names):
+        """DataFrame with the names and coordinates of the departments, like DepartmentsXYoptimal."""
+
+        return pd.DataFrame({"name": names, "x": self.x.copy(), "y": self.y.copy()})
+
+    def solution(self, data_dict):
+        """
+        (DepartmentsXY, data_dict, obj_val) as returned by second_stage. The returned data_dict consists of new DataFrames with the widths and heights
+        of the result, the given data_dict is not changed.
+        """
+
+        Departments = data_dict["Departments"].copy()
+        Facility = data_dict["Facility"].copy()
+        Departments["w"] = self.w.copy()
+        Departments["h"] = self.h.copy()
+        Facility["w"] = self.w_F
+        Facility["h"] = self.h_F
+        data_dict = {
+            "Departments": Departments,
+            "Facility": Facility,
+            "DepartmentsDependencies": data_dict["DepartmentsDependencies"],
+        }
+
+        return self.DepartmentsXY(Departments["name"].to_numpy()), data_dict, self.obj_val
+
+    def evaluate(self):
+        """Width, height and area of the rectangle occupied by the layout, see evaluate_solution."""
+
+        width = np.max(self.x + self.w/2) - np.min(self.x - self.w/2)
+        height = np.max(self.y + self.h/2) - np.min(self.y - self.h/2)
+
+        return width, height, width * height
+
+    @classmethod
+    def from_solution(cls, DepartmentsXY, data_dict, obj_val):
+        """Result of (DepartmentsXY, data_dict, obj_val) as returned by second_stage."""
+
+        Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+
+        return cls(DepartmentsXY["x"].to_numpy(dtype=float), DepartmentsXY["y"].to_numpy(dtype=float), Departments["w"].to_numpy(dtype=float),
+                   Departments["h"].to_numpy(dtype=float), Facility.iloc[0]["w"], Facility.iloc[0]["h"], obj_val)
+
+
+def problem_instance(data_dict, Alpha=0.5):
+    """Returns the ProblemInstance of data_dict for Alpha. data_dict can be a data_dict or a ProblemInstance, which is then not copied."""
+
+    if isinstance(data_dict, ProblemInstance):
+        return data_dict if data_dict.Alpha == Alpha else data_dict.with_alpha(Alpha)
+
+    return ProblemInstance.from_data_dict(data_dict, Alpha)
+
+def read_only(array):
+    """Makes a numpy array read-only, so it can be shared without copying it. Only for arrays that are not referenced anywhere else."""
+
+    array.flags.writeable = False
+
+    return array
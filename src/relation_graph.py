@@ -0,0 +1,139 @@
+import numpy as np
+
+# The relative positions of the second stage define two directed graphs on the departments:
+# the left-of graph with an edge i -> j if alpha[i,j] = 1 and the below graph with an edge i -> j if beta[i,j] = 1.
+# Both are acyclic if the relative positions come from actual coordinates (e.g. by triangulation).
+
+def relation_graph_topological_order(Relation):
+    """ Calculates a topological order of the graph with adjacency matrix Relation (n x n, nonzero entries are edges).
+    Returns None if the graph has a cycle.
+    """
+
+    Relation = np.asarray(Relation) != 0
+    n = len(Relation)
+    in_degree = np.sum(Relation, axis=0)
+    order = []
+    ready = list(np.flatnonzero(in_degree == 0))
+    while ready:
+        i = ready.pop()
+        order.append(i)
+        successors = np.flatnonzero(Relation[i])
+        in_degree[successors] -= 1
+        ready.extend(successors[in_degree[successors] == 0])
+
+    if len(order) < n:
+        return None
+
+    return np.array(order, dtype=int)
+
+def relation_graph_reduction(Relation, fallback=False):
+    """ Calculates the transitive reduction of the acyclic graph with adjacency matrix Relation, i.e., only keeps the edges i -> j
+    for which there is no other path from i to j. For the left-of graph, the non-overlap constraint of such an edge is implied by the constraints
+    along the other path, because every department has a nonnegative width; analogously for the below graph.
+        Input:
+            - Relation: n x n matrix, nonzero entries are edges
+            - fallback: if True, all edges are returned if the graph has a cycle, e.g. to build a model that is then infeasible
+        Output:
+            - I, J: arrays with the start and end departments of the kept edges, None if the graph has a cycle (and fallback is False)
+    """
+
+    Relation = np.asarray(Relation) != 0
+    n = len(Relation)
+    order = relation_graph_topological_order(Relation)
+    if order is None:
+        return np.nonzero(Relation) if fallback else None
+
+    # Reachable[i,j] = True if there is a path from i to j, filled in reverse topological order
+    Reachable = np.zeros((n,n), dtype=bool)
+    for i in order[::-1]:
+        successors = np.flatnonzero(Relation[i])
+        if len(successors):
+            Reachable[i] = np.any(Reachable[successors], axis=0)
+            Reachable[i, successors] = True
+
+    # An edge i -> j is implied if j can be reached from another successor k of i
+    Implied = (Relation.astype(np.float32) @ Reachable.astype(np.float32)) > 0
+    I, J = np.nonzero(Relation & ~Implied)
+
+    return I, J
+
+def relation_graph_longest_path(Relation, weights):
+    """ Calculates the maximum total weight of a path in the acyclic graph with adjacency matrix Relation, where every department on the path
+    contributes its weight. Returns np.inf if the graph has a cycle.
+    """
+
+    Relation = np.asarray(Relation) != 0
+    order = relation_graph_topological_order(Relation)
+    if order is None:
+        return np.inf
+    if len(order) == 0:
+        return 0.0
+
+    # longest[j] = heaviest path ending in j, filled in topological order
+    longest = np.array(weights, dtype=float)
+    for i in order:
+        successors = np.flatnonzero(Relation[i])
+        longest[successors] = np.maximum(longest[successors], longest[i] + weights[successors])
+
+    return float(np.max(longest))
+
+def relation_graph_path_lengths(Relation, weights):
+    """ Calculates for every department the maximum total weight of a path through it in the acyclic graph with adjacency matrix Relation,
+    see relation_graph_longest_path. Returns np.inf for all departments if the graph has a cycle.
+    """
+
+    Relation = np.asarray(Relation) != 0
+    weights = np.asarray(weights, dtype=float)
+    order = relation_graph_topological_order(Relation)
+    if order is None:
+        return np.full(len(Relation), np.inf)
+
+    # ending[j] = heaviest path ending in j, filled in topological order; starting[i] = heaviest path starting in i, filled in reverse order
+    ending = weights.copy()
+    for i in order:
+        successors = np.flatnonzero(Relation[i])
+        ending[successors] = np.maximum(ending[successors], ending[i] + weights[successors])
+    starting = weights.copy()
+    for i in order[::-1]:
+        successors = np.flatnonzero(Relation[i])
+        if len(successors):
+            starting[i] = weights[i] + np.max(starting[successors])
+
+    return ending + starting - weights
+
+def relation_graph_fits(DepartmentsAlpha, DepartmentsBeta, data_dict):
+    """ Checks before building the model of second_stage whether the relative positions can fit into the facility.
+    All departments on a path of the left-of graph lie next to each other, so the facility must be at least as wide as the longest such path,
+    analogously for the height and the below graph. Since the departments may be rotated, every other department on a path is counted with the
+    smaller of its width and height. A department itself has the same orientation on both axes, so for every department there has to be an orientation
+    (w, h) or (h, w) in which both the longest path of the left-of graph and the longest path of the below graph through it fit.
+    The facility may be rotated, too, so the relative positions fit if they fit into one of both orientations.
+        Input:
+            - DepartmentsAlpha, DepartmentsBeta: relative positions
+            - data_dict: extract information about departments and facility
+        Output:
+            - fits: False if second_stage is certainly infeasible
+            - width_required, height_required: lower bounds on the width and height of a layout with these relative positions
+    """
+
+    Departments = data_dict["Departments"]
+    Facility = data_dict["Facility"]
+    w = Departments["w"].to_numpy(dtype=float)
+    h = Departments["h"].to_numpy(dtype=float)
+    weights = np.minimum(w, h)
+    w_F = float(Facility.iloc[0]['w'])
+    h_F = float(Facility.iloc[0]['h'])
+
+    # Heaviest paths through every department, without the department itself
+    width_others = relation_graph_path_lengths(DepartmentsAlpha, weights) - weights
+    height_others = relation_graph_path_lengths(DepartmentsBeta, weights) - weights
+    width_required = float(np.max(width_others + weights, initial=0.0))
+    height_required = float(np.max(height_others + weights, initial=0.0))
+
+    fits = False
+    for W, H in ((w_F, h_F), (h_F, w_F)):
+        fits_unrotated = (width_others + w <= W) & (height_others + h <= H)
+        fits_rotated = (width_others + h <= W) & (height_others + w <= H)
+        fits = fits or bool(np.all(fits_unrotated | fits_rotated))
+
+    return fits, width_required, height_required
@@ -0,0 +1,208 @@
+import time
+import numpy as np
+import pandas as pd
+from functools import partial
+from first_stage_nonlinear_gradient_descent import first_stage_nonlinear_gradient_descent
+from first_stage_nonlinear import first_stage_nonlinear_objective_gradient_function
+from triangulation import triangulation
+from second_stage import second_stage_models
+from second_stage_cache import SecondStageCache
+from problem_instance import ProblemInstance
+from heuristic_lns import heuristic_lns_repair
+from heuristic_relpos_loop import heuristic_relpos_loop
+from rotate_facility import rotate_facility
+from evaluate_solution import evaluate_solution
+from import_data import unpack_data_dict
+
+def relayout(solution, delta, Alpha=0.5, Optimizer="lbfgs", FirstStageIterations=200, Repulsion="exact", RepulsionAccuracy=0.5, HeuristicIterations=5, Solver="gurobi", RepairTimeLimit=30, dir=""):
+    """
+    Re-optimizes a solution of main_function after a small change of the instance (what-if analysis), without importing the Excel files
+    and without the random first stage iterations of main_function.
+        1. The change delta is applied to the instance of the solution.
+        2. The first stage is warm started from the coordinates of the solution. Only the departments touched by delta (resized, added or with changed
+           transport costs) are moved, for at most FirstStageIterations iterations.
+        3. The relative positions of all pairs of untouched departments are kept from the solution, the ones of the other pairs are determined by
+           the warm started first stage: a touched and an untouched department keep an axis on which they do not overlap in the first stage
+           (as in heuristic_relpos), all other pairs get the relative positions of the triangulation. Since the untouched departments did not move and
+           the kept relative positions agree with the order of their coordinates in the solution, the relative positions cannot contradict each other.
+        4. The second stage and the postprocessing heuristics are executed once.
+           If the second stage is infeasible with these relative positions, the relative positions of all pairs with a touched department are
+           determined by heuristic_lns_repair instead, then by heuristic_lns_repair with all departments if that finds no layout either.
+    Input parameters:
+        - solution: dictionary returned by main_function or relayout
+        - delta: dictionary with the change of the instance, all entries are optional:
+            - "resize": {name: (w, h)} new width and height of existing departments, in the orientation of the Excel file
+            - "add": {name: (w, h)} new departments. They start at the center of the departments they have transport costs with.
+            - "remove": [name, ...] departments to remove
+            - "flows": {(name_i, name_j): cost} transport costs that are added to the costs between name_i and name_j (negative to reduce them)
+        - Alpha: for calculating param K of the first stage, as in main_function
+        - Optimizer: optimizer of the warm started gradient descent, see first_stage_nonlinear_gradient_descent
+        - FirstStageIterations: maximum number of iterations of the warm started gradient descent
+        - Repulsion, RepulsionAccuracy: see main_function
+        - HeuristicIterations: maximum number of iterations of heuristic_relpos_loop
+        - Solver: solver of the second stage, "gurobi" or "highs", see main_function
+        - RepairTimeLimit: time limit in seconds of each heuristic_lns_repair, if the second stage is infeasible
+        - dir: directory of the Gurobi log files
+    Output:
+        - solution: dictionary of the new solution in the same format as the one returned by main_function
+    Raises ValueError if no layout of the changed instance is found, e.g. if the departments do not fit into the facility anymore.
+    """
+
+    startSeconds = time.time()
+
+    resize = delta.get("resize", {})
+    add = delta.get("add", {})
+    remove = set(delta.get("remove", []))
+    flows = delta.get("flows", {})
+
+    ##############  Apply delta  ##############
+
+    Departments, Facility, DepartmentsDependencies = unpack_data_dict(solution["data_dict"])
+    names = Departments["name"].tolist()
+    for name in list(resize) + list(remove) + [name for pair in flows for name in pair if name not in add]:
+        if name not in names:
+            raise ValueError(f"The department {name} does not exist.")
+    for name in add:
+        if name in names:
+            raise ValueError(f"The department {name} already exists.")
+
+    keep = np.array([name not in remove for name in names])
+    old_index = np.flatnonzero(keep) # index in the solution of the kept departments
+    n_keep = len(old_index)
+    n = n_keep + len(add)
+
+    rotated = np.concatenate((np.asarray(solution["rotated"], dtype=bool)[keep], np.zeros(len(add), dtype=bool)))
+    Departments = pd.concat([Departments[keep], pd.DataFrame({"name": list(add), "w": [float(size[0]) for size in add.values()], "h": [float(size[1]) for size in add.values()]})], ignore_index=True)
+    Departments["w"] = Departments["w"].astype(float)
+    Departments["h"] = Departments["h"].astype(float)
+    names = Departments["name"].tolist()
+    for name, (w_new, h_new) in resize.items():
+        i = names.index(name)
+        # Keep the orientation of the solution
+        Departments.loc[i, "w"] = float(h_new if rotated[i] else w_new)
+        Departments.loc[i, "h"] = float(w_new if rotated[i] else h_new)
+
+    c = np.zeros((n, n))
+    c[:n_keep, :n_keep] = np.asarray(DepartmentsDependencies, dtype=float)[np.ix_(old_index, old_index)]
+    for (name_i, name_j), cost in flows.items():
+        i, j = sorted((names.index(name_i), names.index(name_j)))
+        c[i, j] = c[i, j] + cost
+
+    data_dict = {
+        "Departments": Departments,
+        "Facility": Facility.copy(),
+        "DepartmentsDependencies": c,
+    }
+
+    # Departments whose relative positions are determined again
+    touched = np.zeros(n, dtype=bool)
+    touched[n_keep:] = True
+    for name in list(resize) + [name for pair in flows for name in pair]:
+        touched[names.index(name)] = True
+
+    ##############  Warm started first stage  ##############
+
+    x_old = solution["DepartmentsXYoptimal"]["x"].to_numpy(dtype=float)
+    y_old = solution["DepartmentsXYoptimal"]["y"].to_numpy(dtype=float)
+    x_Dep = np.zeros(n)
+    y_Dep = np.zeros(n)
+    x_Dep[:n_keep] = x_old[old_index]
+    y_Dep[:n_keep] = y_old[old_index]
+    c_sym = c + c.T
+    for i in range(n_keep, n):
+        # New departments start at the cost weighted center of their partners, or the center of the facility, with a small offset
+        weights = c_sym[i, :n_keep]
+        if np.sum(weights) > 0:
+            x_Dep[i] = np.dot(weights, x_Dep[:n_keep]) / np.sum(weights)
+            y_Dep[i] = np.dot(weights, y_Dep[:n_keep]) / np.sum(weights)
+        x_Dep[i] = x_Dep[i] + 0.1 * Departments.loc[i, "w"] * (i - n_keep + 1)
+        y_Dep[i] = y_Dep[i] + 0.1 * Departments.loc[i, "h"] * (i - n_keep + 1)
+
+    positions = np.concatenate((x_Dep, y_Dep))
+    if np.any(touched):
+        objective_gradient = first_stage_nonlinear_objective_gradient_function(Departments["w"].to_numpy(), Departments["h"].to_numpy(), c, Alpha, repulsion=Repulsion, repulsion_accuracy=RepulsionAccuracy)
+        objective_gradient = partial(relayout_objective_gradient, objective_gradient=objective_gradient, movable=np.concatenate((touched, touched)))
+        positions, _, _ = first_stage_nonlinear_gradient_descent(np.column_stack((x_Dep, y_Dep)), objective_gradient, optimizer=Optimizer, max_iters=FirstStageIterations)
+    DepartmentsXYrelative = pd.DataFrame({"name": names, "x": positions[:n], "y": positions[n:]})
+
+    ##############  Relative positions  ##############
+
+    DepartmentsAlpha, DepartmentsBeta = triangulation(DepartmentsXYrelative)
+
+    # The triangulation chooses the axis of the larger distance of the centers, not an axis on which the departments do not overlap.
+    # Pairs of a touched and an untouched department that do not overlap on one axis get the relative position on that axis instead.
+    w = Departments["w"].to_numpy(dtype=float)
+    h = Departments["h"].to_numpy(dtype=float)
+    x, y = positions[:n], positions[n:]
+    LeftOf = x[:, None] + 0.5*w[:, None] <= x[None, :] - 0.5*w[None, :]
+    Below = y[:, None] + 0.5*h[:, None] <= y[None, :] - 0.5*h[None, :]
+    mixed = touched[:, None] != touched[None, :]
+    # The axis of the triangulation is kept if the pair does not overlap on it, otherwise x is preferred to y
+    on_y = (DepartmentsBeta != 0) | (DepartmentsBeta.T != 0)
+    use_x = mixed & (LeftOf | LeftOf.T) & ~(on_y & (Below | Below.T))
+    use_y = mixed & (Below | Below.T) & ~use_x
+    DepartmentsAlpha = np.where(use_x, LeftOf, np.where(use_y, 0, DepartmentsAlpha)).astype(DepartmentsAlpha.dtype)
+    DepartmentsBeta = np.where(use_y, Below, np.where(use_x, 0, DepartmentsBeta)).astype(DepartmentsBeta.dtype)
+
+    # Pairs of untouched departments keep the relative positions of the solution
+    untouched = np.flatnonzero(~touched)
+    untouched_old = old_index[untouched]
+    DepartmentsAlpha[np.ix_(untouched, untouched)] = np.asarray(solution["DepartmentsAlpha"])[np.ix_(untouched_old, untouched_old)]
+    DepartmentsBeta[np.ix_(untouched, untouched)] = np.asarray(solution["DepartmentsBeta"])[np.ix_(untouched_old, untouched_old)]
+    print(f"Relayout: {np.sum(touched)} of {n} departments are touched, the relative positions of {len(untouched)*(len(untouched)-1)//2} of {n*(n-1)//2} pairs are kept.")
+
+    ##############  Second stage and heuristics  ##############
+
+    w_before = Departments["w"].to_numpy(dtype=float)
+    second_stage_model = second_stage_models[Solver](data_dict, output=dir + "GurobiLogsRelayout.log")
+    second_stage_cache = SecondStageCache(solver=second_stage_model.solve)
+    try:
+        DepartmentsXYoptimal, data_dict_solved, obj_val = second_stage_cache.second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output=dir + "GurobiLogsRelayout.log")
+    except ValueError:
+        # Determine the relative positions of all pairs with a touched department with the restricted second stage of heuristic_lns,
+        # and of all pairs if the departments do not fit with the relative positions of the untouched departments either
+        instance = ProblemInstance.from_data_dict(data_dict, Alpha)
+        repair = None
+        for free, free_name in ((np.flatnonzero(touched), "touched"), (np.arange(n), "all")):
+            print(f"Relayout: the second stage is infeasible, determining the relative positions of the pairs of {free_name} departments with heuristic_lns_repair.")
+            repair = heuristic_lns_repair(instance, DepartmentsAlpha, DepartmentsBeta, RepairTimeLimit, free)
+            if repair is not None:
+                break
+        if repair is None:
+            raise ValueError(f"Relayout: no layout of the changed instance was found within {RepairTimeLimit}s, the departments may not fit into the facility anymore.")
+        result, DepartmentsAlpha, DepartmentsBeta = repair
+        DepartmentsXYoptimal, data_dict_solved, obj_val = result.solution(data_dict)
+
+    DepartmentsAlpha, DepartmentsBeta, DepartmentsXYoptimal, data_dict_solved, obj_val = heuristic_relpos_loop(Alpha, data_dict_solved, DepartmentsXYoptimal, DepartmentsAlpha, DepartmentsBeta, obj_val, iterations=HeuristicIterations, dir=dir, cache=second_stage_cache)
+
+    # rotate Facility Layout back to original format of facility
+    facility_rotated = float(data_dict_solved["Facility"].iloc[0]["w"]) != float(data_dict["Facility"].iloc[0]["w"])
+    DepartmentsXYoptimal, data_dict_solved = rotate_facility(DepartmentsXYoptimal, data_dict_solved, data_dict)
+    if facility_rotated:
+        DepartmentsAlpha, DepartmentsBeta = DepartmentsBeta, DepartmentsAlpha
+
+    w_after = data_dict_solved["Departments"]["w"].to_numpy(dtype=float)
+    rotated = rotated ^ ((w_after != w_before) & (w_before != Departments["h"].to_numpy(dtype=float)))
+
+    width, height, area = evaluate_solution(DepartmentsXYoptimal, data_dict_solved)
+    print(f"Relayout: objective value {obj_val} (before: {solution['obj_val']}), area {area}, took {round(time.time() - startSeconds, 2)}s")
+
+    solution = {
+        "data_dict": data_dict_solved,
+        "DepartmentsXYrelative": DepartmentsXYrelative,
+        "DepartmentsAlpha": DepartmentsAlpha,
+        "DepartmentsBeta": DepartmentsBeta,
+        "DepartmentsXYoptimal": DepartmentsXYoptimal,
+        "obj_val": obj_val,
+        "rotated": rotated,
+    }
+
+    return solution
+
+def relayout_objective_gradient(ActualPositions, objective_gradient, movable):
+    """ Objective value and gradient of the first stage, where the gradient of the departments that must not move is set to zero.
+    """
+
+    function_value, gradient_evaluated = objective_gradient(ActualPositions)
+
+    return function_value, np.where(movable, gradient_evaluated, 0)
@@ -1,138 +1,269 @@
 import gurobipy as gp
 from gurobipy import GRB
-import pandas as pd
 import numpy as np
 from import_data import unpack_data_dict
+from problem_instance import LayoutResult
+from relation_graph import relation_graph_reduction
+from second_stage_presolve import second_stage_presolve, second_stage_pattern_rotations
+from second_stage_highs import SecondStageHighs
+from second_stage_flow import SecondStageFlow
 
-def second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output=""):
+def second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output="", start=None, solver="gurobi"):
     """
     This is the second stage of the two-step-approach.
     In this stage we place the departments inside of the facility. In contrast to the first stage, we include the non-overlap constraints, although be it - thanks to the relative positions (matrices alpha and beta) determined by the triangulation - in a more simple form.
     We use Gurobi to solve this Linear Program.
+    To solve the second stage for the same instance several times, use SecondStageModel, which builds the model only once.
+    A previous solution (DepartmentsXY, data_dict) can be passed as start, Gurobi then uses it as MIP start.
+    With solver="highs", the open source solver HiGHS is used instead of Gurobi, see SecondStageHighs.
+    With solver="flow", the rotations of data_dict are kept and the second stage is solved as two minimum cost flow problems, see SecondStageFlow.
     """
-    
-    Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
-
-    model = gp.Model('second_stage')  # Initiating the model
-    if output:
-        model.setParam('LogToConsole', 0)  # Suppress the console logs if desired
-        model.setParam('LogFile', output)  # Enable logging to file
-
-    ##############  Initilizing the data  ##############
-
-    #width: always in x-direction
-    #height: always in y -direction
-    
-    n = len(DepartmentsAlpha)   #number of departments
-    c = DepartmentsDependencies #Dataframe with the Dependencies between the departments, n rows and n columns
-    w = Departments["w"].to_numpy()  #converting the width of the departments into an numpy array of length n
-    h = Departments["h"].to_numpy()  #converting the height of the departments into an numpy array of length n
-    alpha = DepartmentsAlpha    #matrix/array of the alphas (relative locations); size: n x n; alpha[i][j]= 1 if department i is on the left of j, 0 else
-    beta = DepartmentsBeta  #matrix/array of the betas (relative locations); size: n x n; beta[i][j]= 1 if department i is on the below of j. 0 else
-    w_F = float(Facility.iloc[0]['w']) #width of facility 
-    h_F = float(Facility.iloc[0]['h']) #height of facility 
-
-
-    ##############  Variables  ##############
-
-
-    # Two distance variables; size: n x n matrices; d_x[i][j]= distance between facilities i and j in x-direction, d_y accordingly
-    d_x = model.addVars(n, n, vtype=GRB.CONTINUOUS, name="d_x")
-    d_y = model.addVars(n, n, vtype=GRB.CONTINUOUS, name="d_y")
-    
-    # Two variables; size: n x 1; x-, y-coordinates of the departments
-   
-    x = model.addVars(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="x")
-    y = model.addVars(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="y")
-
-    # Indicator variable for rotation of departments, r = 1: not rotated, r = 0: rotated by 90°
-    # r_F: \in {0,1}, 1 if no rotation of facility, 0 if facility is rotated
-    # w_F_hat, h_F_hat: number, new width and height of facility
-    r = model.addVars(n, vtype=GRB.BINARY, name="r")
-    r_F = model.addVar(vtype=GRB.BINARY, name="r_F")
-    w_F_hat = model.addVar(vtype=GRB.CONTINUOUS, name ="w_F_hat")
-    h_F_hat = model.addVar(vtype=GRB.CONTINUOUS, name ="h_F_hat")
-
-
-    
-    ##############  Constraints  ##############
-
-    #Constraints for the linearization of the objective function
-    constr0 = model.addConstrs(d_x[i,j] >= x[i] - x[j] for i in range(n) for j in range(n) if i < j)
-    constr1 = model.addConstrs(d_x[i,j] >= x[j] - x[i] for i in range(n) for j in range(n) if i < j)
-    constr2 = model.addConstrs(d_y[i,j] >= y[i] - y[j] for i in range(n) for j in range(n) if i < j)
-    constr3 = model.addConstrs(d_y[i,j] >= y[j] - y[i] for i in range(n) for j in range(n) if i < j)
-
-
-    #Constraints to make sure the departments are inside the facility
-    constr4 = model.addConstrs(1/2 * (r[i]*float(w[i])+(1-r[i])*float(h[i]) - (w_F_hat)) <= x[i] for i in range(n))
-    constr5 = model.addConstrs(1/2 * ((w_F_hat) - (r[i]*float(w[i])+(1-r[i])*float(h[i]))) >= x[i] for i in range(n))
-    constr6 = model.addConstrs(1/2 * ((1-r[i])*float(w[i])+r[i]*float(h[i]) -  (h_F_hat)) <= y[i] for i in range(n))
-    constr7 = model.addConstrs(1/2 * (h_F_hat - ((1-r[i])*float(w[i])+r[i]*float(h[i]))) >= y[i] for i in range(n))
-
-    
-    #non-overlap constraints
-    constr8 = model.addConstrs(x[i] + 1/2 * (r[i]*float(w[i])+(1-r[i])*float(h[i])) <= x[j] - 1/2 * (r[j]*float(w[j])+(1-r[j])*float(h[j])) + w_F_hat * (1 - alpha[i,j]) for i in range(n) for j in range(n) if i != j)
-    constr9 = model.addConstrs(y[i] + 1/2 * ((1-r[i])*float(w[i])+r[i]*float(h[i])) <= y[j] - 1/2 * ((1-r[j])*float(w[j])+r[j]*float(h[j])) + h_F_hat * (1 - beta[i,j]) for i in range(n) for j in range(n) if i != j)
-    
-    #rotation constraints
-    constr10 = model.addConstr(w_F_hat == r_F*w_F + (1-r_F)*h_F)
-    constr11 = model.addConstr(h_F_hat == (1-r_F)*w_F + r_F*h_F)
-
-    ##############  Objective function  ##############
-    
-
-    model.setObjective(sum(c[i,j] * (d_x[i,j] + d_y[i,j]) for i in range(n) for j in range(i+1, n)), GRB.MINIMIZE)
-
-    #Optimizing
-    model.optimize()
-
-    # Raise error if model is infeasible
-    if model.status == GRB.INFEASIBLE:
-        raise ValueError('Model is infeasible.')
-    elif model.status != GRB.OPTIMAL:
-        raise ValueError('Model does not have an optimal value.')
-    #print("model.status =", model.status)
-
-    ansX = []
-    ansY = []
-    ansr = []
-    ansr_F = r_F.x
-    
-    for i in range(n):
-        ansX.append(x[i].x)
-        ansY.append(y[i].x)
-        ansr.append(r[i].x)
-
-
-    DepartmentsXYDict = {
-        "x": ansX,
-        "y": ansY
-    }
-    ansr = np.array(ansr)
-    ansr_F = np.array(ansr_F)
-    
-    DepartmentsXY = pd.DataFrame(data=DepartmentsXYDict)
-
-    DepartmentsXY = pd.merge(Departments["name"], DepartmentsXY, left_index=True, right_index=True)
-
-    # setting new widh and hight for departments and facility as rotations might occur
-    w_new = (ansr*w) + (1-ansr)*h
-    h_new = (1-ansr)*w + ansr*h
-    w_F_new = (ansr_F*w_F) + (1-ansr_F)*h_F
-    h_F_new = (1-ansr_F)*w_F + ansr_F*h_F
-
-    Departments["w"] = w_new
-    Departments["h"] = h_new
-    Facility["w"] = w_F_new
-    Facility["h"] = h_F_new
-
-    data_dict = {
-        "Departments": Departments,
-        "Facility": Facility,
-        "DepartmentsDependencies": DepartmentsDependencies,
-    }
-    # saving the objective value for later usage
-    obj_val = model.objVal
-    
-    return DepartmentsXY, data_dict, obj_val
+
+    return second_stage_solve(DepartmentsAlpha, DepartmentsBeta, data_dict, output=output, start=start, solver=solver).solution(data_dict)
+
+def second_stage_solve(DepartmentsAlpha, DepartmentsBeta, data_dict, output="", start=None, solver="gurobi"):
+    """Same as second_stage, but returns the LayoutResult of the solve instead of (DepartmentsXY, data_dict, obj_val), see SecondStageModel.solve."""
+
+    return second_stage_models[solver](data_dict, output=output).solve(DepartmentsAlpha, DepartmentsBeta, data_dict, output=output, start=start)
+
+
+class SecondStageModel:
+    """
+    Persistent Gurobi model of the second stage for one instance. Everything except the non-overlap constraints is built once, when the object is created.
+    Every call of second_stage only removes the non-overlap constraints that are not needed anymore and adds the new ones, so Gurobi keeps the model
+    and can reuse information of the previous solve.
+    Since the departments and the facility may be rotated in the model, it can be reused for data_dict in which departments or the facility are rotated
+    compared to the data_dict the model was built with (e.g., the data_dict returned by second_stage).
+    Every solve warm starts from the basis of the previous solve. A MIP start can be passed explicitly, otherwise the one of the previous solve is cleared.
+    The optimal objective value does not depend on previous solves, but if a solve has several optimal layouts, the one returned can.
+    The rotation variables are presolved when the model is built, see second_stage_presolve. With rotations="pattern", every solve first fixes all
+    rotations as chosen by second_stage_pattern_rotations, which leaves a linear program; only if that is infeasible, the rotations are optimized, too.
+    The widths and heights of data_dict are never changed, second_stage returns a new data_dict and solve only a LayoutResult.
+    Usage:
+        model = SecondStageModel(data_dict)
+        result = model.solve(DepartmentsAlpha, DepartmentsBeta, output=...)
+        DepartmentsXY, data_dict, obj_val = model.second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output=...)
+        DepartmentsXY, data_dict, obj_val = model.second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output=..., start=(DepartmentsXY, data_dict))
+    """
+
+    def __init__(self, data_dict, output="", rotations="free", env=None):
+        """env: Gurobi environment of the model, e.g. one per process, see main_iteration_worker_init. None uses the default environment."""
+
+        Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+
+        model = gp.Model('second_stage', env=env)  # Initiating the model
+        if output:
+            model.setParam('LogToConsole', 0)  # Suppress the console logs if desired
+            model.setParam('LogFile', output)  # Enable logging to file
+
+        ##############  Initilizing the data  ##############
+
+        #width: always in x-direction
+        #height: always in y -direction
+
+        n = len(Departments)   #number of departments
+        c = DepartmentsDependencies #Dataframe with the Dependencies between the departments, n rows and n columns
+        w = Departments["w"].to_numpy()  #converting the width of the departments into an numpy array of length n
+        h = Departments["h"].to_numpy()  #converting the height of the departments into an numpy array of length n
+        w_F = float(Facility.iloc[0]['w']) #width of facility
+        h_F = float(Facility.iloc[0]['h']) #height of facility
+
+
+        ##############  Variables  ##############
+
+
+        # Only the pairs i<j with positive transport cost contribute to the objective, so only for them distance variables are needed (sparse pair index)
+        I, J = np.triu_indices(n, k=1)
+        c_pairs = np.asarray(c, dtype=float)[I, J]
+        I, J, c_pairs = I[c_pairs > 0], J[c_pairs > 0], c_pairs[c_pairs > 0]
+
+        # Two distance variables; size: number of pairs; d_x[k]= distance between facilities I[k] and J[k] in x-direction, d_y accordingly
+        d_x = model.addMVar(len(I), vtype=GRB.CONTINUOUS, name="d_x")
+        d_y = model.addMVar(len(I), vtype=GRB.CONTINUOUS, name="d_y")
+
+        # Two variables; size: n x 1; x-, y-coordinates of the departments
+
+        x = model.addMVar(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="x")
+        y = model.addMVar(n, lb=-GRB.INFINITY, vtype=GRB.CONTINUOUS, name="y")
+
+        # Indicator variable for rotation of departments, r = 1: not rotated, r = 0: rotated by 90°
+        # r_F: \in {0,1}, 1 if no rotation of facility, 0 if facility is rotated
+        # w_F_hat, h_F_hat: number, new width and height of facility
+        r = model.addMVar(n, vtype=GRB.BINARY, name="r")
+        r_F = model.addMVar(1, vtype=GRB.BINARY, name="r_F")
+        w_F_hat = model.addMVar(1, vtype=GRB.CONTINUOUS, name ="w_F_hat")
+        h_F_hat = model.addMVar(1, vtype=GRB.CONTINUOUS, name ="h_F_hat")
+
+        # Fixing the rotations of square departments (and a square facility) and of orientations that do not fit into the facility
+        r_lb, r_ub, r_F_lb, r_F_ub, link = second_stage_presolve(w, h, w_F, h_F)
+
+        # Width and height of the departments depending on their rotation
+        w_hat = r*w + (1-r)*h
+        h_hat = (1-r)*w + r*h
+
+
+
+        ##############  Constraints  ##############
+
+        #Constraints for the linearization of the objective function
+        constr0 = model.addConstr(d_x >= x[I] - x[J])
+        constr1 = model.addConstr(d_x >= x[J] - x[I])
+        constr2 = model.addConstr(d_y >= y[I] - y[J])
+        constr3 = model.addConstr(d_y >= y[J] - y[I])
+
+
+        #Constraints to make sure the departments are inside the facility
+        constr4 = model.addConstr(1/2 * (w_hat - w_F_hat) <= x)
+        constr5 = model.addConstr(1/2 * (w_F_hat - w_hat) >= x)
+        constr6 = model.addConstr(1/2 * (h_hat - h_F_hat) <= y)
+        constr7 = model.addConstr(1/2 * (h_F_hat - h_hat) >= y)
+
+        #non-overlap constraints constr8 and constr9 depend on the relative positions and are added in second_stage
+
+        #rotation constraints
+        constr10 = model.addConstr(w_F_hat == r_F*w_F + (1-r_F)*h_F)
+        constr11 = model.addConstr(h_F_hat == (1-r_F)*w_F + r_F*h_F)
+
+        #departments that only fit into the facility in one orientation per facility orientation are rotated with the facility
+        if np.any(link == 1):
+            constr12 = model.addConstr(r[link == 1] == r_F)
+        if np.any(link == -1):
+            constr13 = model.addConstr(r[link == -1] == 1 - r_F)
+
+        ##############  Objective function  ##############
+
+
+        model.setObjective(c_pairs @ d_x + c_pairs @ d_y, GRB.MINIMIZE)
+
+        self.model = model
+        self.n = n
+        self.w = w
+        self.h = h
+        self.w_F = w_F
+        self.h_F = h_F
+        self.x = x
+        self.y = y
+        self.r = r
+        self.r_F = r_F
+        self.bounds = (r_lb, r_ub, r_F_lb, r_F_ub)
+        self.rotations = rotations
+        self.constr8 = {} # (i,j) -> constraint "i left of j"
+        self.constr9 = {} # (i,j) -> constraint "i below j"
+
+    def second_stage(self, DepartmentsAlpha, DepartmentsBeta, data_dict, output="", start=None):
+        """
+        Solves the second stage for the relative positions DepartmentsAlpha and DepartmentsBeta, see the function second_stage.
+        Returns (DepartmentsXY, data_dict, obj_val), where data_dict is a new data_dict with the widths and heights of the solution.
+        """
+
+        return self.solve(DepartmentsAlpha, DepartmentsBeta, data_dict, output=output, start=start).solution(data_dict)
+
+    def solve(self, DepartmentsAlpha, DepartmentsBeta, data_dict=None, output="", start=None):
+        """
+        Solves the second stage for the relative positions DepartmentsAlpha and DepartmentsBeta and returns the LayoutResult.
+        data_dict is not used, the widths and heights are the ones of the model.
+        start: None or (DepartmentsXY, data_dict) of a previous solution of this instance, which is used as MIP start.
+        """
+
+        model = self.model
+        n = self.n
+        w = self.w
+        h = self.h
+        x = self.x
+        y = self.y
+        r = self.r
+        if output:
+            model.setParam('LogToConsole', 0)  # Suppress the console logs if desired
+            model.setParam('LogFile', output)  # Enable logging to file
+
+        #non-overlap constraints
+        # Only needed for the pairs with alpha[i,j] = 1 (beta[i,j] = 1), for all other pairs they are implied by the constraints keeping the departments inside the facility.
+        # Of these, only the edges of the transitive reduction of the left-of (below) graph are needed, see relation_graph_reduction.
+        # If a graph has a cycle, all its edges are used and the model is infeasible.
+        left_I, left_J = relation_graph_reduction(DepartmentsAlpha, fallback=True)
+        below_I, below_J = relation_graph_reduction(DepartmentsBeta, fallback=True)
+        left = set(zip(left_I.tolist(), left_J.tolist()))
+        below = set(zip(below_I.tolist(), below_J.tolist()))
+
+        # Only exchange the constraints whose relative positions changed since the last solve
+        model.remove([self.constr8.pop(pair) for pair in set(self.constr8) - left])
+        model.remove([self.constr9.pop(pair) for pair in set(self.constr9) - below])
+        # The new constraints are added at once as matrix constraints and then stored per pair, so they can be removed individually later
+        new_left = sorted(left - set(self.constr8))
+        new_below = sorted(below - set(self.constr9))
+        if new_left:
+            i, j = np.array(new_left).T
+            constrs = model.addConstr(x[i] + 1/2 * (r[i]*w[i]+(1-r[i])*h[i]) <= x[j] - 1/2 * (r[j]*w[j]+(1-r[j])*h[j]))
+            self.constr8.update(zip(new_left, constrs.tolist()))
+        if new_below:
+            i, j = np.array(new_below).T
+            constrs = model.addConstr(y[i] + 1/2 * ((1-r[i])*w[i]+r[i]*h[i]) <= y[j] - 1/2 * ((1-r[j])*w[j]+r[j]*h[j]))
+            self.constr9.update(zip(new_below, constrs.tolist()))
+
+        # With rotations="pattern", the linear program with the rotations of the relative positions is solved first, then the model with the presolved rotations
+        attempts = [self.bounds]
+        if self.rotations == "pattern":
+            attempts.insert(0, second_stage_pattern_rotations(DepartmentsAlpha, DepartmentsBeta, w, h, self.w_F, self.h_F, *self.bounds))
+        for r_lb, r_ub, r_F_lb, r_F_ub in attempts:
+            r.LB = r_lb
+            r.UB = r_ub
+            self.r_F.LB = [r_F_lb]
+            self.r_F.UB = [r_F_ub]
+
+            # The model is not reset, so Gurobi can warm start from the basis of the previous solve after the exchanged constraints.
+            # Only the MIP start of the previous solve is discarded if no new one is given.
+            if start is not None:
+                self.set_start(*start)
+            else:
+                self.clear_start()
+
+            #Optimizing
+            model.optimize()
+            if model.status == GRB.OPTIMAL:
+                break
+
+        # Raise error if model is infeasible
+        if model.status == GRB.INFEASIBLE:
+            raise ValueError('Model is infeasible.')
+        elif model.status != GRB.OPTIMAL:
+            raise ValueError('Model does not have an optimal value.')
+        #print("model.status =", model.status)
+
+        w_F = self.w_F
+        h_F = self.h_F
+
+        # Reading all values of a variable at once
+        ansr = r.X
+        ansr_F = self.r_F.X[0]
+
+        # new widh and hight for departments and facility as rotations might occur
+        return LayoutResult(x.X, y.X, (ansr*w) + (1-ansr)*h, (1-ansr)*w + ansr*h, (ansr_F*w_F) + (1-ansr_F)*h_F, (1-ansr_F)*w_F + ansr_F*h_F, model.objVal)
+
+    def set_start(self, DepartmentsXY, data_dict):
+        """
+        Sets a previous solution as MIP start. The coordinates are taken from DepartmentsXY. The rotations are recovered
+        from the widths in data_dict, which second_stage sets to the ones of the solution: a department (the facility) is not rotated
+        if its width is closer to the width than to the height of the model.
+        """
+
+        w = data_dict["Departments"]["w"].to_numpy(dtype=float)
+        w_F = float(data_dict["Facility"].iloc[0]['w'])
+
+        self.x.Start = DepartmentsXY["x"].to_numpy(dtype=float)
+        self.y.Start = DepartmentsXY["y"].to_numpy(dtype=float)
+        self.r.Start = (np.abs(w - self.w) <= np.abs(w - self.h)).astype(float)
+        self.r_F.Start = [float(abs(w_F - self.w_F) <= abs(w_F - self.h_F))]
+
+    def clear_start(self):
+        """Removes the MIP start, e.g. the one of a previous solve."""
+
+        for variables in (self.x, self.y, self.r, self.r_F):
+            variables.Start = GRB.UNDEFINED
+
+
+# Persistent second stage models of the available solvers
+second_stage_models = {
+    "gurobi": SecondStageModel,
+    "highs": SecondStageHighs,
+    "flow": SecondStageFlow,
+}
@@ -0,0 +1,69 @@
+import hashlib
+import numpy as np
+from second_stage import second_stage_solve
+from triangulation import pack_relations
+from import_data import unpack_data_dict
+
+
+class SecondStageCache:
+    """
+    Memo cache for second_stage. Different first stage runs often triangulate to the same relative positions, which then lead to the same second stage.
+    The cache is keyed by a hash of the packed relative positions (see pack_relations) and a fingerprint of the instance, i.e., the widths and heights
+    of the departments, the width and height (and thus the orientation) of the facility and the transport costs.
+    A stored solution (a LayoutResult), or the verdict that the second stage has no optimal solution, is returned without calling Gurobi again.
+    The solves are done by solver, which is called like second_stage_solve, e.g. the method solve of a SecondStageModel.
+    Usage:
+        cache = SecondStageCache(solver=model.solve)
+        result = cache.solve(DepartmentsAlpha, DepartmentsBeta, data_dict, output=...)
+        DepartmentsXY, data_dict, obj_val = cache.second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict, output=...)
+    """
+
+    def __init__(self, solver=second_stage_solve):
+        self.solver = solver
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, DepartmentsAlpha, DepartmentsBeta, data_dict):
+        """Hash of the relative positions and the instance."""
+
+        Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+
+        digest = hashlib.sha1()
+        digest.update(pack_relations(DepartmentsAlpha, DepartmentsBeta).tobytes())
+        digest.update(Departments["w"].to_numpy(dtype=float).tobytes())
+        digest.update(Departments["h"].to_numpy(dtype=float).tobytes())
+        digest.update(np.array([Facility.iloc[0]["w"], Facility.iloc[0]["h"]], dtype=float).tobytes())
+        digest.update(np.ascontiguousarray(DepartmentsDependencies, dtype=float).tobytes())
+
+        return digest.hexdigest()
+
+    def solve(self, DepartmentsAlpha, DepartmentsBeta, data_dict, output="", start=None):
+        """Same as second_stage_solve, but only solves the model if the relative positions and the instance have not been solved before.
+        Raises the same ValueError as second_stage if the stored second stage had no optimal solution.
+        The MIP start start is passed to solver, it does not change the key."""
+
+        key = self.key(DepartmentsAlpha, DepartmentsBeta, data_dict)
+
+        if key in self.entries:
+            self.hits += 1
+            entry = self.entries[key]
+            if isinstance(entry, ValueError):
+                raise ValueError(*entry.args)
+            # LayoutResult is read-only, so it can be returned without copying it
+            return entry
+
+        self.misses += 1
+        try:
+            result = self.solver(DepartmentsAlpha, DepartmentsBeta, data_dict, output=output, start=start)
+        except ValueError as error:
+            self.entries[key] = error
+            raise
+        self.entries[key] = result
+
+        return result
+
+    def second_stage(self, DepartmentsAlpha, DepartmentsBeta, data_dict, output="", start=None):
+        """Same as second_stage with the cache of solve. Returns (DepartmentsXY, data_dict, obj_val) with a new data_dict, see LayoutResult.solution."""
+
+        return self.solve(DepartmentsAlpha, DepartmentsBeta, data_dict, output=output, start=start).solution(data_dict)
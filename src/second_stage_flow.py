@@ -0,0 +1,192 @@
+import math
+import numpy as np
+import networkx as nx
+from concurrent.futures import ProcessPoolExecutor
+from import_data import unpack_data_dict
+from problem_instance import LayoutResult
+from relation_graph import relation_graph_reduction, relation_graph_longest_path
+from second_stage_presolve import second_stage_presolve, second_stage_pattern_rotations
+
+class SecondStageFlow:
+    """
+    Second stage with fixed rotations, solved as two minimum cost flow problems instead of a MIP.
+    If the rotations of the departments and the facility are fixed, the second stage splits into one linear program for the x-coordinates and one for
+    the y-coordinates. Both only have constraints on differences of coordinates (non-overlap: x_j - x_i >= (w_i + w_j)/2, inside the facility:
+    bounds on x_i - x_0 with a reference coordinate x_0 = 0) and minimize sum(c[i,j] * |x_i - x_j|). The dual of such a linear program is a minimum cost
+    flow problem, see second_stage_flow_axis, which is solved with the network simplex of networkx. No license is needed.
+    The rotations are the ones of the data_dict passed to second_stage, e.g., the unrotated ones of the Excel files or the ones of a previous solution.
+    Hence the result can be worse than the one of SecondStageModel, which also optimizes the rotations, but is always at least as good as the previous
+    solution for the same rotations. This makes it a fast path for heuristic_relpos_loop and for large instances.
+    With rotations="pattern", the rotations are chosen from the relative positions by second_stage_pattern_rotations instead, if the departments
+    fit with them; otherwise the ones of data_dict are kept.
+    output (no log files) and start (no MIP start) are ignored.
+    Usage:
+        model = SecondStageFlow(data_dict)
+        DepartmentsXY, data_dict, obj_val = model.second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict)
+        with SecondStageFlow(data_dict, workers=2) as model:  # closes the processes of the axes at the end
+            result = model.solve(DepartmentsAlpha, DepartmentsBeta)
+    """
+
+    def __init__(self, data_dict, output="", rotations="free", workers=1):
+        """
+        workers: 1 solves the x- and y-axis one after another, 2 in two parallel processes, which have to be closed with close.
+        Sending the arrays to the processes usually costs more than solving the axes in parallel saves, even for 200 departments.
+        """
+
+        Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+
+        n = len(Departments)
+        I, J = np.triu_indices(n, k=1)
+        c_pairs = np.asarray(DepartmentsDependencies, dtype=float)[I, J]
+
+        self.n = n
+        self.I = I[c_pairs > 0]
+        self.J = J[c_pairs > 0]
+        self.c_pairs = c_pairs[c_pairs > 0]
+        self.w = Departments["w"].to_numpy(dtype=float)
+        self.h = Departments["h"].to_numpy(dtype=float)
+        self.w_F = float(Facility.iloc[0]['w'])
+        self.h_F = float(Facility.iloc[0]['h'])
+        self.bounds = second_stage_presolve(self.w, self.h, self.w_F, self.h_F)[:4]
+        self.rotations = rotations
+        # networkx holds the GIL, so the two axes only run in parallel in separate processes. The pool is created at the first solve.
+        self.workers = workers
+        self.executor = None
+
+    def second_stage(self, DepartmentsAlpha, DepartmentsBeta, data_dict, output="", start=None):
+        """
+        Solves the second stage for the relative positions DepartmentsAlpha and DepartmentsBeta with the widths and heights of data_dict.
+        Raises ValueError('Model is infeasible.') like SecondStageModel.second_stage if the departments do not fit.
+        """
+
+        return self.solve(DepartmentsAlpha, DepartmentsBeta, data_dict, output=output, start=start).solution(data_dict)
+
+    def solve(self, DepartmentsAlpha, DepartmentsBeta, data_dict=None, output="", start=None):
+        """
+        Solves the second stage with the widths and heights of data_dict (of the model if None) and returns the LayoutResult, see second_stage.
+        """
+
+        w, h, w_F, h_F = self.w, self.h, self.w_F, self.h_F
+        if data_dict is not None:
+            Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+            w = Departments["w"].to_numpy(dtype=float)
+            h = Departments["h"].to_numpy(dtype=float)
+            w_F = float(Facility.iloc[0]['w'])
+            h_F = float(Facility.iloc[0]['h'])
+
+        if self.rotations == "pattern":
+            r, _, r_F, _ = second_stage_pattern_rotations(DepartmentsAlpha, DepartmentsBeta, self.w, self.h, self.w_F, self.h_F, *self.bounds)
+            w_pattern, h_pattern = r*self.w + (1-r)*self.h, (1-r)*self.w + r*self.h
+            w_F_pattern, h_F_pattern = r_F*self.w_F + (1-r_F)*self.h_F, (1-r_F)*self.w_F + r_F*self.h_F
+            if relation_graph_longest_path(DepartmentsAlpha, w_pattern) <= w_F_pattern and relation_graph_longest_path(DepartmentsBeta, h_pattern) <= h_F_pattern:
+                w, h, w_F, h_F = w_pattern, h_pattern, w_F_pattern, h_F_pattern
+
+        # Non-overlap constraints for the edges of the transitive reduction of the left-of and below graphs, see SecondStageModel.second_stage
+        # The network simplex does not terminate reliably if the linear program is infeasible, i.e., if a cycle of the flow network has
+        # negative cost and infinite capacity. This is the case exactly if a path of the left-of (below) graph is wider (higher) than the facility.
+        if relation_graph_longest_path(DepartmentsAlpha, w) > w_F or relation_graph_longest_path(DepartmentsBeta, h) > h_F:
+            raise ValueError('Model is infeasible.')
+        left_I, left_J = relation_graph_reduction(DepartmentsAlpha)
+        below_I, below_J = relation_graph_reduction(DepartmentsBeta)
+
+        axes = [(w, w_F, self.I, self.J, self.c_pairs, left_I, left_J), (h, h_F, self.I, self.J, self.c_pairs, below_I, below_J)]
+        if self.workers > 1:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=2)
+            ansX, ansY = self.executor.map(second_stage_flow_axis, *zip(*axes))
+        else:
+            ansX, ansY = map(second_stage_flow_axis, *zip(*axes))
+
+        obj_val = float(np.sum(self.c_pairs * (np.abs(ansX[self.I] - ansX[self.J]) + np.abs(ansY[self.I] - ansY[self.J]))))
+
+        return LayoutResult(ansX, ansY, w, h, w_F, h_F, obj_val)
+
+    def close(self):
+        """Shuts down the processes of the axes, if workers=2. The model can still be used afterwards and then starts them again."""
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def second_stage_flow_axis(size, size_F, I, J, c_pairs, before_I, before_J):
+    """
+    Solves the placement along one axis for fixed sizes as the dual of a minimum cost flow problem:
+        min sum(c_pairs * |x_I - x_J|)  s.t.  x_j - x_i >= (size_i + size_j)/2 for (i,j) in zip(before_I, before_J),  |x_i| <= (size_F - size_i)/2
+    Every constraint x_v - x_u >= g is an uncapacitated arc u -> v with cost -g, every pair an arc in both directions with capacity c and cost 0.
+    The bounds are constraints with the reference node n, whose coordinate is 0. The optimal coordinates are the negative shortest path distances
+    from node n in the residual network of an optimal flow. The costs are scaled to integers, since the network simplex of networkx needs them.
+        Input:
+            - size: sizes of the departments along the axis (widths for x, heights for y)
+            - size_F: size of the facility along the axis
+            - I, J, c_pairs: pairs of departments with transport costs
+            - before_I, before_J: department before_I[k] has to be before (left of, below) department before_J[k]
+        Output:
+            - x: coordinates of the departments
+    """
+
+    n = len(size)
+    origin = n
+
+    # Scale the gaps (half sizes) to integers; sizes of the Excel files are integers, so usually the scale is 2
+    scale = 2 * (second_stage_flow_integer_scale(np.append(size, size_F)) or 10**6)
+    # Scale the capacities to integers, too, exactly if the transport costs have at most 6 decimals, otherwise with 7 significant digits of the smallest cost.
+    # Dividing by their greatest common divisor does not change the optimal flow.
+    if len(c_pairs):
+        cost_scale = second_stage_flow_integer_scale(c_pairs) or 10.0**(6 - np.floor(np.log10(np.min(c_pairs))))
+        capacity = [int(cap) for cap in np.round(c_pairs * cost_scale)]
+        divisor = math.gcd(*capacity)
+        capacity = [cap // divisor for cap in capacity]
+    else:
+        capacity = []
+
+    G = nx.MultiDiGraph()
+    G.add_nodes_from(range(n+1))
+    # inside the facility: x_i - x_0 >= (size_i - size_F)/2 and x_0 - x_i >= (size_i - size_F)/2
+    inside = np.round((size - size_F) / 2 * scale).astype(np.int64)
+    G.add_edges_from((origin, i, {"weight": -int(inside[i])}) for i in range(n))
+    G.add_edges_from((i, origin, {"weight": -int(inside[i])}) for i in range(n))
+    # non-overlap
+    gap = np.round((size[before_I] + size[before_J]) / 2 * scale).astype(np.int64)
+    G.add_edges_from((int(i), int(j), {"weight": -int(g)}) for i, j, g in zip(before_I, before_J, gap))
+    # transport costs
+    G.add_edges_from((int(i), int(j), {"weight": 0, "capacity": int(cap)}) for i, j, cap in zip(I, J, capacity))
+    G.add_edges_from((int(j), int(i), {"weight": 0, "capacity": int(cap)}) for i, j, cap in zip(I, J, capacity))
+
+    _, flow = nx.network_simplex(G)
+
+    # Residual network of the optimal flow, keeping the cheapest arc between two nodes
+    R = nx.DiGraph()
+    R.add_nodes_from(range(n+1))
+    for u, v, key, data in G.edges(keys=True, data=True):
+        f = flow[u][v][key]
+        arcs = []
+        if f < data.get("capacity", np.inf):
+            arcs.append((u, v, data["weight"]))
+        if f > 0:
+            arcs.append((v, u, -data["weight"]))
+        for a, b, weight in arcs:
+            if not R.has_edge(a, b) or R[a][b]["weight"] > weight:
+                R.add_edge(a, b, weight=weight)
+
+    distance = nx.single_source_bellman_ford_path_length(R, origin)
+    x = -np.array([distance[i] for i in range(n)], dtype=float) / scale
+
+    return x
+
+def second_stage_flow_integer_scale(values, max_decimals=6):
+    """Smallest power of ten 10^d with d <= max_decimals that makes all values integers (up to rounding errors), None if there is none."""
+
+    values = np.asarray(values, dtype=float)
+    for decimals in range(max_decimals + 1):
+        scaled = values * 10**decimals
+        if np.allclose(scaled, np.round(scaled), rtol=0, atol=1e-6):
+            return 10**decimals
+
+    return None
@@ -0,0 +1,103 @@
+import numpy as np
+from import_data import unpack_data_dict
+from problem_instance import LayoutResult
+from relation_graph import relation_graph_reduction
+from milp_model import milp_layout_model, milp_layout_non_overlap
+from second_stage_presolve import second_stage_presolve, second_stage_pattern_rotations
+
+class SecondStageHighs:
+    """
+    Same as SecondStageModel, but solved with the open source solver HiGHS (through scipy.optimize.milp) instead of Gurobi.
+    HiGHS needs no license, so there is no limit on the model size or on the number of solves running at the same time.
+    scipy.optimize.milp neither writes log files nor accepts a MIP start, so output and start are ignored.
+    The rotations are presolved and chosen from the relative positions with rotations="pattern" as in SecondStageModel.
+    Usage:
+        model = SecondStageHighs(data_dict)
+        result = model.solve(DepartmentsAlpha, DepartmentsBeta)
+        DepartmentsXY, data_dict, obj_val = model.second_stage(DepartmentsAlpha, DepartmentsBeta, data_dict)
+    """
+
+    def __init__(self, data_dict, output="", rotations="free"):
+
+        Departments, Facility, DepartmentsDependencies = unpack_data_dict(data_dict)
+
+        n = len(Departments)   #number of departments
+        w = Departments["w"].to_numpy(dtype=float)
+        h = Departments["h"].to_numpy(dtype=float)
+        w_F = float(Facility.iloc[0]['w'])
+        h_F = float(Facility.iloc[0]['h'])
+
+        # Distance variables only for the pairs i<j with positive transport cost, as in SecondStageModel
+        I, J = np.triu_indices(n, k=1)
+        c_pairs = np.asarray(DepartmentsDependencies, dtype=float)[I, J]
+        I, J, c_pairs = I[c_pairs > 0], J[c_pairs > 0], c_pairs[c_pairs > 0]
+
+        self.model, self.variables = milp_layout_model(w, h, w_F, h_F, I, J, c_pairs)
+
+        # Presolve of the rotations, see SecondStageModel
+        r_lb, r_ub, r_F_lb, r_F_ub, link = second_stage_presolve(w, h, w_F, h_F)
+        r, r_F = self.variables["r"], self.variables["r_F"]
+        for sign, rhs in ((1, 0), (-1, 1)):
+            linked = np.flatnonzero(link == sign)
+            if len(linked):
+                # r[i] - sign * r_F = rhs
+                self.model.add_constraints([(r[linked], np.identity(len(linked))), (r_F, -sign * np.ones((len(linked), 1)))], rhs, rhs)
+        self.n = n
+        self.w = w
+        self.h = h
+        self.w_F = w_F
+        self.h_F = h_F
+        self.bounds = (r_lb, r_ub, r_F_lb, r_F_ub)
+        self.rotations = rotations
+
+    def second_stage(self, DepartmentsAlpha, DepartmentsBeta, data_dict, output="", start=None):
+        """
+        Solves the second stage for the relative positions DepartmentsAlpha and DepartmentsBeta, see SecondStageModel.second_stage.
+        """
+
+        return self.solve(DepartmentsAlpha, DepartmentsBeta, data_dict, output=output, start=start).solution(data_dict)
+
+    def solve(self, DepartmentsAlpha, DepartmentsBeta, data_dict=None, output="", start=None):
+        """
+        Solves the second stage for the relative positions DepartmentsAlpha and DepartmentsBeta and returns the LayoutResult, see SecondStageModel.solve.
+        """
+
+        n = self.n
+        w = self.w
+        h = self.h
+        variables = self.variables
+
+        #non-overlap constraints for the edges of the transitive reduction of the left-of and below graphs, see SecondStageModel.second_stage
+        left_I, left_J = relation_graph_reduction(DepartmentsAlpha, fallback=True)
+        below_I, below_J = relation_graph_reduction(DepartmentsBeta, fallback=True)
+        milp_layout_non_overlap(self.model, variables, w, h, left_I, left_J, "x", name="constr8")
+        milp_layout_non_overlap(self.model, variables, w, h, below_I, below_J, "y", name="constr9")
+
+        # With rotations="pattern", first the linear program with the rotations of the relative positions, see SecondStageModel.second_stage
+        attempts = [self.bounds]
+        if self.rotations == "pattern":
+            attempts.insert(0, second_stage_pattern_rotations(DepartmentsAlpha, DepartmentsBeta, w, h, self.w_F, self.h_F, *self.bounds))
+        for r_lb, r_ub, r_F_lb, r_F_ub in attempts:
+            self.model.set_bounds(variables["r"], r_lb, r_ub)
+            self.model.set_bounds(variables["r_F"], r_F_lb, r_F_ub)
+
+            #Optimizing
+            result = self.model.solve()
+            if result.status == 0:
+                break
+
+        # Raise error if model is infeasible
+        if result.status == 2:
+            raise ValueError('Model is infeasible.')
+        elif result.status != 0:
+            raise ValueError('Model does not have an optimal value.')
+
+        w_F = self.w_F
+        h_F = self.h_F
+
+        ansr = np.round(result.x[variables["r"]])
+        ansr_F = np.round(result.x[variables["r_F"]][0])
+
+        # new widh and hight for departments and facility as rotations might occur
+        return LayoutResult(result.x[variables["x"]], result.x[variables["y"]], (ansr*w) + (1-ansr)*h, (1-ansr)*w + ansr*h,
+                            (ansr_F*w_F) + (1-ansr_F)*h_F, (1-ansr_F)*w_F + ansr_F*h_F, result.fun)
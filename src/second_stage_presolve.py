@@ -0,0 +1,79 @@
+import numpy as np
+from relation_graph import relation_graph_path_lengths
+
+def second_stage_presolve(w, h, w_F, h_F):
+    """
+    Presolve of the rotation variables of the second stage (r = 1: not rotated, r = 0: rotated by 90°, r_F the same for the facility).
+    Rotating a square department or a square facility changes nothing, so their rotation is fixed to 1.
+    If an orientation of a department only fits into one facility orientation (e.g. a long department into a narrow facility), the rotation of the
+    department is linked to the one of the facility. A department orientation that fits into neither facility orientation is fixed to the other orientation,
+    which can only happen together with the facility being fixed or the instance being infeasible.
+        Input:
+            - w, h: widths and heights of the departments
+            - w_F, h_F: width and height of the facility
+        Output:
+            - r_lb, r_ub: bounds of r
+            - r_F_lb, r_F_ub: bounds of r_F
+            - link: 1 if r = r_F, -1 if r = 1 - r_F, 0 otherwise
+    """
+
+    w = np.asarray(w, dtype=float)
+    h = np.asarray(h, dtype=float)
+    n = len(w)
+    r_lb = np.zeros(n)
+    r_ub = np.ones(n)
+    r_F_lb = 1.0 if w_F == h_F else 0.0
+    r_F_ub = 1.0
+    link = np.zeros(n, dtype=int)
+
+    # fits[r, r_F]: department in orientation r fits into the facility in orientation r_F
+    fits = np.zeros((2, 2, n), dtype=bool)
+    for r in (0, 1):
+        w_hat, h_hat = (w, h) if r == 1 else (h, w)
+        for r_F in (0, 1):
+            w_F_hat, h_F_hat = (w_F, h_F) if r_F == 1 else (h_F, w_F)
+            fits[r, r_F] = (w_hat <= w_F_hat) & (h_hat <= h_F_hat)
+    if r_F_lb == 1:
+        fits[:, 0] = False
+
+    square = w == h
+    r_lb[square] = 1
+    r_lb[~square & ~fits[0].any(axis=0)] = 1
+    r_ub[~square & ~fits[1].any(axis=0)] = 0
+
+    # Only one orientation per facility orientation fits, and the other one for the other facility orientation
+    free = ~square & (r_lb == 0) & (r_ub == 1) & (r_F_lb == 0)
+    link[free & fits[1, 1] & fits[0, 0] & ~fits[1, 0] & ~fits[0, 1]] = 1
+    link[free & fits[1, 0] & fits[0, 1] & ~fits[1, 1] & ~fits[0, 0]] = -1
+
+    return r_lb, r_ub, r_F_lb, r_F_ub, link
+
+def second_stage_pattern_rotations(DepartmentsAlpha, DepartmentsBeta, w, h, w_F, h_F, r_lb, r_ub, r_F_lb, r_F_ub):
+    """
+    Chooses the rotations of the departments and the facility from the relative positions, so that the second stage becomes a linear program.
+    A department lies on paths of departments next to each other (left-of graph) and on top of each other (below graph). The heaviest of these paths
+    through the department, counting every department with the smaller of its width and height, is compared to the facility width (height).
+    The short side of a department is turned in the direction in which this ratio is higher, i.e., in which space is scarcer.
+    The facility is turned such that the heaviest paths of both graphs fit best. The bounds of second_stage_presolve are respected.
+        Output:
+            - r_lb, r_ub, r_F_lb, r_F_ub: bounds of the rotation variables, which fix all of them
+    """
+
+    w = np.asarray(w, dtype=float)
+    h = np.asarray(h, dtype=float)
+    weights = np.minimum(w, h)
+    through_x = relation_graph_path_lengths(DepartmentsAlpha, weights)
+    through_y = relation_graph_path_lengths(DepartmentsBeta, weights)
+
+    if r_F_lb == r_F_ub:
+        r_F = r_F_lb
+    else:
+        r_F = 1.0 if max(through_x.max(initial=0) / w_F, through_y.max(initial=0) / h_F) <= max(through_x.max(initial=0) / h_F, through_y.max(initial=0) / w_F) else 0.0
+    w_F_hat, h_F_hat = (w_F, h_F) if r_F == 1 else (h_F, w_F)
+
+    # short side in x-direction if x is scarcer: r = 1 if w is the short side
+    short_x = through_x / w_F_hat >= through_y / h_F_hat
+    r = np.where(short_x, w <= h, w >= h).astype(float)
+    r = np.clip(r, r_lb, r_ub)
+
+    return r, r.copy(), r_F, r_F
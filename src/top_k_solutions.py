@@ -0,0 +1,55 @@
+import heapq
+
+
+class TopKSolutions:
+    """
+    Bounded store of the k best solutions of the iterations of main_function. Instead of keeping every iteration in lists, the solutions are kept
+    in a heap whose root is the worst stored solution, so a new solution only replaces it if it is better, in O(log k).
+    Solutions are compared by their cost (objective value) or their area, see Min of main_function. For equal values the earlier iteration is better.
+    Usage:
+        store = TopKSolutions(k=5, Min="cost")
+        improved = store.add(i, obj_val, area, solution)  # True if solution is the new best one
+        i, obj_val, area, solution = store.best()
+        for i, obj_val, area, solution in store.sorted(): ...
+    """
+
+    def __init__(self, k=1, Min="cost"):
+        self.k = k
+        self.Min = Min
+        self.heap = []  # (-value, -i, obj_val, area, solution), the root is the worst stored solution
+        self.best_entry = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def add(self, i, obj_val, area, solution):
+        """Stores the solution of iteration i if it is among the k best so far. Returns True if it is the best one so far."""
+
+        value = obj_val if self.Min == "cost" else area
+        entry = (-value, -i, obj_val, area, solution)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+        else:
+            return False
+
+        improved = self.best_entry is None or entry[:2] > self.best_entry[:2]
+        if improved:
+            self.best_entry = entry
+
+        return improved
+
+    def best(self):
+        """(i, obj_val, area, solution) of the best solution, None if no solution was added."""
+
+        if self.best_entry is None:
+            return None
+        _, i, obj_val, area, solution = self.best_entry
+
+        return -i, obj_val, area, solution
+
+    def sorted(self):
+        """List of (i, obj_val, area, solution) of the stored solutions, the best first."""
+
+        return [(-i, obj_val, area, solution) for _, i, obj_val, area, solution in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
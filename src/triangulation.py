@@ -1,11 +1,17 @@
 #from facility_layout.first_model.main import DepartmentsAlpha
 import numpy as np
 
+# Relative positions of all pairs i<j (in the order of np.triu_indices) can be stored compactly as one int8 code per pair:
+LEFT = 0  # i left of j, alpha[i,j] = 1
+RIGHT = 1  # i right of j, alpha[j,i] = 1
+BELOW = 2  # i below j, beta[i,j] = 1
+ABOVE = 3  # i above j, beta[j,i] = 1
+
 def triangulation(DepartmentsXYrelative):
     """ Calculates Alpha and Beta matrices to determine the relative postions. The input is the output of the first stage.
     """
 
-    # input: Dataframe 
+    # input: Dataframe
     #   +---+----------+----+----+
     #   |   |   name   |  x |  y |
     #   +---+----------+----+----+
@@ -15,38 +21,54 @@ def triangulation(DepartmentsXYrelative):
     #   +---+----------+----+----+
     # output: two 2-dim arrays with values for alpha_ij and ß_ij
 
+    relations = triangulation_relations(DepartmentsXYrelative)
+
+    return unpack_relations(relations, DepartmentsXYrelative.shape[0])
+
+def triangulation_relations(DepartmentsXYrelative):
+    """ Calculates the relative positions of triangulation as packed relation codes, see pack_relations.
+    Between two departments, only the bigger distance of left/right or below/above is considered.
+    """
+
     # get number of departments
     num_departments = DepartmentsXYrelative.shape[0]
+    x = DepartmentsXYrelative["x"].to_numpy(dtype=float)
+    y = DepartmentsXYrelative["y"].to_numpy(dtype=float)
+
+    i, j = np.triu_indices(num_departments, k=1)
+    dx = x[i] - x[j]
+    dy = y[i] - y[j]
+
+    relations = np.where(np.abs(dx) >= np.abs(dy),
+                         np.where(dx >= 0, RIGHT, LEFT),
+                         np.where(dy >= 0, ABOVE, BELOW)).astype(np.int8)
+
+    return relations
+
+def unpack_relations(relations, n):
+    """ Expands packed relation codes of length n(n-1)/2 to the n x n matrices DepartmentsAlpha and DepartmentsBeta.
+    """
+
+    i, j = np.triu_indices(n, k=1)
+    DepartmentsAlpha = np.zeros((n,n))
+    DepartmentsBeta = np.zeros((n,n))
+    DepartmentsAlpha[i[relations == LEFT], j[relations == LEFT]] = 1
+    DepartmentsAlpha[j[relations == RIGHT], i[relations == RIGHT]] = 1
+    DepartmentsBeta[i[relations == BELOW], j[relations == BELOW]] = 1
+    DepartmentsBeta[j[relations == ABOVE], i[relations == ABOVE]] = 1
+
+    return DepartmentsAlpha, DepartmentsBeta
+
+def pack_relations(DepartmentsAlpha, DepartmentsBeta):
+    """ Packs the matrices DepartmentsAlpha and DepartmentsBeta into an int8 array with one code LEFT, RIGHT, BELOW or ABOVE per pair i<j,
+    in the order of np.triu_indices. Needs 1/16 of the memory of one of the matrices and can be compared and hashed cheaply.
+    Every pair must have exactly one relation.
+    """
+
+    n = len(DepartmentsAlpha)
+    i, j = np.triu_indices(n, k=1)
+    codes = np.stack((DepartmentsAlpha[i,j], DepartmentsAlpha[j,i], DepartmentsBeta[i,j], DepartmentsBeta[j,i]))
+    if not np.all(np.sum(codes != 0, axis=0) == 1):
+        raise ValueError("Every pair of departments must have exactly one relative position.")
 
-    DepartmentsAlpha = np.zeros((num_departments,num_departments))
-    DepartmentsBeta = np.zeros((num_departments,num_departments))
-
-    # transform DepartmentsXYrelative to numpy 
-    DepartmentsXYrelative = DepartmentsXYrelative.to_numpy()
-    # form x coordinates
-    x = DepartmentsXYrelative[:,1]
-    # form y coordinates
-    y = DepartmentsXYrelative[:,2]
-
-    for i in range(num_departments):
-        for j in range(i+1,num_departments):
-            if abs(x[i]-x[j]) >= abs(y[i]-y[j]):
-                if x[i] >= x[j]:
-                    # i right of j
-                    DepartmentsAlpha[i,j] = 0
-                    DepartmentsAlpha[j,i] = 1
-                else:
-                    # i left of j
-                    DepartmentsAlpha[i,j] = 1
-                    DepartmentsAlpha[j,i] = 0
-            elif y[i] >= y[j]:
-                # i above j
-                DepartmentsBeta[i,j] = 0
-                DepartmentsBeta[j,i] = 1
-            else:
-                # i below j
-                DepartmentsBeta[i,j] = 1
-                DepartmentsBeta[j,i] = 0
-
-
-    return DepartmentsAlpha, DepartmentsBeta
\ No newline at end of file
+    return np.argmax(codes != 0, axis=0).astype(np.int8)
@@ -0,0 +1,45 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from first_stage_nonlinear import first_stage_nonlinear_objective_gradient_function
+
+
+def random_instance(seed, n, clustered):
+    """Random departments, sparse transport costs and positions that are either uniform or clustered around a dense core."""
+
+    rng = np.random.default_rng(seed)
+    w = rng.uniform(1, 10, n)
+    h = rng.uniform(1, 10, n)
+    c = np.triu(rng.random((n, n)) < 5/n, 1) * rng.uniform(1, 10, (n, n))
+    if clustered:
+        positions = np.concatenate((rng.normal(0, 50, n) * np.where(rng.random(n) < 0.3, 0.1, 1), rng.normal(0, 50, n)))
+    else:
+        positions = rng.uniform(-300, 300, 2*n)
+
+    return w, h, c, positions
+
+
+@pytest.mark.parametrize("clustered", [False, True], ids=["uniform", "clustered"])
+@pytest.mark.parametrize("accuracy, tolerance", [(0.5, 1e-5), (0.2, 1e-6)])
+def test_approximate_repulsion(clustered, accuracy, tolerance):
+    w, h, c, positions = random_instance(0, 1500, clustered)
+
+    function_value, gradient = first_stage_nonlinear_objective_gradient_function(w, h, c, 0.5, repulsion="exact")(positions)
+    function_value_approx, gradient_approx = first_stage_nonlinear_objective_gradient_function(w, h, c, 0.5, repulsion="approximate", repulsion_accuracy=accuracy)(positions)
+
+    assert function_value_approx == pytest.approx(function_value, rel=100*tolerance)
+    assert np.linalg.norm(gradient_approx - gradient) <= tolerance * np.linalg.norm(gradient)
+
+def test_approximate_repulsion_small_instance():
+    # All departments of a small instance are in the neighbourhood of the root cells, so the repulsion is exact
+    w, h, c, positions = random_instance(1, 100, True)
+
+    function_value, gradient = first_stage_nonlinear_objective_gradient_function(w, h, c, 0.5, repulsion="exact")(positions)
+    function_value_approx, gradient_approx = first_stage_nonlinear_objective_gradient_function(w, h, c, 0.5, repulsion="approximate")(positions)
+
+    assert function_value_approx == pytest.approx(function_value, rel=1e-9)
+    assert np.allclose(gradient_approx, gradient, rtol=1e-9, atol=1e-9 * np.max(np.abs(gradient)))
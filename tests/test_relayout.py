@@ -0,0 +1,78 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from problem_instance import ProblemInstance
+from heuristic_lns import heuristic_lns_repair
+from relayout import relayout
+
+
+def base_solution():
+    """Solution of a small instance with 8 departments in the format of main_function, solved with the full model of heuristic_lns_repair."""
+
+    rng = np.random.default_rng(7)
+    names = ["mill", "warehouse", "storage", "turning", "assembly", "paint", "shipping", "office"]
+    n = len(names)
+    w = rng.integers(2, 7, n).astype(float) * 500
+    h = rng.integers(2, 7, n).astype(float) * 500
+    c = np.triu(rng.integers(0, 100, (n, n)) * (rng.random((n, n)) < 0.5), 1).astype(float)
+    data_dict = {
+        "Departments": pd.DataFrame({"name": names, "w": w, "h": h, "group": np.full(n, np.nan)}),
+        "Facility": pd.DataFrame({"name": ["Facility"], "w": [9000.0], "h": [7000.0]}),
+        "DepartmentsDependencies": c,
+    }
+
+    result, DepartmentsAlpha, DepartmentsBeta = heuristic_lns_repair(ProblemInstance.from_data_dict(data_dict), np.zeros((n, n)), np.zeros((n, n)), 5, np.arange(n))
+    DepartmentsXYoptimal, data_dict, obj_val = result.solution(data_dict)
+
+    return {
+        "data_dict": data_dict,
+        "DepartmentsXYrelative": DepartmentsXYoptimal.copy(),
+        "DepartmentsAlpha": DepartmentsAlpha,
+        "DepartmentsBeta": DepartmentsBeta,
+        "DepartmentsXYoptimal": DepartmentsXYoptimal,
+        "obj_val": obj_val,
+        "rotated": result.w != w,
+    }
+
+def assert_valid_layout(solution):
+    """The departments of solution lie inside the facility and do not overlap."""
+
+    Departments = solution["data_dict"]["Departments"]
+    Facility = solution["data_dict"]["Facility"]
+    x = solution["DepartmentsXYoptimal"]["x"].to_numpy(dtype=float)
+    y = solution["DepartmentsXYoptimal"]["y"].to_numpy(dtype=float)
+    w = Departments["w"].to_numpy(dtype=float)
+    h = Departments["h"].to_numpy(dtype=float)
+    tolerance = 1e-6 * max(float(Facility.iloc[0]["w"]), float(Facility.iloc[0]["h"]))
+
+    assert np.all(np.abs(x) + w/2 <= float(Facility.iloc[0]["w"])/2 + tolerance)
+    assert np.all(np.abs(y) + h/2 <= float(Facility.iloc[0]["h"])/2 + tolerance)
+    I, J = np.triu_indices(len(x), k=1)
+    overlap_x = np.abs(x[I] - x[J]) < (w[I] + w[J])/2 - tolerance
+    overlap_y = np.abs(y[I] - y[J]) < (h[I] + h[J])/2 - tolerance
+    assert not np.any(overlap_x & overlap_y)
+
+
+@pytest.fixture(scope="module")
+def solution():
+    return base_solution()
+
+@pytest.mark.parametrize("delta", [
+    {"resize": {"mill": (2500.0, 1500.0)}},
+    {"add": {"NEW": (100.0, 100.0)}, "flows": {("NEW", "storage"): 300.0}},
+    {"remove": ["warehouse"]},
+    {"flows": {("turning", "office"): 500.0, ("mill", "paint"): 200.0}},
+], ids=["resize", "add", "remove", "flows"])
+def test_relayout(solution, delta, tmp_path):
+    assert_valid_layout(solution)
+    new_solution = relayout(solution, delta, Solver="highs", dir=str(tmp_path) + "/")
+
+    names = new_solution["data_dict"]["Departments"]["name"].tolist()
+    assert all(name in names for name in delta.get("add", {}))
+    assert not any(name in names for name in delta.get("remove", []))
+    assert_valid_layout(new_solution)
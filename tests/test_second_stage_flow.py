@@ -0,0 +1,55 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from triangulation import triangulation
+from second_stage import SecondStageModel
+from second_stage_highs import SecondStageHighs
+from second_stage_flow import SecondStageFlow
+
+
+def square_instance(seed, n=8, cost_ratio=100):
+    """
+    Random instance with square departments and a square facility, so rotations do not matter and the minimum cost flows of SecondStageFlow
+    solve the same problem as the MIPs. The transport costs are between 1 and cost_ratio.
+    Returns data_dict and the relative positions of the triangulation of random coordinates.
+    """
+
+    rng = np.random.default_rng(seed)
+    size = rng.integers(1, 6, n).astype(float)
+    c = np.triu(np.exp(rng.uniform(0, np.log(cost_ratio), (n, n))).round() * (rng.random((n, n)) < 0.6), 1)
+    side = 2 * np.sum(size)
+    data_dict = {
+        "Departments": pd.DataFrame({"name": [f"D{i}" for i in range(n)], "w": size, "h": size, "group": np.full(n, np.nan)}),
+        "Facility": pd.DataFrame({"name": ["Facility"], "w": [side], "h": [side]}),
+        "DepartmentsDependencies": c,
+    }
+    DepartmentsAlpha, DepartmentsBeta = triangulation(pd.DataFrame({"name": data_dict["Departments"]["name"], "x": rng.random(n), "y": rng.random(n)}))
+
+    return data_dict, DepartmentsAlpha, DepartmentsBeta
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_flow_matches_mip(seed, tmp_path):
+    data_dict, DepartmentsAlpha, DepartmentsBeta = square_instance(seed)
+
+    obj_val_flow = SecondStageFlow(data_dict, workers=1).solve(DepartmentsAlpha, DepartmentsBeta).obj_val
+    obj_val_highs = SecondStageHighs(data_dict).solve(DepartmentsAlpha, DepartmentsBeta).obj_val
+    obj_val_gurobi = SecondStageModel(data_dict, output=str(tmp_path / "gurobi.log")).solve(DepartmentsAlpha, DepartmentsBeta, output=str(tmp_path / "gurobi.log")).obj_val
+
+    assert obj_val_flow == pytest.approx(obj_val_highs, rel=1e-9)
+    assert obj_val_flow == pytest.approx(obj_val_gurobi, rel=1e-9)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_flow_wide_cost_ratio(seed):
+    # Transport costs between 1 and 1e9 must not be distorted by the integer capacities of the flow network
+    data_dict, DepartmentsAlpha, DepartmentsBeta = square_instance(seed, cost_ratio=1e9)
+
+    obj_val_flow = SecondStageFlow(data_dict, workers=1).solve(DepartmentsAlpha, DepartmentsBeta).obj_val
+    obj_val_highs = SecondStageHighs(data_dict).solve(DepartmentsAlpha, DepartmentsBeta).obj_val
+
+    assert obj_val_flow == pytest.approx(obj_val_highs, rel=1e-9)